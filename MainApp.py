@@ -11,6 +11,7 @@ from PyQt6.QtWidgets import (
 )
 
 import database
+import db_async
 import auth_database as adb
 from login import User, LoginWindow
 
@@ -20,6 +21,9 @@ from backend_worker import BackendWorker
 from alert_system import AlertSystem
 from serial_monitor import Monitor
 from simulating_nodes import Simulate  # for debugging only
+from maintenance import MaintenanceScheduler
+from ingest import GroupCommitWriter
+from db_journal import PacketJournal
 from settings import SettingsPage
 from history_log import HistoryLogPage
 
@@ -299,8 +303,15 @@ class MainWindow(QMainWindow):
 
         self.port = "COM7"
         self.hrs = 48
-        monitor = Simulate(self.port, self.hrs)
+        # one DB writer thread behind a bounded queue for every packet reader;
+        # under overload the newest row per node wins and SOS rows are kept.
+        # Packets are journaled first and replayed on the next start if the
+        # app dies before they are committed.
+        self.writer = GroupCommitWriter(policy="coalesce", journal=PacketJournal()).start()
+        monitor = Simulate(self.port, self.hrs, writer=self.writer)
         monitor.start()
+        # retention, vacuum, ANALYZE and WAL checkpoints off the ingest path
+        self.maintenance = MaintenanceScheduler(retention_hrs=self.hrs, writer=self.writer).start()
 
         self.setStyleSheet("QMainWindow { background-color: #060a13; }")
 
@@ -627,6 +638,11 @@ class MainWindow(QMainWindow):
                 self.backend.wait(2000)
             except Exception:
                 pass
+        if hasattr(self, "maintenance"):
+            self.maintenance.stop()
+        if hasattr(self, "writer"):
+            self.writer.stop()
+        db_async.shutdown()
         super().closeEvent(event)
 
     def open_node_on_map(self, node_id):
@@ -635,17 +651,18 @@ class MainWindow(QMainWindow):
         self.map_widget.center_on_node(node_id)
 
     def update_notif_badge(self):
-        try:
-            rows = database.get_unread_notifs()
-            count = len(rows) if rows else 0
-            btn = self.sidebar_buttons.get("btnNotifications")
-            if btn:
-                try:
-                    btn.set_badge(count)
-                except Exception:
-                    pass
-        except Exception:
-            pass
+        # O(1): trigger-maintained counter, no row fetch; counted on a reader
+        # thread (db_async), and a count still in flight is shared
+        db_async.submit(database.get_unread_count, username=self.user.username).then(
+            self._set_notif_badge, lambda exc: None)
+
+    def _set_notif_badge(self, count):
+        btn = self.sidebar_buttons.get("btnNotifications")
+        if btn:
+            try:
+                btn.set_badge(count)
+            except Exception:
+                pass
 
 
 # ═══════════════════════════════════════════════════════
@@ -682,7 +699,7 @@ if __name__ == "__main__":
                     try:
                         main_window.map_widget.user = main_window.user
                         
-                        main_window.map_widget.update_map()
+                        main_window.map_widget.refresh_if_changed()
                     except Exception:
                         pass
                     try:
@@ -1,10 +1,12 @@
 # alert_system.py
 from PyQt6.QtCore import QObject, pyqtSignal
 from PyQt6.QtWidgets import QMessageBox
+import database
 from login import User
 
 class AlertSystem(QObject):
     viewNodeRequested = pyqtSignal(int)   # node_id
+    NEARBY_RADIUS_M = 500
 
     def __init__(self, parent=None, user:User=None):
         super().__init__(parent)
@@ -16,7 +18,7 @@ class AlertSystem(QObject):
         msg.setWindowTitle("Node Alert")
         msg.setIcon(QMessageBox.Icon.Warning)
         msg.setText(f"Node {notification[1]} ALERT")
-        msg.setInformativeText(notification[4])
+        msg.setInformativeText(notification[4] + self.nearby_text(notification))
 
         view_btn = None
 
@@ -36,6 +38,22 @@ class AlertSystem(QObject):
             print("View on Map clicked for node", notification[1])
             self.viewNodeRequested.emit(notification[1])
 
+    def nearby_text(self, notification) -> str:
+        # other viewable nodes close to an SOS, nearest first (R*Tree query)
+        node = notification[1]
+        if notification[2] != "SOS" or node not in self.user.viewable_nodes:
+            return ""
+        # position the alert was raised at; older tuple-only notifications fall back to the latest fix
+        lat, lon = getattr(notification, "lat", None), getattr(notification, "lon", None)
+        gps = (lat, lon) if lat is not None and lon is not None else database.get_GPS(node)
+        if not gps:
+            return ""
+        nearby = [f"{n} ({d:.0f} m)" for n, d in database.get_nodes_within(gps[0], gps[1], self.NEARBY_RADIUS_M)
+                  if n != node and n in self.user.viewable_nodes]
+        if not nearby:
+            return ""
+        return f"\nNodes within {self.NEARBY_RADIUS_M} m: {', '.join(nearby)}"
+
     def show_login_alert(self, notification):
         msg = QMessageBox(self.parent)
         msg.setWindowTitle(notification[0])
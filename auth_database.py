@@ -1,10 +1,11 @@
 """
 auth_database.py
 ────────────────
-SQLite-backed authentication store.  Lives inside nodes.db alongside
-the existing nodes / notifications / users tables.
+SQLite-backed authentication store.  Lives in its own file next to the
+database of the configured storage backend (db_backend.py; nodes-auth.db
+by default, see db_files.py), so logins never wait on packet ingest.
 
-Tables (all created in nodes.db)
+Tables
 ------
   auth_users     – username (unique, case-insensitive), email (encrypted),
                    full_name (encrypted), password_hash (bcrypt), is_admin,
@@ -20,17 +21,17 @@ import sqlite3
 import os
 from datetime import datetime, timedelta, timezone
 
+import db_backend
+
 from auth_utils import (
     hash_password, verify_password,
     encrypt_field, decrypt_field,
     generate_reset_token, generate_invite_code,
 )
 
-DB_PATH = "nodes.db"
-
-
 def _conn():
-    return sqlite3.connect(DB_PATH)
+    # per-thread long-lived connection (WAL, busy_timeout) – see db_connection.py
+    return db_backend.get_backend().auth_connection()
  
 
 # ──────────────────────────────────────
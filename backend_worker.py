@@ -1,44 +1,70 @@
 # backend_worker.py
 from PyQt6.QtCore import QThread, pyqtSignal
 from login import User
+import notif_events
 
 class BackendWorker(QThread):
     # emits the notification tuple when one is created (optional)
     notification_signal = pyqtSignal(tuple)
+    # feed_cursors entry; the worker resumes from it after a restart
+    CURSOR = "backend_worker"
+    BATCH = 1000
+
     def __init__(self, user:User):
         super(QThread, self).__init__()
         self.user = user
 
     def run(self):
         import database, notification, system_notif
+        from db_connection import close_thread_connections
+
+        # node state as of the saved cursor, so packets that arrived while the
+        # app was closed still produce their notifications
+        cursor = database.get_cursor(self.CURSOR)
+        if cursor is None:
+            cursor = database.get_latest_seq()
+        state = {row[1]: row for row in database.get_db_at(cursor)}
 
-        old_data = database.get_db()
-        
         while not self.isInterruptionRequested():
-            data = database.get_db()
-            if old_data is not None and old_data != data:
-                notif = notification.create_notification(data, old_data)
-                if notif:
-                    # create_notification already adds the notif to DB
-                    # show system toast immediately
-                    for n in notif:
-                        # redact location only for nodes the user is NOT authorized to view
-                        print("User viewable nodes:", self.user.viewable_nodes)
-                        if n[1] in self.user.viewable_nodes:
-                            system_notif.new_notif(n[3], n[4], n[2])
-                            print("Backend notif:", n)
-
-                        elif n[2] == "SOS":
-                            n = self.redacted_notif(n)
-                            system_notif.new_notif(n[3], n[4], n[2])
-                            print("Backend notif (redacted):", n)
-                        self.notification_signal.emit(n)
-            old_data = data
-            self.msleep(1000)   # sleep 1s (keeps loop responsive to requestInterruption())
+            events = database.get_changes_since(cursor, self.BATCH, kinds=("node",))
+            # latest packet per node in this batch; late packets never replace newer state
+            changed = {}
+            for _, _, row in events:
+                known = changed.get(row[1]) or state.get(row[1])
+                if known is None or row[0] >= known[0]:
+                    changed[row[1]] = row
+            # nodes dropped by retention
+            gone = set(state) - set(database.get_nodes()) - set(changed)
+
+            notif = notification.create_notification(
+                list(changed.values()),
+                [state[n] for n in changed if n in state] + [state[n] for n in gone])
+            if notif:
+                # create_notification already adds the notif to DB
+                # show system toast immediately
+                for n in notif:
+                    # redact location only for nodes the user is NOT authorized to view
+                    print("User viewable nodes:", self.user.viewable_nodes)
+                    if n[1] in self.user.viewable_nodes:
+                        system_notif.new_notif(n[3], n[4], n[2])
+                        print("Backend notif:", n)
+
+                    elif n[2] == "SOS":
+                        n = self.redacted_notif(n)
+                        system_notif.new_notif(n[3], n[4], n[2])
+                        print("Backend notif (redacted):", n)
+                    self.notification_signal.emit(n)
+
+            state.update(changed)
+            for n in gone:
+                del state[n]
+            if events:
+                cursor = events[-1][0]
+                database.save_cursor(self.CURSOR, cursor)
+            if len(events) < self.BATCH:   # caught up
+                self.msleep(1000)   # sleep 1s (keeps loop responsive to requestInterruption())
+        close_thread_connections()
     
     def redacted_notif(self, notif:tuple) -> tuple:
         # Redact location info for unauthorized nodes; keep other details for alerting.
-        import re
-        pattern = r"(?<=Location: ).*"
-        redacted_message = re.sub(pattern, "(UNAUTHORIZED)", notif[4], flags=re.IGNORECASE)
-        return (notif[0], notif[1], notif[2], notif[3], redacted_message)
\ No newline at end of file
+        return notif_events.redact(notif)
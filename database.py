@@ -1,95 +1,105 @@
-import sqlite3
 from datetime import datetime
 
+import db_backend
+import db_partitions
+import notif_events
+from db_backend import encode_time, get_backend
+from notif_events import Event, Notif
+
 # data = [(time, node_id, latitude, longitude, status), ...]
 
-def init_db(db:str ="nodes.db"):
-    with sqlite3.connect(db) as conn:
-        cur = conn.cursor()
-        cur.execute(f'''CREATE TABLE IF NOT EXISTS nodes
-                (time TEXT,
-                node_id INTEGER,
-                latitude REAL,
-                longitude REAL,
-                status TEXT)''')
-        
-        
-def get_db(db:str = "nodes.db") -> list:
-    with sqlite3.connect(db) as conn:
-        cur = conn.cursor()
-        cur.execute(f"SELECT *, MAX(time) FROM nodes GROUP BY node_id")
-        data = cur.fetchall()
-    return data
-
-def add_to_db(vals:tuple, db:str = "nodes.db"):
-    if isinstance(vals, tuple) and list(map(type,vals)) == [str, int, float, float, str]:
+# Storage is pluggable (db_backend.py): every function below delegates to a
+# backend. `db` is None for the configured default (SAFETRACK_STORAGE /
+# SAFETRACK_DB, or db_backend.configure()), a backend object, or a SQLite
+# file path. The SQL lives in db_sqlite.py, the pure-Python store in db_memory.py.
+
+def init_db(db:str = None):
+    get_backend(db).init_db()
+
+def get_db(db:str = None) -> list:
+    # same shape as the old `SELECT *, MAX(time) ... GROUP BY node_id`:
+    # (time, node_id, latitude, longitude, status, max_time)
+    return [row + (row[0],) for row in get_backend(db).get_latest()]
+
+_ROW_TYPES = (str, int, float, float, str)
+
+def _valid_row(vals) -> bool:
+    return (isinstance(vals, tuple) and len(vals) == len(_ROW_TYPES)
+            and all(type(v) is t for v, t in zip(vals, _ROW_TYPES)))
+
+def _emit_user_update():
+    # emit a signal so UI (or other listeners) can refresh user-visible nodes
+    try:
+        import login
+        # login.user_signals is a QObject with `user_update` signal
+        login.user_signals.user_update.emit()
+    except Exception as e:
+        print(f"[signals] user_update emit failed: {e}")
+
+def add_to_db(vals:tuple, db:str = None):
+    if _valid_row(vals):
         print(vals, "VALS")
-        with sqlite3.connect(db) as conn:
-            conn.execute(f"INSERT INTO nodes VALUES (?,?,?,?,?)",vals)
-            try:
-                conn.commit()
-            except Exception:
-                pass
-            # emit a signal so UI (or other listeners) can refresh user-visible nodes
-            try:
-                import login
-                # login.user_signals is a QObject with `user_update` signal
-                login.user_signals.user_update.emit()
-            except Exception as e:
-                print(f"[signals] user_update emit failed: {e}")
-            
+        if get_backend(db).add_rows([vals]):
+            _emit_user_update()
     else:
         print("***ERROR: VALUE FORMATTING FAILED***")
 
-# Deletes rows before given time
-def delete_before_time(time, table:str = "nodes", db:str ="nodes.db"):
-    time_format = "%Y-%m-%d %H:%M:%S"
-    with sqlite3.connect(db) as conn:
-        cur = conn.cursor()
-        try:
-            time = datetime.fromisoformat(time)
-            time = time.strftime(time_format)
-            if table == "nodes":
-                cur.execute(f'''DELETE FROM nodes WHERE time < ?''', (time,))
-                conn.commit()
-            elif table == "notifications":
-                cur.execute(f'''DELETE FROM notifications WHERE time < ?''', (time,))
-                conn.commit()
-        except ValueError:
-            print("***ERROR: TIME FORMATTING FAILED (YYYY-MM-DD HH:MM:SS)***")
-            return -1
-
-def print_db(db:str = "nodes.db"):
-    with sqlite3.connect(db) as conn:
-        cur = conn.cursor()
-        cur.execute(f"SELECT * FROM nodes")
-        data = cur.fetchall()
-        for row in data:
-            print(row, end="\n")
-
-def get_nodes(db:str = "nodes.db") -> list:
-    with sqlite3.connect(db) as conn:
-        cur = conn.cursor()
-        cur.execute(f"SELECT DISTINCT node_id FROM nodes")
-        data = cur.fetchall()
-        data = [row[0] for row in data]
-    return data if data else []
-
-def get_node_info(node_id:int,db:str = "nodes.db") -> list:
-    with sqlite3.connect(db) as conn:
-        cur = conn.cursor()
-        cur.execute(f"SELECT * FROM nodes WHERE node_id = ? ORDER BY time DESC",(node_id,))
-        node_data = cur.fetchall()
-    return node_data
-
-def get_recent_info(node_id:int, db:str = "nodes.db") -> list:
+# Bulk insert: one transaction (one commit / fsync) and one change event per batch.
+# Malformed rows are skipped. Returns the number of rows written.
+def add_many_to_db(rows:list, db:str = None) -> int:
+    good = [r for r in rows if _valid_row(r)]
+    if len(good) != len(rows):
+        print(f"***ERROR: VALUE FORMATTING FAILED ({len(rows) - len(good)} of {len(rows)} rows skipped)***")
+    if not good:
+        return 0
+    written = get_backend(db).add_rows(good)
+    if written:
+        _emit_user_update()
+    return written
+
+# Deletes rows before given time. Node history is dropped a whole hour at a
+# time, so rows are kept until their entire hour has expired.
+# table: "nodes", "trail" (downsampled history, see rollup_history) or "notifications".
+# Returns the number of hourly partitions (nodes) or rows (trail, notifications) removed.
+def delete_before_time(time, table:str = "nodes", db:str = None):
     try:
-        return [get_node_info(node_id,db)[0]]
-    except IndexError:
-        return []
+        time = datetime.fromisoformat(time)
+    except ValueError:
+        print("***ERROR: TIME FORMATTING FAILED (YYYY-MM-DD HH:MM:SS)***")
+        return -1
+    return get_backend(db).delete_before_time(time, table)
+
+def print_db(db:str = None):
+    for row in get_backend(db).get_history():
+        print(row, end="\n")
+
+def get_nodes(db:str = None) -> list:
+    return get_backend(db).get_nodes()
+
+def get_node_info(node_id:int, db:str = None) -> list:
+    return get_backend(db).get_node_info(node_id)
+
+# Like get_node_info, with each row's last seen time and heartbeat count:
+# (time, node_id, latitude, longitude, status, last_seen, heartbeats), newest first.
+# In heartbeat mode (db_backend.configure) a row covers every packet from
+# `time` to `last_seen` that repeated its position and status; otherwise
+# last_seen == time and heartbeats == 0.
+def get_node_history(node_id:int, db:str = None) -> list:
+    return get_backend(db).get_node_history(node_id)
+
+# Last positions of a node, newest first, at most `limit` (default and
+# maximum: db_partitions.TRACK_SLOTS). Served from a fixed-size ring per
+# node, so the cost does not depend on how much history the node has, and
+# the positions outlive retention.
+def get_track(node_id:int, limit:int = None, db:str = None) -> list:
+    slots = db_partitions.TRACK_SLOTS
+    return get_backend(db).get_track(node_id, min(limit or slots, slots))
+
+def get_recent_info(node_id:int, db:str = None) -> list:
+    return get_backend(db).get_recent_info(node_id)
 
 # Returns most recent GPS location
-def get_GPS(node_id:int, db:str = "nodes.db") -> tuple:
+def get_GPS(node_id:int, db:str = None) -> tuple:
     try:
         data = get_recent_info(node_id, db)
         # Return as stored: (longitude, latitude)
@@ -98,93 +108,215 @@ def get_GPS(node_id:int, db:str = "nodes.db") -> tuple:
         return ()
 
 # Returns most recent status
-def get_status(node_id:int, db:str = "nodes.db") -> str:
+def get_status(node_id:int, db:str = None) -> str:
     try:
         data = get_recent_info(node_id, db)
         return data[0][-1]
     except IndexError:
         return ""
 
-def in_db(node_id:int, db:str = "nodes.db") -> bool:
+def in_db(node_id:int, db:str = None) -> bool:
     if get_status(node_id, db) != "":
         return True
     return False
 
+# Latest position and status for many nodes in one call (no disk access).
+# Returns {node_id: (latitude, longitude, status)}; unknown ids are left out.
+# node_ids=None returns the whole fleet.
+def get_fleet_snapshot(node_ids = None, db:str = None) -> dict:
+    return get_backend(db).get_fleet_snapshot(node_ids)
+
+
+# Tiered history
+
+# Raw rows are kept for the retention window only. rollup_history() thins
+# every closed hour into a downsampled trail (kept for 30 days) and one
+# aggregate row per node and hour (kept indefinitely); see db_rollup.py.
+# The maintenance "rollup" job calls it, and delete_before_time(..., "nodes")
+# rolls up every hour it is about to drop, so no hour expires unrolled.
+
+# Rolls up every hour that ended by `until` and is new or has new rows.
+# Returns {"hours": ..., "trail_points": ..., "aggregates": ...}.
+def rollup_history(until:str, db:str = None) -> dict:
+    try:
+        until = datetime.fromisoformat(until)
+    except ValueError:
+        print("***ERROR: TIME FORMATTING FAILED (YYYY-MM-DD HH:MM:SS)***")
+        return {}
+    return get_backend(db).rollup(until)
+
+def _time_range(since:str, until:str) -> tuple:
+    return (encode_time(since) if since else 0, encode_time(until) if until else 2 ** 62)
+
+# Downsampled positions with since <= time < until, oldest first, in the
+# get_node_info row format.
+def get_trail(node_id:int, since:str = None, until:str = None, db:str = None) -> list:
+    return get_backend(db).get_trail(node_id, *_time_range(since, until))
+
+# Hourly aggregates with since <= hour < until, oldest first:
+# (hour, node_id, packets, first_time, last_time, min_lat, min_lon, max_lat,
+#  max_lon, latitude, longitude, status, distance_m); position and status
+# are the last of the hour, distance_m the path length between packets.
+def get_hourly(node_id:int, since:str = None, until:str = None, db:str = None) -> list:
+    return get_backend(db).get_hourly(node_id, *_time_range(since, until))
+
+
+# Spatial queries
+
+# Nodes whose latest position lies inside the box (edges included).
+# Returns {node_id: (latitude, longitude, status)} like get_fleet_snapshot.
+# min_lon > max_lon means the box crosses the antimeridian.
+def get_nodes_in_bbox(min_lat:float, min_lon:float, max_lat:float, max_lon:float,
+                      db:str = None) -> dict:
+    return get_backend(db).get_nodes_in_bbox(min_lat, min_lon, max_lat, max_lon)
+
+# Nodes within radius_m metres of (lat, lon), nearest first:
+# [(node_id, distance_m), ...].
+def get_nodes_within(lat:float, lon:float, radius_m:float, db:str = None) -> list:
+    return get_backend(db).get_nodes_within(lat, lon, radius_m)
+
+
+# Change feed
+
+# Every node packet and every new notification takes the next number of
+# one global sequence, in commit order. Consumers keep the last seq they
+# processed and ask only for what came after it; save_cursor() persists
+# that position so a restarted consumer resumes where it stopped.
+# Rows that retention has dropped are no longer in the feed.
+
+# Returns [(seq, kind, row), ...] oldest first, at most `limit` events.
+# kind "node": row = (time, node_id, latitude, longitude, status)
+# kind "notification": row = notif_events.Notif, is_read for the default reader
+def get_changes_since(seq:int, limit:int = 1000, kinds:tuple = ("node", "notification"),
+                      db:str = None) -> list:
+    return get_backend(db).get_changes_since(seq, limit, kinds)
+
+def get_latest_seq(db:str = None) -> int:
+    return get_backend(db).get_latest_seq()
+
+# Latest row of every node as of sequence number `seq`, same format as the
+# "node" rows of get_changes_since. Scans the history once; meant for a
+# consumer rebuilding its state at start-up.
+def get_db_at(seq:int, db:str = None) -> list:
+    return get_backend(db).get_db_at(seq)
+
+# Persistent consumer positions. Returns None for a consumer that never saved one.
+def get_cursor(consumer:str, db:str = None):
+    return get_backend(db).get_cursor(consumer)
+
+def save_cursor(consumer:str, seq:int, db:str = None):
+    get_backend(db).save_cursor(consumer, seq)
+
 
 # Notification functions
 
-# Notif = (time, node_id, status, title, message)
-
-def init_notif_db(db:str = "nodes.db"):
-    with sqlite3.connect(db) as conn:
-        cur = conn.cursor()
-        cur.execute(f"CREATE TABLE IF NOT EXISTS notifications (time TEXT, node_id INTEGER, status TEXT,Title TEXT, Message TEXT, is_read INTEGER DEFAULT 0)")
-
-def add_notif(vals:tuple, db:str = "nodes.db"):
-    with sqlite3.connect(db) as conn:
-        conn.execute(f"INSERT INTO notifications (time, node_id, status, Title, Message, is_read) VALUES (?,?,?,?,?,?)",vals)
-        try:
-            conn.commit()
-        except Exception:
-            pass
-
-def mark_notif_read(notif_id:int, db:str = "nodes.db"):
-    with sqlite3.connect(db) as conn:
-        conn.execute(f"UPDATE notifications SET is_read = 1 WHERE id = ?", (notif_id,))
-        conn.commit()
-
-def get_notifs(db:str = "nodes.db") -> list:
-    with sqlite3.connect(db) as conn:
-        cur = conn.cursor()
-        cur.execute(f"SELECT * FROM notifications")
-        data = cur.fetchall()
-    return data
-
-def get_unread_notifs(db:str = "nodes.db") -> list:
-    with sqlite3.connect(db) as conn:
-        cur = conn.cursor()
-        cur.execute(f"SELECT time, node_id, status, Title, Message, is_read FROM notifications WHERE is_read = 0 ORDER BY time DESC")
-        data = cur.fetchall()
-    return data
-
-def mark_all_notifs_read(db:str = "nodes.db"):
-    with sqlite3.connect(db) as conn:
-        conn.execute(f"UPDATE notifications SET is_read = 1 WHERE is_read = 0")
-        conn.commit()
-
-def get_logs(db:str = "nodes.db") -> list:
-    with sqlite3.connect(db) as conn:
-        cur = conn.cursor()
-        cur.execute(f"SELECT time, node_id, status, Title, Message FROM notifications ORDER BY time DESC")
-        data = cur.fetchall()
-    return data
-
-def print_notifs(db:str = "nodes.db",  only_unread:bool = False):
-    with sqlite3.connect(db) as conn:
-        cur = conn.cursor()
-        if only_unread:
-            cur.execute(f"SELECT time, node_id, status, Title, Message FROM notifications WHERE is_read = 0")
-        else:
-            cur.execute(f"SELECT * FROM notifications")
-        data = cur.fetchall()
-        for row in data:
-            print(row, end="\n")
+# Notifications are stored structured (event type, position, old / new
+# status; see notif_events.py) and read back as notif_events.Notif rows,
+# whose first six fields are the old (time, node_id, status, title,
+# message, is_read) tuple. Title and message are rendered on read.
+
+def init_notif_db(db:str = None):
+    get_backend(db).init_notif_db()
+
+# Free-text notification: vals = (time, node_id, status, title, message[, is_read]).
+def add_notif(vals:tuple, db:str = None):
+    get_backend(db).add_notif(Notif(*vals[:5]))
+
+# Structured notification; category, title and message follow from the event
+# (notif_events). Returns the stored Notif.
+def add_event_notif(time:str, node_id:int, event:Event, lat:float = None, lon:float = None,
+                    old_status:str = None, new_status:str = None, db:str = None) -> Notif:
+    title, message = notif_events.render(event, node_id, lat, lon, new_status)
+    n = Notif(time, node_id, notif_events.category(event, new_status), title, message, 0, None,
+              Event(event), lat, lon, old_status, new_status)
+    return n._replace(id=get_backend(db).add_notif(n))
+
+# Read state is a watermark per user: every notification with seq <= the
+# user's mark is read. Users who never marked anything share the default
+# mark. Returned rows carry is_read computed from the caller's mark.
+
+# Marks every notification up to up_to_seq (default: all of them) read for
+# username. Marks only move forward.
+def mark_notifs_read(username:str = None, up_to_seq:int = None, db:str = None):
+    get_backend(db).mark_notifs_read(username, up_to_seq)
+
+# Marks notif_id and everything older read (a watermark cannot skip rows).
+def mark_notif_read(notif_id:int, username:str = None, db:str = None):
+    seq = get_backend(db).notif_seq(notif_id)
+    if seq is not None:
+        mark_notifs_read(username, seq, db)
+
+def get_notifs(username:str = None, db:str = None) -> list:
+    return get_backend(db).get_notifs(username)
+
+def get_unread_notifs(username:str = None, db:str = None) -> list:
+    return get_backend(db).get_notifs(username, unread_only=True, newest_first=True)
+
+# Number of unread notifications for username, overall or for one category
+# (status column: "SOS", "Alert", "System", "Info"). The SQLite total is O(1).
+def get_unread_count(category:str = None, username:str = None, db:str = None) -> int:
+    return get_backend(db).get_unread_count(category, username)
+
+def get_unread_counts(username:str = None, db:str = None) -> dict:
+    return get_backend(db).get_unread_counts(username)
+
+def mark_all_notifs_read(username:str = None, db:str = None):
+    mark_notifs_read(username, None, db)
+
+# Keyset pagination over notifications, newest first. Rows are Notif
+# (time, node_id, status, title, message, is_read, id, ...); pass the time and id
+# of the last row of a page as before_time / before_id to get the next one.
+# Filters: category (status column), node_ids, since <= time < until,
+# unread_only (for username, see mark_notifs_read).
+def get_notifs_page(before_time:str = None, before_id:int = None, limit:int = 50,
+                    category:str = None, node_ids = None, since:str = None, until:str = None,
+                    unread_only:bool = False, username:str = None, db:str = None) -> list:
+    return get_backend(db).get_notifs_page(before_time, before_id, limit, category, node_ids,
+                                           since, until, unread_only, username)
+
+# Full-text search over notification title / message. Every word of `text`
+# must match. The backend returns the newest few hundred matches (for SQLite,
+# from the notif_fts index in rowid order, fast even for words that occur in
+# every row); they are ranked here by weighted term frequency, Title hits
+# counting double; ties go to the newer row.
+# Rows are Notif (time, node_id, status, title, message, is_read, id, ...), best first.
+def search_notifs(text:str, limit:int = 50, category:str = None, node_ids = None,
+                  since:str = None, username:str = None, db:str = None) -> list:
+    terms = db_backend.words(text)
+    if not terms:
+        return []
+    rows = get_backend(db).search_notifs(terms, limit, category, node_ids, since, username)
+
+    def score(row):
+        title, message = db_backend.words(row[3] or ""), db_backend.words(row[4] or "")
+        return sum(2 * title.count(t) + message.count(t) for t in terms)
+
+    rows.sort(key=lambda r: (score(r), r[6]), reverse=True)
+    return rows[:limit]
+
+# Notifications recorded within radius_m metres of (lat, lon) since `since`
+# (time string), newest first. Positions are plain columns, so no message
+# text is parsed.
+def get_notifs_within(lat:float, lon:float, radius_m:float, since:str = None, limit:int = 200,
+                      username:str = None, db:str = None) -> list:
+    return get_backend(db).get_notifs_within(lat, lon, radius_m, since, limit, username)
+
+def get_logs(db:str = None) -> list:
+    return get_backend(db).get_logs()
+
+def print_notifs(db:str = None,  only_unread:bool = False):
+    for row in get_backend(db).get_notifs(unread_only=only_unread):
+        print(row[:5] if only_unread else row[:6], end="\n")
 
 
 '''CAUTION: The following functions are for testing purposes only. Do not use in backend code as they may cause data loss.'''
 
-def CLEAR_DB(db:str = "nodes.db"): 
-    with sqlite3.connect(db) as conn:
-        cur = conn.cursor()
-        cur.execute(f"DELETE FROM nodes")
-        conn.commit()
+def CLEAR_DB(db:str = None):
+    get_backend(db).clear_nodes()
 
-def CLEAR_NOTIF_DB(db:str = "nodes.db"):
-    with sqlite3.connect(db) as conn:
-        cur = conn.cursor()
-        cur.execute(f"DELETE FROM notifications")
-        conn.commit()
+def CLEAR_NOTIF_DB(db:str = None):
+    get_backend(db).clear_notifs()
 
 if __name__ == "__main__":
     print_db()
-    print_notifs()
\ No newline at end of file
+    print_notifs()
@@ -0,0 +1,149 @@
+"""
+db_async.py
+───────────
+Runs database queries off the Qt GUI thread.
+
+submit(fn, *args, **kwargs) queues fn(*args, **kwargs) on a small pool of
+reader threads (READERS; each keeps its own per-thread SQLite connection,
+see db_connection.py) and returns a QueryFuture straight away.  The result
+is handed back on the GUI thread:
+
+    db_async.submit(database.get_unread_count, username=name).then(self.set_badge)
+
+  then(on_done, on_error)  – callbacks, run on the GUI thread; on_error gets
+                             the exception (without one, failures are printed)
+  finished / failed        – the same as Qt signals
+  cancel()                 – the callbacks never run.  A query still queued is
+                             dropped; one already running finishes and its
+                             result is discarded.
+
+Identical calls still in flight (same function and arguments) share one
+query, so a badge timer that fires while the previous count is running
+does not queue a second one.  Pass key=... to choose the grouping yourself,
+or key=None for calls that must always run (writes, logins).
+
+Callers are GUI code: submit / cancel / then belong on the GUI thread.
+"""
+
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from PyQt6.QtCore import QObject, Qt, pyqtSignal
+
+READERS = 4
+
+_AUTO = object()
+
+_lock = threading.RLock()
+_pool: ThreadPoolExecutor | None = None
+_inflight: dict = {}    # key -> concurrent Future, while queued or running
+_waiters: dict = {}     # concurrent Future -> QueryFutures still waiting on it
+_live: set = set()      # QueryFutures not yet delivered / cancelled (keeps them alive)
+
+
+class QueryFuture(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+    _ready = pyqtSignal()
+
+    def __init__(self, future, name: str):
+        super().__init__()
+        self._future = future
+        self._name = name
+        self.cancelled = False
+        self.done = False
+        # always queued: a future that is already done still delivers after then()
+        self._ready.connect(self._deliver, Qt.ConnectionType.QueuedConnection)
+        _live.add(self)
+        future.add_done_callback(lambda _: self._ready.emit())
+
+    def then(self, on_done, on_error=None) -> "QueryFuture":
+        self.finished.connect(on_done)
+        if on_error is not None:
+            self.failed.connect(on_error)
+        return self
+
+    def cancel(self):
+        if self.cancelled or self.done:
+            return
+        self.cancelled = True
+        _live.discard(self)
+        if _release(self._future) == 0:
+            self._future.cancel()     # only succeeds while it is still queued
+
+    def _deliver(self):
+        if self.cancelled or self.done:
+            return
+        self.done = True
+        _live.discard(self)
+        _release(self._future)
+        try:
+            result = self._future.result()
+        except CancelledError:
+            return
+        except Exception as exc:
+            if not self.receivers(self.failed):
+                print(f"[db_async] {self._name} failed: {exc}")
+            self.failed.emit(exc)
+            return
+        self.finished.emit(result)
+
+
+def _release(future) -> int:
+    # one waiter less; returns how many are left
+    with _lock:
+        left = _waiters.get(future, 1) - 1
+        if left > 0:
+            _waiters[future] = left
+        else:
+            _waiters.pop(future, None)
+        return left
+
+
+def _finished(key, future):
+    with _lock:
+        if _inflight.get(key) is future:
+            del _inflight[key]
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(READERS, thread_name_prefix="db-reader")
+        return _pool
+
+
+def submit(fn, *args, key=_AUTO, **kwargs) -> QueryFuture:
+    """Run fn(*args, **kwargs) on a reader thread; see the module docstring."""
+    if key is _AUTO:
+        key = (fn, repr(args), repr(sorted(kwargs.items())))
+    pool = _executor()
+    with _lock:
+        future = _inflight.get(key) if key is not None else None
+        if future is None:
+            future = pool.submit(fn, *args, **kwargs)
+            if key is not None:
+                _inflight[key] = future
+                future.add_done_callback(lambda f: _finished(key, f))
+        _waiters[future] = _waiters.get(future, 0) + 1
+    return QueryFuture(future, getattr(fn, "__name__", repr(fn)))
+
+
+def in_flight() -> int:
+    """Number of distinct queries queued or running."""
+    with _lock:
+        return sum(1 for f in _waiters if not f.done())
+
+
+def shutdown():
+    """Drop queued queries and let the reader threads exit once their
+    current query finishes.  The next submit() starts a new pool."""
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+        _inflight.clear()
+    for q in list(_live):
+        q.cancel()
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,256 @@
+"""
+db_backend.py
+─────────────
+Storage backends behind database.py.
+
+Every public function in database.py delegates to a StorageBackend.
+Pass its `db` argument as None to use the configured default backend, as
+a backend object, or as a SQLite path (a SQLiteBackend for that file is
+created on first use, which is how existing callers passing "nodes.db"
+keep working).
+
+Backends (see make_backend)
+--------
+  sqlite   – on-disk SQLite file (db_sqlite.SQLiteBackend); the default
+  tmpfs    – the same, in a throw-away file on a RAM-backed filesystem
+             (/dev/shm when present), removed again by close()
+  memory   – shared-cache in-memory SQLite (db_sqlite.SharedMemoryBackend):
+             one database visible to every thread, gone at close()
+  dict     – pure-Python dicts and lists (db_memory.DictBackend); no SQL
+             at all, for load tests and disposable kiosks
+  sharded  – node history spread by node_id over several SQLite files,
+             one writer thread each (db_sharded.ShardedBackend), for
+             multi-gateway ingest
+
+The two in-memory SQLite variants run the same SQL, migrations and
+query-plan checks as the on-disk file.  The dict backend implements the
+same functions directly; SQL-only tooling (migrations, query plans,
+VACUUM / checkpoint jobs) has nothing to act on there.
+
+Configuration
+-------------
+The default backend comes from the environment, or from configure():
+
+  SAFETRACK_STORAGE   sqlite | tmpfs | memory | dict | sharded   (default sqlite)
+  SAFETRACK_DB        file path for sqlite, name for the others
+                      (default nodes.db)
+  SAFETRACK_SHARDS    number of shard files for sharded (default 4)
+  SAFETRACK_HEARTBEATS  1 to store node history in heartbeat mode
+                      (default 0; see StorageBackend.heartbeats)
+
+auth_database.py stores its tables through the same backend
+(auth_connection()).
+"""
+
+import math
+import os
+import re
+import threading
+from calendar import timegm
+from datetime import datetime, timezone
+
+KINDS = ("sqlite", "tmpfs", "memory", "dict", "sharded")
+DEFAULT_PATH = "nodes.db"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+# ──────────────────────────────────────
+# SHARED ENCODING / GEOMETRY
+# ──────────────────────────────────────
+
+def encode_time(val: str) -> int:
+    # naive wall-clock times are stored as if they were UTC so they round-trip exactly
+    t = datetime.fromisoformat(val)
+    return timegm(t.timetuple()) * 1000 + t.microsecond // 1000
+
+
+def decode_time(time_ms: int) -> str:
+    return datetime.fromtimestamp(time_ms // 1000, tz=timezone.utc).strftime(TIME_FORMAT)
+
+
+def encode_coord(deg: float) -> int:
+    return round(deg * 1_000_000)
+
+
+EARTH_RADIUS_M = 6_371_008.8
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def circle_bbox(lat: float, lon: float, radius_m: float) -> tuple:
+    """(min_lat, min_lon, max_lat, max_lon) enclosing the circle; min_lon > max_lon
+    when it wraps across the antimeridian."""
+    ang = radius_m / EARTH_RADIUS_M
+    min_lat, max_lat = lat - math.degrees(ang), lat + math.degrees(ang)
+    if min_lat <= -90 or max_lat >= 90 or ang >= math.pi / 2:
+        # the circle covers a pole: every longitude
+        min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+        min_lon, max_lon = -180.0, 180.0
+    else:
+        dlon = math.degrees(math.asin(min(1.0, math.sin(ang) / math.cos(math.radians(lat)))))
+        min_lon, max_lon = lon - dlon, lon + dlon
+        if min_lon < -180:
+            min_lon += 360
+        if max_lon > 180:
+            max_lon -= 360
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def words(text: str) -> list:
+    # same split as FTS5's unicode61 tokenizer: runs of letters and digits
+    return re.findall(r"[^\W_]+", text.lower())
+
+
+# ──────────────────────────────────────
+# INTERFACE
+# ──────────────────────────────────────
+
+class StorageBackend:
+    """What database.py needs from a store.  Rows use the public formats
+    documented in database.py; `vals` / `rows` arriving here are already
+    validated tuples."""
+
+    kind = ""
+    path = None     # SQLite path / URI for SQL backends, None otherwise
+    # Heartbeat mode: a packet that repeats its node's last position and
+    # status extends that history row (last seen time, heartbeat count)
+    # instead of adding one.  A mostly parked fleet then stores about one
+    # row per node per hour.  get_node_history() shows both.
+    heartbeats = False
+
+    def close(self):
+        pass
+
+    def auth_connection(self):
+        """sqlite3 connection holding the auth_* tables (auth_database.py)."""
+        raise NotImplementedError
+
+    def files(self) -> list:
+        """SQLite database files / URIs of this backend (maintenance.py)."""
+        return []
+
+    # ── nodes ─────────────────────────────
+    def init_db(self): raise NotImplementedError
+    def add_rows(self, rows: list) -> int: raise NotImplementedError
+    def delete_before_time(self, time: datetime, table: str): raise NotImplementedError
+    def get_history(self) -> list: raise NotImplementedError
+    def get_latest(self) -> list: raise NotImplementedError
+    def get_nodes(self) -> list: raise NotImplementedError
+    def get_node_info(self, node_id: int) -> list: raise NotImplementedError
+    def get_node_history(self, node_id: int) -> list: raise NotImplementedError
+    def get_track(self, node_id: int, limit: int) -> list: raise NotImplementedError
+    def get_recent_info(self, node_id: int) -> list: raise NotImplementedError
+    def get_fleet_snapshot(self, node_ids=None) -> dict: raise NotImplementedError
+
+    # ── tiered history ────────────────────
+    def rollup(self, until: datetime) -> dict: raise NotImplementedError
+    def get_trail(self, node_id: int, since_ms: int, until_ms: int) -> list: raise NotImplementedError
+    def get_hourly(self, node_id: int, since_ms: int, until_ms: int) -> list: raise NotImplementedError
+
+    # ── spatial ───────────────────────────
+    def get_nodes_in_bbox(self, min_lat, min_lon, max_lat, max_lon) -> dict: raise NotImplementedError
+    def get_nodes_within(self, lat, lon, radius_m) -> list: raise NotImplementedError
+
+    # ── change feed ───────────────────────
+    def get_changes_since(self, seq: int, limit: int, kinds: tuple) -> list: raise NotImplementedError
+    def get_latest_seq(self) -> int: raise NotImplementedError
+    def get_db_at(self, seq: int) -> list: raise NotImplementedError
+    def get_cursor(self, consumer: str): raise NotImplementedError
+    def save_cursor(self, consumer: str, seq: int): raise NotImplementedError
+
+    # ── notifications ─────────────────────
+    def init_notif_db(self): raise NotImplementedError
+    def add_notif(self, n) -> int: raise NotImplementedError
+    def mark_notifs_read(self, username, up_to_seq): raise NotImplementedError
+    def notif_seq(self, notif_id: int): raise NotImplementedError
+    def get_notifs(self, username=None, unread_only=False, newest_first=False) -> list: raise NotImplementedError
+    def get_unread_count(self, category, username) -> int: raise NotImplementedError
+    def get_unread_counts(self, username) -> dict: raise NotImplementedError
+    def get_notifs_page(self, before_time, before_id, limit, category, node_ids, since, until,
+                        unread_only, username) -> list: raise NotImplementedError
+    def search_notifs(self, terms: list, limit, category, node_ids, since, username) -> list: raise NotImplementedError
+    def get_notifs_within(self, lat, lon, radius_m, since, limit, username) -> list: raise NotImplementedError
+    def get_logs(self) -> list: raise NotImplementedError
+
+    # ── testing only ──────────────────────
+    def clear_nodes(self): raise NotImplementedError
+    def clear_notifs(self): raise NotImplementedError
+
+
+# ──────────────────────────────────────
+# CONFIGURATION / REGISTRY
+# ──────────────────────────────────────
+
+_lock = threading.RLock()
+_default: StorageBackend | None = None
+_by_path: dict[str, StorageBackend] = {}
+
+
+def make_backend(kind: str = "sqlite", path: str | None = None,
+                 heartbeats: bool = False) -> StorageBackend:
+    """A new backend of *kind* (see KINDS)."""
+    if kind in ("sqlite", "tmpfs", "memory"):
+        import db_sqlite
+        if kind == "sqlite":
+            backend = db_sqlite.SQLiteBackend(path or DEFAULT_PATH)
+        elif kind == "tmpfs":
+            backend = db_sqlite.TmpfsBackend(path or DEFAULT_PATH)
+        else:
+            backend = db_sqlite.SharedMemoryBackend(path or DEFAULT_PATH)
+    elif kind == "sharded":
+        import db_sharded
+        backend = db_sharded.ShardedBackend(path or DEFAULT_PATH)
+    elif kind == "dict":
+        import db_memory
+        backend = db_memory.DictBackend(path or DEFAULT_PATH)
+    else:
+        raise ValueError(f"unknown storage backend {kind!r} (expected one of {', '.join(KINDS)})")
+    backend.heartbeats = heartbeats
+    return backend
+
+
+def configure(kind: str | None = None, path: str | None = None,
+              heartbeats: bool | None = None) -> StorageBackend:
+    """Select the default backend.  Arguments left out come from
+    SAFETRACK_STORAGE / SAFETRACK_DB / SAFETRACK_HEARTBEATS.  The previous
+    default is closed."""
+    global _default
+    kind = kind or os.environ.get("SAFETRACK_STORAGE", "sqlite")
+    path = path or os.environ.get("SAFETRACK_DB", DEFAULT_PATH)
+    if heartbeats is None:
+        heartbeats = os.environ.get("SAFETRACK_HEARTBEATS", "0") not in ("", "0")
+    backend = make_backend(kind, path, heartbeats)
+    with _lock:
+        old, _default = _default, backend
+        if backend.path is not None:
+            _by_path[backend.path] = backend
+    if old is not None and old is not backend:
+        if _by_path.get(old.path) is old:
+            del _by_path[old.path]
+        old.close()
+    print(f"[db_backend] storage: {kind} ({path}){' heartbeat mode' if heartbeats else ''}")
+    return backend
+
+
+def get_backend(db=None) -> StorageBackend:
+    """Resolve database.py's `db` argument to a backend."""
+    if isinstance(db, StorageBackend):
+        return db
+    if db is None:
+        backend = _default
+        return backend if backend is not None else _configure_once()
+    with _lock:
+        backend = _by_path.get(db)
+        if backend is None:
+            backend = _by_path[db] = make_backend("sqlite", db)
+        return backend
+
+
+def _configure_once() -> StorageBackend:
+    with _lock:
+        return _default if _default is not None else configure()
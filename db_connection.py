@@ -0,0 +1,298 @@
+"""
+db_connection.py
+────────────────
+Per-thread SQLite connection manager used by database.py and
+auth_database.py.
+
+Every thread (UI, BackendWorker, Simulate / Monitor) keeps one
+long-lived connection per database file instead of reconnecting on
+every call.  Connections are opened in WAL mode so readers never block
+the writer, with synchronous=NORMAL (safe under WAL, no fsync per
+commit) and a short busy_timeout.  When SQLite still reports the file
+as locked the statement (or commit, including the one at the end of
+a `with conn:` block) is retried here with a small backoff so the wait
+shows up in the stats instead of disappearing inside SQLite.
+
+Stats (see get_stats())
+-----
+  open_connections  – connections currently open across all threads
+  statements        – statements executed since start / reset
+  lock_waits        – retries caused by "database is locked / busy"
+  lock_wait_ms      – total time spent sleeping in those retries
+  lock_failures     – statements that still failed after all retries
+  files             – statements / lock_waits / lock_wait_ms /
+                      lock_failures per database file (the connection's
+                      main file, so waits on an ATTACHed file count
+                      against the file the connection was opened for)
+
+register_attachments() makes every connection to a file ATTACH other
+files when it is opened (see db_files.py).
+
+Connections are bound to the thread that opened them; a thread that
+is about to exit should call close_thread_connections().
+close_connections() closes every thread's connections to given files,
+for throw-away databases that are about to be deleted.
+"""
+
+import sqlite3
+import threading
+import time
+import weakref
+
+BUSY_TIMEOUT_MS = 250      # SQLite-level wait before we see SQLITE_BUSY
+LOCK_RETRIES = 20          # python-level retries on top of busy_timeout
+LOCK_BACKOFF_S = 0.01      # first retry delay, doubled up to LOCK_BACKOFF_MAX_S
+LOCK_BACKOFF_MAX_S = 0.2
+
+PRAGMAS = (
+    # takes effect only on a new, empty file, so must precede journal_mode;
+    # existing files are converted by maintenance.enable_incremental_vacuum()
+    "PRAGMA auto_vacuum = INCREMENTAL",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",
+)
+
+
+# ──────────────────────────────────────
+# STATS
+# ──────────────────────────────────────
+
+_stats_lock = threading.Lock()
+_stats = {
+    "connections_opened": 0,
+    "statements": 0,
+    "lock_waits": 0,
+    "lock_wait_ms": 0.0,
+    "lock_failures": 0,
+}
+_FILE_KEYS = ("statements", "lock_waits", "lock_wait_ms", "lock_failures")
+# path -> counters like _stats, for the keys in _FILE_KEYS
+_file_stats: dict[str, dict] = {}
+# id(conn) -> (thread name, path); entries removed when the connection closes
+_open_conns: dict[int, tuple[str, str]] = {}
+# path -> its open connections on every thread (close_connections())
+_conns_by_path: dict[str, weakref.WeakSet] = {}
+
+
+def _file(path: str) -> dict:
+    # caller holds _stats_lock
+    stats = _file_stats.get(path)
+    if stats is None:
+        stats = _file_stats[path] = {key: 0 for key in _FILE_KEYS}
+    return stats
+
+
+def _bump(key: str, path: str, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+        _file(path)[key] += amount
+
+
+def _is_lock_error(exc: sqlite3.OperationalError) -> bool:
+    msg = str(exc).lower()
+    return "locked" in msg or "busy" in msg
+
+
+def _with_retry(fn, path: str):
+    """Run *fn*, retrying while SQLite reports the database as locked."""
+    delay = LOCK_BACKOFF_S
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            return fn()
+        except sqlite3.OperationalError as exc:
+            if not _is_lock_error(exc):
+                raise
+            if attempt == LOCK_RETRIES:
+                _bump("lock_failures", path)
+                raise
+            start = time.perf_counter()
+            time.sleep(delay)
+            waited = (time.perf_counter() - start) * 1000
+            with _stats_lock:
+                _stats["lock_waits"] += 1
+                _stats["lock_wait_ms"] += waited
+                _file(path)["lock_waits"] += 1
+                _file(path)["lock_wait_ms"] += waited
+            delay = min(delay * 2, LOCK_BACKOFF_MAX_S)
+
+
+# ──────────────────────────────────────
+# TRACKED CONNECTION / CURSOR
+# ──────────────────────────────────────
+
+class _TrackedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        path = self.connection.path
+        _bump("statements", path)
+        self.connection.statements += 1
+        return _with_retry(lambda: sqlite3.Cursor.execute(self, sql, parameters), path)
+
+    def executemany(self, sql, seq_of_parameters):
+        path = self.connection.path
+        _bump("statements", path)
+        self.connection.statements += 1
+        # materialise generators so a retry replays the same rows
+        rows = list(seq_of_parameters)
+        return _with_retry(lambda: sqlite3.Cursor.executemany(self, sql, rows), path)
+
+    def executescript(self, sql_script):
+        path = self.connection.path
+        _bump("statements", path)
+        self.connection.statements += 1
+        return _with_retry(lambda: sqlite3.Cursor.executescript(self, sql_script), path)
+
+
+class _TrackedConnection(sqlite3.Connection):
+    """sqlite3.Connection whose statements go through _TrackedCursor."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements = 0
+        self.path = ""
+        self.closed = False
+
+    def cursor(self, factory=_TrackedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        return _with_retry(super().commit, self.path)
+
+    def __exit__(self, exc_type, exc, tb):
+        # sqlite3's own __exit__ calls the C-level commit, which would skip
+        # the retry above for `with conn:` blocks
+        if exc_type is not None:
+            self.rollback()
+            return False
+        try:
+            self.commit()
+        except sqlite3.Error:
+            self.rollback()
+            raise
+        return False
+
+    def close(self):
+        self.closed = True
+        _open_conns.pop(id(self), None)
+        super().close()
+
+
+# ──────────────────────────────────────
+# PER-THREAD POOL
+# ──────────────────────────────────────
+
+_local = threading.local()
+# path -> {alias: attached path}, applied when a connection to path opens
+_attachments: dict[str, dict[str, str]] = {}
+
+
+def _thread_conns() -> dict:
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    return conns
+
+
+def _open(path: str) -> _TrackedConnection:
+    # "file:...?mode=memory&cache=shared" names a shared in-memory database.
+    # Only the owning thread gets the connection from the pool;
+    # check_same_thread is off so close_connections() can close it from another.
+    conn = sqlite3.connect(path, factory=_TrackedConnection, uri=True, check_same_thread=False)
+    conn.path = path
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    for alias, other in _attachments.get(path, {}).items():
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (other,))
+    key = id(conn)
+    with _stats_lock:
+        _stats["connections_opened"] += 1
+        _open_conns[key] = (threading.current_thread().name, path)
+        _conns_by_path.setdefault(path, weakref.WeakSet()).add(conn)
+    # thread-local dicts are dropped when the thread dies; forget the
+    # connection when it is garbage collected as well
+    weakref.finalize(conn, _open_conns.pop, key, None)
+    return conn
+
+
+def get_connection(path: str = "nodes.db") -> sqlite3.Connection:
+    """Return this thread's connection to *path*, opening it on first use.
+
+    Use it exactly like sqlite3.connect():  `with get_connection(db) as conn:`
+    commits on success and rolls back on error, but does NOT close the
+    connection, so the next call on this thread reuses it.
+    """
+    conns = _thread_conns()
+    conn = conns.get(path)
+    if conn is None or conn.closed:
+        conn = conns[path] = _open(path)
+    return conn
+
+
+def register_attachments(path: str, attach: dict):
+    """Connections to *path* opened from now on ATTACH each {alias: path}
+    in *attach*.  Connections already open are left as they are."""
+    with _stats_lock:
+        _attachments[path] = dict(attach)
+
+
+def close_thread_connections():
+    """Close every connection opened by the calling thread."""
+    conns = _thread_conns()
+    for conn in conns.values():
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    conns.clear()
+
+
+def close_connections(paths):
+    """Close the connections to *paths* of every thread, so the files can be
+    deleted and their space freed now rather than when those threads exit.
+    A thread still using one gets sqlite3.ProgrammingError; its next
+    get_connection() opens a new connection."""
+    with _stats_lock:
+        conns = [conn for path in paths for conn in _conns_by_path.pop(path, ())]
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+def get_stats() -> dict:
+    """Snapshot of connection and statement counters."""
+    with _stats_lock:
+        stats = dict(_stats)
+        stats["open_connections"] = len(_open_conns)
+        stats["connections"] = sorted(_open_conns.values())
+        stats["files"] = {path: dict(s, lock_wait_ms=round(s["lock_wait_ms"], 3))
+                          for path, s in sorted(_file_stats.items())}
+    stats["lock_wait_ms"] = round(stats["lock_wait_ms"], 3)
+    return stats
+
+
+def reset_stats():
+    """Zero the statement / lock counters (open connections are kept)."""
+    with _stats_lock:
+        for key in ("statements", "lock_waits", "lock_failures"):
+            _stats[key] = 0
+        _stats["lock_wait_ms"] = 0.0
+        _file_stats.clear()
+
+
+if __name__ == "__main__":
+    with get_connection() as conn:
+        print("journal_mode:", conn.execute("PRAGMA journal_mode").fetchone()[0])
+    print(get_stats())
@@ -0,0 +1,160 @@
+"""
+db_files.py
+───────────
+Database file layout for the SQLite backends.
+
+Telemetry, notifications and auth live in separate files, each with its
+own write lock, so a retention DELETE on notifications or a login write
+no longer waits behind packet ingest (or makes ingest wait):
+
+  nodes.db                  – telemetry: node history partitions,
+                              node_latest, node_rtree, node_status,
+                              change_seq, feed_cursors
+  nodes-notifications.db    – notifications, notif_fts, read marks, stats,
+                              its own change_seq
+  nodes-auth.db             – auth_users, reset_tokens, invite_codes
+
+Notification connections ATTACH the telemetry file as `tel` (see
+notif_connection()).  That provides the node_status names joined into every
+notification row.  Notifications and node rows are numbered for the change
+feed by one counter held in the process (db_sqlite.py); each file keeps
+the highest seq it has used in its own change_seq, so adding a
+notification does not write the telemetry file.  Auth needs nothing from
+the other files.
+
+Existing single-file databases are split by migration 14 (move_out()),
+which copies the notification and auth objects into their new files and
+then drops them from the telemetry file.  `python db_files.py [nodes.db]`
+runs the migration and prints the per-file lock-wait counters.
+"""
+
+import os
+import sys
+
+import db_connection
+from db_connection import get_connection
+
+ROLES = ("telemetry", "notifications", "auth")
+
+NOTIF_TABLES = ("notifications", "notif_event_types", "notif_stats", "notif_read_marks", "notif_fts",
+                "notif_category_stats", "notif_category_marks")
+AUTH_TABLES = ("auth_users", "reset_tokens", "invite_codes")
+
+# notifications are numbered in Python inside the write that inserts them
+# (db_sqlite.SQLiteBackend.add_notif); triggers cannot see attached files
+_SKIP_TRIGGERS = ("notifications_seq_insert", "notifications_seq_read")
+
+
+def with_suffix(path: str, suffix: str) -> str:
+    """`nodes.db` -> `nodes-<suffix>.db`.  Works on plain paths and on
+    `file:` URIs (the query string is kept)."""
+    base, sep, query = path.partition("?")
+    stem, ext = os.path.splitext(base)
+    if ext and not base.startswith("file:"):
+        return f"{stem}-{suffix}{ext}{sep}{query}"
+    return f"{base}-{suffix}{sep}{query}"
+
+
+def path_for(path: str, role: str) -> str:
+    """The file holding *role* for the telemetry database *path*."""
+    if role == "telemetry":
+        return path
+    if role not in ROLES:
+        raise ValueError(f"unknown database role {role!r}")
+    return with_suffix(path, role)
+
+
+def paths(path: str) -> dict:
+    return {role: path_for(path, role) for role in ROLES}
+
+
+def register(path: str):
+    """Make every connection to the notifications file of *path* ATTACH
+    the telemetry file as `tel`."""
+    db_connection.register_attachments(path_for(path, "notifications"), {"tel": path})
+
+
+def notif_connection(path: str):
+    register(path)
+    return get_connection(path_for(path, "notifications"))
+
+
+def auth_connection(path: str):
+    return get_connection(path_for(path, "auth"))
+
+
+# ──────────────────────────────────────
+# SPLIT (migration 14)
+# ──────────────────────────────────────
+
+def _objects(conn, tables: tuple) -> list:
+    # (type, name, sql) of the tables and their indexes / triggers, tables first;
+    # FTS shadow tables and automatic indexes come with their owner
+    marks = ",".join("?" * len(tables))
+    rows = conn.execute(f"""SELECT type, name, sql FROM sqlite_master
+                            WHERE tbl_name IN ({marks}) AND sql IS NOT NULL
+                            ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END""",
+                        tables).fetchall()
+    return [r for r in rows if r[1] not in _SKIP_TRIGGERS]
+
+
+def _copy(conn, target: str, tables: tuple) -> list:
+    """Recreate *tables* of the telemetry connection in *target* and copy
+    their rows; returns the names of the tables that existed.  Runs in one
+    transaction on *target* and replaces whatever a previous, interrupted
+    attempt left there."""
+    objects = _objects(conn, tables)
+    present = [name for kind, name, _ in objects if kind == "table"]
+    if not present:
+        return []
+    dst = get_connection(target)
+    if dst.in_transaction:
+        dst.commit()
+    # deferred: only `main` is written, and BEGIN IMMEDIATE would also lock
+    # the attached telemetry file, which the migration already holds
+    dst.execute("BEGIN")
+    try:
+        for name in present:
+            # qualified: the notifications file has the telemetry file attached
+            dst.execute(f"DROP TABLE IF EXISTS main.{name}")
+        for kind, name, sql in objects:
+            if kind == "table":
+                dst.execute(sql)
+        for name in present:
+            cols = [r[1] for r in conn.execute(f"PRAGMA table_info({name})")]
+            col_list = ", ".join(["rowid"] + cols) if name == "notif_fts" else ", ".join(cols)
+            rows = conn.execute(f"SELECT {col_list} FROM {name}").fetchall()
+            if rows:
+                dst.executemany(f"INSERT INTO main.{name} ({col_list}) VALUES ({','.join('?' * len(rows[0]))})", rows)
+        # indexes and triggers last, so copied rows do not fire the triggers
+        for kind, name, sql in objects:
+            if kind != "table":
+                dst.execute(sql)
+        dst.commit()
+    except Exception:
+        dst.rollback()
+        raise
+    return present
+
+
+def move_out(conn):
+    """Migration 14: move notifications and auth out of the telemetry file.
+    *conn* is the telemetry connection, inside the migration transaction."""
+    # before the notifications file is first opened on this thread, or its
+    # connection would lack the `tel` attachment for the rest of the thread
+    register(conn.path)
+    for role, tables in (("notifications", NOTIF_TABLES), ("auth", AUTH_TABLES)):
+        moved = _copy(conn, path_for(conn.path, role), tables)
+        # indexes and triggers (including the seq triggers) go with their table
+        for name in moved:
+            conn.execute(f"DROP TABLE {name}")
+
+
+if __name__ == "__main__":
+    from db_migrations import migrate
+    path = sys.argv[1] if len(sys.argv) > 1 else "nodes.db"
+    print(f"schema version: {migrate(path)}")
+    for role, p in paths(path).items():
+        print(f"{role:14} {p}")
+    for p, stats in db_connection.get_stats()["files"].items():
+        print(f"{p}: {stats}")
@@ -0,0 +1,259 @@
+"""
+db_journal.py
+─────────────
+Append-only journal of raw node packets, written before any database work.
+
+GroupCommitWriter.submit() appends every row here before queueing it, so
+a packet that was read but not yet committed (queued, in a batch, or
+the app died mid-commit) is still on disk and is replayed into the
+database on the next start.
+
+File layout (nodes.journal by default), memory-mapped:
+
+  header   64 bytes   magic, record size, capacity, committed watermark
+  records  capacity × 64 bytes, a ring: record `seq` lives in slot
+           (seq - 1) % capacity
+
+  record   seq u64 | time_ms i64 | node_id i64 | lat_e6 i32 | lon_e6 i32 |
+           status 28 bytes (utf-8, NUL padded) | crc32 of the first 60 bytes
+
+An append is one 64-byte copy into the mapping: no write() call and no
+fsync per row.  The page cache holds it as soon as append() returns, so
+a crash of the app loses nothing; sync() (msync, at most every
+`sync_interval_s`, driven by the writer) covers power loss.
+
+The watermark is the highest seq up to which every record is resolved:
+committed to the database, or deliberately discarded (the ingest queue's
+overflow policy, or a batch the writer gave up on).  Records above it are
+replayed by replay(), which skips rows the database already has (a crash
+between commit and watermark update; in heartbeat mode a row counts as
+held when a stored row covers its time).  discard() also clears the
+record's slot, so a discarded row is not replayed even while rows still
+in flight hold the watermark below it.  `python db_journal.py [nodes.journal] [nodes.db]` replays by hand.
+"""
+
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+import database
+from db_backend import decode_time, encode_coord, encode_time
+
+MAGIC = b"STJRNL01"
+DEFAULT_PATH = "nodes.journal"
+DEFAULT_CAPACITY = 65536
+
+_HEADER = struct.Struct("<8sIIQ")         # magic, record size, capacity, watermark
+_HEADER_SIZE = 64
+_RECORD = struct.Struct("<Qqqii28sI")     # seq, time_ms, node_id, lat_e6, lon_e6, status, crc
+_BODY = _RECORD.size - 4
+
+
+class JournaledRow(tuple):
+    """A node row that remembers its journal seq.  Still a plain 5-tuple to
+    everything else (database.add_many_to_db, the ingest queue)."""
+
+    def __new__(cls, row: tuple, seq: int):
+        self = super().__new__(cls, row)
+        self.jseq = seq
+        return self
+
+
+def _encode(seq: int, row: tuple) -> bytes:
+    time, node_id, lat, lon, status = row
+    body = struct.pack("<Qqqii28s", seq, encode_time(time), node_id,
+                       encode_coord(lat), encode_coord(lon), _status_bytes(status))
+    return body + struct.pack("<I", zlib.crc32(body))
+
+
+def _status_bytes(status: str) -> bytes:
+    raw = status.encode("utf-8")
+    if len(raw) > 28:
+        raise ValueError(f"status {status!r} is longer than 28 bytes")
+    return raw
+
+
+def _held(history: list) -> tuple:
+    # (exact rows, extended rows) of database.get_node_history rows; an
+    # extended row holds every packet from its time to its last seen time
+    return {h[:5] for h in history}, [h for h in history if h[6]]
+
+
+def _stored(row: tuple, held: tuple) -> bool:
+    exact, extended = held
+    return row in exact or any(h[2:5] == row[2:5] and h[0] <= row[0] <= h[5] for h in extended)
+
+
+def _decode(record: bytes):
+    # (seq, row) or None for an empty slot or a torn / corrupt record
+    seq, time_ms, node_id, lat_e6, lon_e6, status, crc = _RECORD.unpack(record)
+    if seq == 0 or zlib.crc32(record[:_BODY]) != crc:
+        return None
+    return seq, (decode_time(time_ms), node_id, lat_e6 / 1e6, lon_e6 / 1e6,
+                 status.rstrip(b"\0").decode("utf-8"))
+
+
+class PacketJournal:
+    def __init__(self, path: str = DEFAULT_PATH, capacity: int = DEFAULT_CAPACITY,
+                 sync_interval_s: float = 1.0):
+        self.path = path
+        self.sync_interval_s = sync_interval_s
+        self._lock = threading.Lock()
+        self._file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        size = os.fstat(self._file.fileno()).st_size
+        if size >= _HEADER_SIZE:
+            magic, rec_size, cap, watermark = _HEADER.unpack_from(self._file.read(_HEADER.size))
+            if magic != MAGIC or rec_size != _RECORD.size:
+                self._file.close()
+                raise ValueError(f"{path} is not a packet journal")
+            capacity = cap
+        else:
+            watermark = 0
+        self.capacity = capacity
+        self._file.truncate(_HEADER_SIZE + capacity * _RECORD.size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self.watermark = watermark
+        self._resolved: set[int] = set()
+        self._last_sync = time.monotonic()
+        self.overwritten = 0
+        self._write_header()
+        # never below the watermark: the newest records may have been discarded
+        # (cleared) or overwritten, and a seq at or below it is never replayed
+        self.next_seq = max(watermark, max((seq for seq, _ in self._records()), default=0)) + 1
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+                self._map.close()
+                self._file.close()
+                self._map = None
+
+    # ── writing ───────────────────────────
+
+    def append(self, row: tuple) -> tuple:
+        """Journal *row* and return it as a JournaledRow.  A row that cannot
+        be encoded (bad time, oversized status) is returned unchanged and not
+        journaled; the database rejects it anyway."""
+        with self._lock:
+            seq = self.next_seq
+            try:
+                record = _encode(seq, row)
+            except (ValueError, TypeError, struct.error) as exc:
+                print(f"[db_journal] not journaled: {row} ({exc})")
+                return row
+            if seq - self.capacity > self.watermark:
+                # the slot still holds a record that never reached the database
+                self.overwritten += 1
+                print(f"[db_journal] journal full: record {seq - self.capacity} overwritten before commit")
+                self.watermark = seq - self.capacity
+                self._resolved = {s for s in self._resolved if s > self.watermark}
+                self._resolve_locked([])
+                self._write_header()
+            offset = _HEADER_SIZE + (seq - 1) % self.capacity * _RECORD.size
+            self._map[offset:offset + _RECORD.size] = record
+            self.next_seq = seq + 1
+            return JournaledRow(row, seq)
+
+    def resolve(self, rows):
+        """Mark rows committed; advances the watermark over every record that
+        is now resolved."""
+        seqs = [r.jseq for r in rows if isinstance(r, JournaledRow)]
+        if seqs:
+            with self._lock:
+                self._resolve_locked(seqs)
+
+    def discard(self, rows):
+        """Resolve rows that will never be committed and clear their records,
+        so replay() cannot bring them back."""
+        seqs = [r.jseq for r in rows if isinstance(r, JournaledRow)]
+        if seqs:
+            with self._lock:
+                for seq in seqs:
+                    offset = _HEADER_SIZE + (seq - 1) % self.capacity * _RECORD.size
+                    # the slot may already hold a newer record if the ring wrapped
+                    if _RECORD.unpack_from(self._map, offset)[0] == seq:
+                        self._map[offset:offset + 8] = bytes(8)
+                self._resolve_locked(seqs)
+
+    def _resolve_locked(self, seqs):
+        # seqs at or below the watermark (overwritten, replayed) need no tracking
+        self._resolved.update(s for s in seqs if s > self.watermark)
+        w = self.watermark
+        while w + 1 in self._resolved:
+            w += 1
+            self._resolved.remove(w)
+        if w != self.watermark:
+            self.watermark = w
+            self._write_header()
+
+    def _write_header(self):
+        self._map[:_HEADER.size] = _HEADER.pack(MAGIC, _RECORD.size, self.capacity, self.watermark)
+
+    def sync(self, force: bool = False):
+        """msync the mapping if sync_interval_s has passed since the last one."""
+        with self._lock:
+            now = time.monotonic()
+            if self._map is not None and (force or now - self._last_sync >= self.sync_interval_s):
+                self._map.flush()
+                self._last_sync = now
+
+    # ── replay ────────────────────────────
+
+    def _records(self):
+        for i in range(self.capacity):
+            offset = _HEADER_SIZE + i * _RECORD.size
+            decoded = _decode(self._map[offset:offset + _RECORD.size])
+            if decoded is not None:
+                yield decoded
+
+    def pending(self) -> list:
+        """[(seq, row)] above the watermark, oldest first."""
+        with self._lock:
+            return sorted((r for r in self._records() if r[0] > self.watermark), key=lambda r: r[0])
+
+    def replay(self, db=None) -> int:
+        """Re-apply pending records to the database; returns the number of rows
+        written.  Rows the database already holds are skipped."""
+        pending = self.pending()
+        if not pending:
+            return 0
+        known = {}
+        rows = []
+        for _, row in pending:
+            node_id = row[1]
+            if node_id not in known:
+                known[node_id] = _held(database.get_node_history(node_id, db))
+            if not _stored(row, known[node_id]):
+                known[node_id][0].add(row)
+                rows.append(row)
+        written = database.add_many_to_db(rows, db) if rows else 0
+        with self._lock:
+            self._resolve_locked([seq for seq, _ in pending])
+            # anything older that was never resolved is gone from the ring by now
+            self.watermark = max(self.watermark, pending[-1][0])
+            self._resolved = {s for s in self._resolved if s > self.watermark}
+            self._write_header()
+        self.sync(force=True)
+        print(f"[db_journal] replayed {written} of {len(pending)} pending packets from {self.path}")
+        return written
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"next_seq": self.next_seq, "watermark": self.watermark,
+                    "unresolved": self.next_seq - 1 - self.watermark,
+                    "capacity": self.capacity, "overwritten": self.overwritten}
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH
+    db = sys.argv[2] if len(sys.argv) > 2 else None
+    database.init_db(db)
+    journal = PacketJournal(path)
+    journal.replay(db)
+    print(journal.stats())
+    journal.close()
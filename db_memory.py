@@ -0,0 +1,423 @@
+"""
+db_memory.py
+────────────
+Pure-Python storage backend (see db_backend.py).
+
+DictBackend keeps everything in process memory, with no SQL:
+
+  history        – {hour start ms: [(seq, time_ms, node_id, lat_e6, lon_e6, status)]},
+                   appended in seq order; retention drops whole hours,
+                   like the SQLite partitions
+  heartbeats     – {seq: (last_seen_ms, heartbeats)} for entries extended in
+                   heartbeat mode, and {(hour, node_id): entry} of the
+                   newest entry per node and hour, the one a repeat extends
+  rollups        – {hour start ms: [trail rows]}, {hour start ms: [hourly rows]}
+                   and {hour start ms: seq rolled up to} (db_rollup.py)
+  tracks         – {node_id: deque(maxlen=TRACK_SLOTS)} of history entries,
+                   the node_track ring
+  latest         – a NodeStateCache (node_cache.py), the node_latest table
+  notifications  – [(seq, Notif)] in seq (and id) order
+  read marks     – {username: seq}, "*" for users without one
+
+Values go through the same encoding as the SQLite backend (epoch ms,
+microdegrees), so both return identical rows.  Spatial and text queries
+are linear scans: fine for load tests and disposable kiosks, not for
+months of history.
+
+The auth tables need SQL; auth_connection() serves them from a private
+shared-cache in-memory SQLite database.
+"""
+
+import bisect
+import heapq
+import itertools
+import sqlite3
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+
+import db_rollup
+import node_cache
+from db_backend import (StorageBackend, circle_bbox, decode_time, encode_coord, encode_time,
+                        haversine_m, words)
+from db_connection import close_connections, get_connection
+from db_partitions import PARTITION_MS, TRACK_SLOTS, partition_start
+from notif_events import Notif
+
+_DEFAULT_READER = "*"
+_SEARCH_CANDIDATES = 500
+
+
+def _seq_key(entry: tuple) -> int:
+    return entry[0]
+
+
+class DictBackend(StorageBackend):
+    kind = "dict"
+
+    def __init__(self, name: str = "nodes"):
+        self.name = name
+        self._lock = threading.RLock()
+        self._seq = 0
+        self._history: dict[int, list] = {}
+        self._beats: dict[int, tuple] = {}
+        self._tails: dict[tuple, tuple] = {}
+        self._tracks: dict[int, deque] = {}
+        self._trail: dict[int, list] = {}
+        self._hourly: dict[int, list] = {}
+        self._rolled: dict[int, int] = {}
+        self._kept_from = 0     # oldest hour retention keeps (db_partitions.kept_from)
+        self.latest = node_cache.NodeStateCache()
+        self.latest.loaded = True
+        self._cursors: dict[str, int] = {}
+        self._notifs: list[tuple[int, Notif]] = []
+        self._next_id = 1
+        self._marks: dict[str, int] = {}
+        self._auth_path = f"file:safetrack-auth-{uuid.uuid4().hex[:8]}?mode=memory&cache=shared"
+        self._auth_keeper = sqlite3.connect(self._auth_path, uri=True, check_same_thread=False)
+
+    def __repr__(self):
+        return f"DictBackend({self.name!r})"
+
+    def close(self):
+        close_connections([self._auth_path])
+        if self._auth_keeper is not None:
+            self._auth_keeper.close()
+            self._auth_keeper = None
+
+    def auth_connection(self) -> sqlite3.Connection:
+        return get_connection(self._auth_path)
+
+    # ── nodes ─────────────────────────────
+
+    def init_db(self):
+        pass
+
+    def add_rows(self, rows: list) -> int:
+        encoded = []
+        for r in rows:
+            try:
+                encoded.append((encode_time(r[0]), r[1], encode_coord(r[2]), encode_coord(r[3]), r[4]))
+            except ValueError:
+                print(f"***ERROR: TIME FORMATTING FAILED (YYYY-MM-DD HH:MM:SS)*** {r}")
+        with self._lock:
+            expired = sum(1 for e in encoded if e[0] < self._kept_from)
+            if expired:
+                print(f"***ERROR: {expired} ROWS OLDER THAN THE RETENTION CUTOFF SKIPPED***")
+                encoded = [e for e in encoded if e[0] >= self._kept_from]
+            newest = {}     # node_id -> latest time_ms, including this batch
+            for e in encoded:
+                hour, node_id = partition_start(e[0]), e[1]
+                last = max(newest.get(node_id, e[0]), self.latest.time_ms(node_id) or e[0])
+                newest[node_id] = max(last, e[0])
+                if self.heartbeats and last <= e[0] and self._extend(hour, e):
+                    continue
+                self._seq += 1
+                entry = (self._seq,) + e
+                self._history.setdefault(hour, []).append(entry)
+                track = self._tracks.get(node_id)
+                if track is None:
+                    track = self._tracks[node_id] = deque(maxlen=TRACK_SLOTS)
+                track.append(entry)
+                tail = self._tails.get((hour, node_id))
+                if tail is None or e[0] >= tail[1]:
+                    self._tails[(hour, node_id)] = entry
+            self.latest.apply(encoded)
+        return len(encoded)
+
+    def delete_before_time(self, time: datetime, table: str):
+        time_ms = encode_time(time.isoformat())
+        with self._lock:
+            if table == "nodes":
+                # expiring hours are rolled up before they go
+                self.rollup(time)
+                # whole hours only, like db_partitions.drop_before
+                self._kept_from = max(self._kept_from, partition_start(time_ms))
+                expired = [h for h in self._history if h <= time_ms - PARTITION_MS]
+                for h in expired:
+                    for entry in self._history.pop(h):
+                        self._beats.pop(entry[0], None)
+                    self._rolled.pop(h, None)
+                self._tails = {k: v for k, v in self._tails.items() if k[0] in self._history}
+                self.latest.remove_before(partition_start(time_ms))
+                return len(expired)
+            elif table == "trail":
+                removed = 0
+                for h in [h for h in self._trail if h < time_ms]:
+                    kept = [r for r in self._trail[h] if r[1] >= time_ms]
+                    removed += len(self._trail[h]) - len(kept)
+                    if kept:
+                        self._trail[h] = kept
+                    else:
+                        del self._trail[h]
+                return removed
+            elif table == "notifications":
+                cutoff = time.strftime("%Y-%m-%d %H:%M:%S")
+                kept = [e for e in self._notifs if e[1].time >= cutoff]
+                removed = len(self._notifs) - len(kept)
+                self._notifs = kept
+                return removed
+
+    def _extend(self, hour: int, e: tuple) -> bool:
+        # heartbeat mode: same rule as db_sqlite._EXTEND_NODE
+        tail = self._tails.get((hour, e[1]))
+        if tail is None or tail[3:] != e[2:]:
+            return False
+        last_ms, beats = self._beats.get(tail[0], (tail[1], 0))
+        if last_ms > e[0]:
+            return False
+        self._beats[tail[0]] = (e[0], beats + 1)
+        return True
+
+    @staticmethod
+    def _row(entry: tuple) -> tuple:
+        _, time_ms, node_id, lat_e6, lon_e6, status = entry
+        return (decode_time(time_ms), node_id, lat_e6 / 1e6, lon_e6 / 1e6, status)
+
+    def _entries(self):
+        # every history entry in seq order
+        with self._lock:
+            parts = [list(self._history[h]) for h in sorted(self._history)]
+        return heapq.merge(*parts, key=_seq_key)
+
+    def get_history(self) -> list:
+        return [self._row(e) for e in sorted(self._entries(), key=lambda e: e[1])]
+
+    def get_latest(self) -> list:
+        return self.latest.rows()
+
+    def get_nodes(self) -> list:
+        return self.latest.node_ids()
+
+    def get_node_info(self, node_id: int) -> list:
+        rows = [e for e in self._entries() if e[2] == node_id]
+        rows.sort(key=lambda e: e[1], reverse=True)
+        return [self._row(e) for e in rows]
+
+    def get_node_history(self, node_id: int) -> list:
+        rows = [e for e in self._entries() if e[2] == node_id]
+        rows.sort(key=lambda e: e[1], reverse=True)
+        with self._lock:
+            beats = [self._beats.get(e[0], (e[1], 0)) for e in rows]
+        return [self._row(e) + (decode_time(b[0]), b[1]) for e, b in zip(rows, beats)]
+
+    def get_track(self, node_id: int, limit: int) -> list:
+        with self._lock:
+            entries = list(self._tracks.get(node_id, ()))
+        entries.sort(key=lambda e: (e[1], e[0]), reverse=True)    # time, then arrival
+        return [self._row(e) for e in entries[:limit]]
+
+    def get_recent_info(self, node_id: int) -> list:
+        row = self.latest.get(node_id)
+        return [row] if row is not None else []
+
+    def get_fleet_snapshot(self, node_ids=None) -> dict:
+        return self.latest.snapshot(node_ids)
+
+    # ── tiered history ────────────────────
+
+    def rollup(self, until: datetime) -> dict:
+        until_ms = encode_time(until.isoformat())
+        done = {"hours": 0, "trail_points": 0, "aggregates": 0}
+        with self._lock:
+            for hour in sorted(h for h in self._history if h + PARTITION_MS <= until_ms):
+                entries = self._history[hour]
+                if not entries:
+                    continue
+                top, rolled = entries[-1][0], self._rolled.get(hour)
+                if rolled is not None and top <= rolled:
+                    continue
+                self._rolled[hour] = top
+                if rolled is None and self._hourly.get(hour):
+                    continue    # late packets for an hour retention had already dropped
+                rows = []
+                for seq, time_ms, node_id, lat_e6, lon_e6, status in entries:
+                    last_seen, beats = self._beats.get(seq, (None, 0))
+                    rows.append((node_id, time_ms, lat_e6, lon_e6, status, last_seen, beats))
+                rows.sort(key=lambda r: (r[0], r[1]))     # stable: arrival order on ties
+                self._trail[hour], self._hourly[hour] = db_rollup.roll_hour(rows)
+                done["hours"] += 1
+                done["trail_points"] += len(self._trail[hour])
+                done["aggregates"] += len(self._hourly[hour])
+        return done
+
+    def get_trail(self, node_id: int, since_ms: int, until_ms: int) -> list:
+        with self._lock:
+            rows = [r for h in sorted(self._trail) if since_ms - PARTITION_MS < h < until_ms
+                    for r in self._trail[h] if r[0] == node_id and since_ms <= r[1] < until_ms]
+        return [(decode_time(t), n, lat / 1e6, lon / 1e6, status) for n, t, lat, lon, status in rows]
+
+    def get_hourly(self, node_id: int, since_ms: int, until_ms: int) -> list:
+        with self._lock:
+            rows = [r for h in sorted(self._hourly) if since_ms <= h < until_ms
+                    for r in self._hourly[h] if r[0] == node_id]
+        return [(decode_time(r[1]), r[0], r[2], decode_time(r[3]), decode_time(r[4]))
+                + tuple(v / 1e6 for v in r[5:11]) + r[11:] for r in rows]
+
+    # ── spatial ───────────────────────────
+
+    def get_nodes_in_bbox(self, min_lat, min_lon, max_lat, max_lon) -> dict:
+        def inside(lat, lon):
+            if not min_lat <= lat <= max_lat:
+                return False
+            if min_lon <= max_lon:
+                return min_lon <= lon <= max_lon
+            return lon >= min_lon or lon <= max_lon     # wraps across the antimeridian
+        return {n: v for n, v in self.latest.snapshot().items() if inside(v[0], v[1])}
+
+    def get_nodes_within(self, lat, lon, radius_m) -> list:
+        found = []
+        for n, (nlat, nlon, _) in self.get_nodes_in_bbox(*circle_bbox(lat, lon, radius_m)).items():
+            d = haversine_m(lat, lon, nlat, nlon)
+            if d <= radius_m:
+                found.append((n, d))
+        found.sort(key=lambda f: f[1])
+        return found
+
+    # ── change feed ───────────────────────
+
+    def get_changes_since(self, seq: int, limit: int, kinds: tuple) -> list:
+        events = []
+        if "node" in kinds:
+            newer = (e for e in self._entries() if e[0] > seq)
+            events += [(e[0], "node", self._row(e)) for e in itertools.islice(newer, limit)]
+        if "notification" in kinds:
+            with self._lock:
+                mark = self._mark(None)
+                start = bisect.bisect_right(self._notifs, seq, key=_seq_key)
+                events += [(s, "notification", n._replace(is_read=int(s <= mark)))
+                           for s, n in self._notifs[start:start + limit]]
+        events.sort(key=lambda e: e[0])
+        return events[:limit]
+
+    def get_latest_seq(self) -> int:
+        return self._seq
+
+    def get_db_at(self, seq: int) -> list:
+        latest = {}
+        for e in self._entries():
+            if e[0] > seq:
+                break
+            latest[e[2]] = e    # highest seq wins, as in the SQLite query
+        return [self._row(latest[n]) for n in sorted(latest)]
+
+    def get_cursor(self, consumer: str):
+        return self._cursors.get(consumer)
+
+    def save_cursor(self, consumer: str, seq: int):
+        self._cursors[consumer] = seq
+
+    # ── notifications ─────────────────────
+
+    def init_notif_db(self):
+        pass
+
+    def _mark(self, username) -> int:
+        return self._marks.get(username or _DEFAULT_READER, self._marks.get(_DEFAULT_READER, 0))
+
+    def _read(self, username) -> list:
+        # [(seq, Notif)] with is_read for username
+        with self._lock:
+            mark = self._mark(username)
+            return [(s, n._replace(is_read=int(s <= mark))) for s, n in self._notifs]
+
+    def add_notif(self, n: Notif) -> int:
+        # positions rounded to microdegrees, as stored by the SQLite backend
+        coords = [encode_coord(c) / 1e6 if c is not None else None for c in (n.lat, n.lon)]
+        with self._lock:
+            self._seq += 1
+            notif_id, self._next_id = self._next_id, self._next_id + 1
+            self._notifs.append((self._seq, n._replace(is_read=0, id=notif_id, lat=coords[0], lon=coords[1])))
+            return notif_id
+
+    def mark_notifs_read(self, username, up_to_seq):
+        with self._lock:
+            if up_to_seq is None:
+                up_to_seq = self._seq
+            key = username or _DEFAULT_READER
+            if up_to_seq > self._marks.get(key, 0):
+                self._marks[key] = up_to_seq
+
+    def notif_seq(self, notif_id: int):
+        with self._lock:
+            return next((s for s, n in self._notifs if n.id == notif_id), None)
+
+    def get_notifs(self, username=None, unread_only=False, newest_first=False) -> list:
+        rows = [n for _, n in self._read(username) if not (unread_only and n.is_read)]
+        return rows[::-1] if newest_first else rows
+
+    def get_unread_count(self, category, username) -> int:
+        with self._lock:
+            start = bisect.bisect_right(self._notifs, self._mark(username), key=_seq_key)
+            unread = self._notifs[start:]
+        if category is None:
+            return len(unread)
+        return sum(1 for _, n in unread if n.status == category)
+
+    def get_unread_counts(self, username) -> dict:
+        counts = {}
+        for n in self.get_notifs(username, unread_only=True):
+            counts[n.status] = counts.get(n.status, 0) + 1
+        return counts
+
+    def _filtered(self, username, category=None, node_ids=None, since=None, until=None,
+                  unread_only=False) -> list:
+        node_ids = set(node_ids) if node_ids is not None else None
+        return [n for _, n in self._read(username)
+                if (category is None or n.status == category)
+                and (node_ids is None or n.node_id in node_ids)
+                and (since is None or n.time >= since)
+                and (until is None or n.time < until)
+                and not (unread_only and n.is_read)]
+
+    def get_notifs_page(self, before_time, before_id, limit, category, node_ids, since, until,
+                        unread_only, username) -> list:
+        rows = self._filtered(username, category, node_ids, since, until, unread_only)
+        if before_time is not None:
+            if before_id is None:
+                rows = [n for n in rows if n.time < before_time]
+            else:
+                rows = [n for n in rows if (n.time, n.id) < (before_time, before_id)]
+        rows.sort(key=lambda n: (n.time, n.id), reverse=True)
+        return rows[:limit]
+
+    def search_notifs(self, terms: list, limit, category, node_ids, since, username) -> list:
+        # the newest rows containing every term, like the FTS candidate query;
+        # database.search_notifs ranks them
+        found = []
+        for n in reversed(self._filtered(username, category, node_ids, since)):
+            text = set(words(n.title or "")) | set(words(n.message or ""))
+            if all(t in text for t in terms):
+                found.append(n)
+                if len(found) >= _SEARCH_CANDIDATES:
+                    break
+        return found
+
+    def get_notifs_within(self, lat, lon, radius_m, since, limit, username) -> list:
+        rows = [n for n in self._filtered(username, since=since)
+                if n.lat is not None and n.lon is not None and haversine_m(lat, lon, n.lat, n.lon) <= radius_m]
+        rows.sort(key=lambda n: (n.time, n.id), reverse=True)
+        return rows[:limit]
+
+    def get_logs(self) -> list:
+        return sorted(self.get_notifs(), key=lambda n: (n.time, n.id), reverse=True)
+
+    # ── testing only ──────────────────────
+
+    def clear_nodes(self):
+        with self._lock:
+            self._history.clear()
+            self._beats.clear()
+            self._tails.clear()
+            self._tracks.clear()
+            self._trail.clear()
+            self._hourly.clear()
+            self._rolled.clear()
+            self._kept_from = 0
+            self.latest.invalidate()
+            self.latest.loaded = True
+
+    def clear_notifs(self):
+        with self._lock:
+            self._notifs.clear()
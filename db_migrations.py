@@ -0,0 +1,682 @@
+"""
+db_migrations.py
+────────────────
+Versioned schema migrations for nodes.db.
+
+Since migration 14 notifications and auth live in files of their own
+(db_files.py); the steps before it describe the single-file layout they
+were written for.
+
+The schema version lives in SQLite's own `PRAGMA user_version`.  At
+startup migrate() applies every numbered migration above that version,
+each inside a single IMMEDIATE transaction, so a crash mid-migration
+leaves the previous version intact and two processes starting at once
+cannot both apply the same step.
+
+Append new migrations to MIGRATIONS – never edit or renumber one that
+has shipped.  A step is either an SQL string or a callable taking the
+connection, for migrations that need dynamic DDL.
+
+check_query_plans() runs EXPLAIN QUERY PLAN over the hot queries in
+db_sqlite.py and reports any that fall back to a full scan or a temp
+b-tree sort.  `python db_migrations.py [db]` migrates and prints it.
+"""
+
+import sys
+
+import db_files
+import db_partitions
+from db_connection import get_connection
+from notif_events import Event
+
+
+# ──────────────────────────────────────
+# SHARED DDL
+# ──────────────────────────────────────
+
+# node_latest upsert trigger.  DROP TABLE nodes drops it, so every
+# migration that rebuilds nodes recreates the trigger for its layout.
+# (time TEXT / REAL degrees / TEXT status – migrations 2-4)
+_LATEST_TRIGGER_V2 = """
+CREATE TRIGGER IF NOT EXISTS nodes_latest_upsert
+AFTER INSERT ON nodes
+BEGIN
+    INSERT INTO node_latest (node_id, time, latitude, longitude, status)
+    VALUES (NEW.node_id, NEW.time, NEW.latitude, NEW.longitude, NEW.status)
+    ON CONFLICT(node_id) DO UPDATE SET
+        time = excluded.time,
+        latitude = excluded.latitude,
+        longitude = excluded.longitude,
+        status = excluded.status
+    WHERE excluded.time >= node_latest.time;
+END
+"""
+
+# (epoch ms / int32 microdegrees / status id – migration 5 onwards)
+LATEST_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS nodes_latest_upsert
+AFTER INSERT ON nodes
+BEGIN
+    INSERT INTO node_latest (node_id, time_ms, lat_e6, lon_e6, status_id)
+    VALUES (NEW.node_id, NEW.time_ms, NEW.lat_e6, NEW.lon_e6, NEW.status_id)
+    ON CONFLICT(node_id) DO UPDATE SET
+        time_ms = excluded.time_ms,
+        lat_e6 = excluded.lat_e6,
+        lon_e6 = excluded.lon_e6,
+        status_id = excluded.status_id
+    WHERE excluded.time_ms >= node_latest.time_ms;
+END
+"""
+
+# Seeded status ids; other strings get an id on first use.
+STATUS_SEED = ((1, "SOS"), (2, "active"), (3, "inactive"))
+
+
+def _partition_nodes(conn):
+    """Move the single nodes table into hourly partitions (migration 6)."""
+    db_partitions.create_catalogue(conn)
+    starts = [r[0] for r in conn.execute(
+        f"SELECT DISTINCT time_ms - time_ms % {db_partitions.PARTITION_MS} FROM nodes")]
+    for start in starts:
+        name = db_partitions.create_partition(conn, start)
+        conn.execute(f"""INSERT INTO {name} (time_ms, node_id, lat_e6, lon_e6, status_id)
+                         SELECT time_ms, node_id, lat_e6, lon_e6, status_id FROM nodes
+                         WHERE time_ms >= ? AND time_ms < ? ORDER BY id""",
+                     (start, start + db_partitions.PARTITION_MS))
+    conn.execute("DROP TABLE nodes")
+    db_partitions.rebuild_view(conn)
+
+
+# Notifications take their sequence number from a trigger, on insert and
+# whenever the read flag changes (low volume; node packets are numbered
+# in db_sqlite.SQLiteBackend._insert_encoded instead).
+_NOTIF_SEQ_TRIGGERS = tuple(f"""
+CREATE TRIGGER IF NOT EXISTS notifications_seq_{event}
+AFTER {clause} ON notifications
+BEGIN
+    UPDATE change_seq SET seq = seq + 1;
+    UPDATE notifications SET seq = (SELECT seq FROM change_seq) WHERE id = NEW.id;
+END
+""" for event, clause in (("insert", "INSERT"), ("read", "UPDATE OF is_read")))
+
+
+# node_rtree mirrors the position in node_latest.  Packets that do not
+# move the node leave the R*Tree alone.
+_RTREE_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS node_latest_rtree_insert
+       AFTER INSERT ON node_latest
+       BEGIN
+           INSERT OR REPLACE INTO node_rtree VALUES (NEW.node_id, NEW.lat_e6, NEW.lat_e6, NEW.lon_e6, NEW.lon_e6);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS node_latest_rtree_update
+       AFTER UPDATE OF lat_e6, lon_e6 ON node_latest
+       WHEN NEW.lat_e6 != OLD.lat_e6 OR NEW.lon_e6 != OLD.lon_e6
+       BEGIN
+           UPDATE node_rtree SET min_lat = NEW.lat_e6, max_lat = NEW.lat_e6,
+                                 min_lon = NEW.lon_e6, max_lon = NEW.lon_e6
+           WHERE node_id = NEW.node_id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS node_latest_rtree_delete
+       AFTER DELETE ON node_latest
+       BEGIN
+           DELETE FROM node_rtree WHERE node_id = OLD.node_id;
+       END""",
+)
+
+
+# notif_unread holds the number of unread notifications per category
+# (the status column).  Every path that adds, reads or deletes a
+# notification goes through one of these triggers.
+_UNREAD_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS notifications_unread_insert
+       AFTER INSERT ON notifications
+       WHEN NEW.is_read = 0
+       BEGIN
+           INSERT INTO notif_unread (category, count) VALUES (IFNULL(NEW.status, ''), 1)
+           ON CONFLICT(category) DO UPDATE SET count = count + 1;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS notifications_unread_update
+       AFTER UPDATE OF is_read, status ON notifications
+       BEGIN
+           UPDATE notif_unread SET count = count - 1
+           WHERE OLD.is_read = 0 AND category = IFNULL(OLD.status, '');
+           INSERT INTO notif_unread (category, count) SELECT IFNULL(NEW.status, ''), 1 WHERE NEW.is_read = 0
+           ON CONFLICT(category) DO UPDATE SET count = count + 1;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS notifications_unread_delete
+       AFTER DELETE ON notifications
+       WHEN OLD.is_read = 0
+       BEGIN
+           UPDATE notif_unread SET count = count - 1 WHERE category = IFNULL(OLD.status, '');
+       END""",
+)
+
+
+# notif_fts is an external-content FTS5 index over notifications
+# (Title, Message); these triggers keep it in step, including the
+# deletes done by retention.
+_FTS_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS notifications_fts_insert
+       AFTER INSERT ON notifications
+       BEGIN
+           INSERT INTO notif_fts (rowid, Title, Message) VALUES (NEW.id, NEW.Title, NEW.Message);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS notifications_fts_delete
+       AFTER DELETE ON notifications
+       BEGIN
+           INSERT INTO notif_fts (notif_fts, rowid, Title, Message)
+           VALUES ('delete', OLD.id, OLD.Title, OLD.Message);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS notifications_fts_update
+       AFTER UPDATE OF Title, Message ON notifications
+       BEGIN
+           INSERT INTO notif_fts (notif_fts, rowid, Title, Message)
+           VALUES ('delete', OLD.id, OLD.Title, OLD.Message);
+           INSERT INTO notif_fts (rowid, Title, Message) VALUES (NEW.id, NEW.Title, NEW.Message);
+       END""",
+)
+
+
+# Read state is a watermark per user in notif_read_marks: every
+# notification with seq <= marks.seq has been read.  `marked` is how many
+# of the notifications ever inserted (notif_stats.inserted) that user has
+# read or seen deleted, so unread = inserted - marked without a scan.  The
+# "*" row is the default for users who have never marked anything.
+_READ_MARK_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS notifications_stats_insert
+       AFTER INSERT ON notifications
+       BEGIN
+           UPDATE notif_stats SET inserted = inserted + 1;
+       END""",
+    # an unread notification removed by retention is no longer unread
+    """CREATE TRIGGER IF NOT EXISTS notifications_marks_delete
+       AFTER DELETE ON notifications
+       BEGIN
+           UPDATE notif_read_marks SET marked = marked + 1 WHERE seq < OLD.seq;
+       END""",
+)
+
+
+# Per-category unread counts on top of the read marks: notif_category_stats
+# counts the notifications ever inserted per status, notif_category_marks
+# holds each reader's per-status share of `marked` (snapshot taken by
+# mark_notifs_read, bumped here when an unread one is deleted), so
+# unread[status] = inserted - marked as well.  Rows without a status only
+# count towards the total.
+_CATEGORY_COUNTERS = (
+    """CREATE TABLE IF NOT EXISTS notif_category_stats
+       (category TEXT PRIMARY KEY, inserted INTEGER NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS notif_category_marks
+       (username TEXT NOT NULL, category TEXT NOT NULL, marked INTEGER NOT NULL,
+        PRIMARY KEY (username, category)) WITHOUT ROWID""",
+    "DELETE FROM notif_category_stats",
+    """INSERT INTO notif_category_stats (category, inserted)
+       SELECT status, COUNT(*) FROM notifications WHERE status IS NOT NULL GROUP BY status""",
+    "DELETE FROM notif_category_marks",
+    """INSERT INTO notif_category_marks (username, category, marked)
+       SELECT m.username, n.status, COUNT(*) FROM notif_read_marks m JOIN notifications n ON n.seq <= m.seq
+       WHERE n.status IS NOT NULL GROUP BY m.username, n.status""",
+    """CREATE TRIGGER IF NOT EXISTS notifications_category_insert
+       AFTER INSERT ON notifications WHEN NEW.status IS NOT NULL
+       BEGIN
+           INSERT INTO notif_category_stats (category, inserted) VALUES (NEW.status, 1)
+           ON CONFLICT(category) DO UPDATE SET inserted = inserted + 1;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS notifications_category_delete
+       AFTER DELETE ON notifications WHEN OLD.status IS NOT NULL
+       BEGIN
+           INSERT INTO notif_category_marks (username, category, marked)
+           SELECT username, OLD.status, 1 FROM notif_read_marks WHERE seq < OLD.seq
+           ON CONFLICT(username, category) DO UPDATE SET marked = marked + 1;
+       END""",
+)
+
+# The notifications file's own change_seq: add_notif() persists the seqs it
+# takes there, so a notification insert no longer writes (and locks) the
+# telemetry file.  Numbers still come from one counter (db_sqlite
+# SQLiteBackend._next_seq); qualified, since tel.change_seq is attached.
+_NOTIF_CHANGE_SEQ = (
+    """CREATE TABLE IF NOT EXISTS main.change_seq
+       (id INTEGER PRIMARY KEY CHECK (id = 0), seq INTEGER NOT NULL)""",
+    "INSERT OR IGNORE INTO main.change_seq (id, seq) SELECT 0, IFNULL(MAX(seq), 0) FROM notifications",
+)
+
+
+def _on_notifications(*steps):
+    """Migration step running *steps* on the notifications file (db_files.py)
+    in a transaction of its own.  The telemetry file's user_version is only
+    bumped afterwards, so the steps must be safe to run twice."""
+    def step(conn):
+        nconn = db_files.notif_connection(conn.path)
+        if nconn.in_transaction:
+            nconn.commit()
+        # deferred, as in db_files._copy: IMMEDIATE would also lock the
+        # attached telemetry file, which the migration already holds
+        nconn.execute("BEGIN")
+        try:
+            for sql in steps:
+                nconn.execute(sql)
+            nconn.commit()
+        except Exception:
+            nconn.rollback()
+            raise
+    return step
+
+
+def _add_change_seq(conn):
+    """Number existing history and notifications for the change feed (migration 7)."""
+    conn.execute("""CREATE TABLE change_seq
+                    (id INTEGER PRIMARY KEY CHECK (id = 0), seq INTEGER NOT NULL)""")
+    conn.execute("INSERT INTO change_seq (id, seq) VALUES (0, 0)")
+    # existing rows are numbered in insertion order: oldest partition first,
+    # then notifications.  Partitions created by migration 6 already have
+    # the column (db_partitions._COLUMN_DEFS).
+    tables = [db_partitions.TEMPLATE_TABLE]
+    tables += [r[0] for r in conn.execute("SELECT name FROM node_partitions ORDER BY start_ms")]
+    tables.append("notifications")
+    for table in tables:
+        columns = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+        if "seq" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN seq INTEGER")
+        conn.execute(f"UPDATE {table} SET seq = id + (SELECT seq FROM change_seq)")
+        conn.execute(f"UPDATE change_seq SET seq = seq + (SELECT COALESCE(MAX(id), 0) FROM {table})")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_seq ON {table} (seq)")
+    db_partitions.rebuild_view(conn)
+
+
+# ──────────────────────────────────────
+# MIGRATIONS  (version, description, steps)
+# ──────────────────────────────────────
+
+MIGRATIONS = [
+    (1, "base nodes / notifications tables", (
+        """CREATE TABLE IF NOT EXISTS nodes
+           (time TEXT, node_id INTEGER, latitude REAL, longitude REAL, status TEXT)""",
+        """CREATE TABLE IF NOT EXISTS notifications
+           (time TEXT, node_id INTEGER, status TEXT, Title TEXT, Message TEXT,
+            is_read INTEGER DEFAULT 0)""",
+    )),
+
+    (2, "node_latest snapshot table kept by trigger", (
+        """CREATE TABLE IF NOT EXISTS node_latest
+           (node_id INTEGER PRIMARY KEY, time TEXT, latitude REAL,
+            longitude REAL, status TEXT)""",
+        _LATEST_TRIGGER_V2,
+        """INSERT OR IGNORE INTO node_latest (node_id, time, latitude, longitude, status)
+           SELECT node_id, time, latitude, longitude, status
+           FROM (SELECT *, MAX(time) FROM nodes GROUP BY node_id)""",
+    )),
+
+    (3, "explicit rowid keys on nodes and notifications", (
+        """CREATE TABLE nodes_new
+           (id INTEGER PRIMARY KEY, time TEXT, node_id INTEGER,
+            latitude REAL, longitude REAL, status TEXT)""",
+        """INSERT INTO nodes_new (time, node_id, latitude, longitude, status)
+           SELECT time, node_id, latitude, longitude, status FROM nodes ORDER BY rowid""",
+        "DROP TABLE nodes",
+        "ALTER TABLE nodes_new RENAME TO nodes",
+        _LATEST_TRIGGER_V2,
+        """CREATE TABLE notifications_new
+           (id INTEGER PRIMARY KEY, time TEXT, node_id INTEGER, status TEXT,
+            Title TEXT, Message TEXT, is_read INTEGER NOT NULL DEFAULT 0)""",
+        """INSERT INTO notifications_new (time, node_id, status, Title, Message, is_read)
+           SELECT time, node_id, status, Title, Message, COALESCE(is_read, 0)
+           FROM notifications ORDER BY rowid""",
+        "DROP TABLE notifications",
+        "ALTER TABLE notifications_new RENAME TO notifications",
+    )),
+
+    (4, "indexes for per-node history, unread notifications and retention", (
+        "CREATE INDEX IF NOT EXISTS idx_nodes_node_time ON nodes (node_id, time)",
+        "CREATE INDEX IF NOT EXISTS idx_nodes_time ON nodes (time)",
+        "CREATE INDEX IF NOT EXISTS idx_notif_read_time ON notifications (is_read, time)",
+        "CREATE INDEX IF NOT EXISTS idx_notif_time ON notifications (time)",
+        "CREATE INDEX IF NOT EXISTS idx_node_latest_time ON node_latest (time)",
+    )),
+
+    (5, "compact rows: epoch ms, int32 microdegrees, status lookup table", (
+        """CREATE TABLE node_status
+           (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)""",
+        "INSERT INTO node_status (id, name) VALUES "
+        + ", ".join(f"({i}, '{name}')" for i, name in STATUS_SEED),
+        """INSERT OR IGNORE INTO node_status (name)
+           SELECT DISTINCT status FROM nodes WHERE status IS NOT NULL""",
+        # naive wall-clock times are stored as if UTC so they round-trip exactly
+        """CREATE TABLE nodes_new
+           (id INTEGER PRIMARY KEY,
+            time_ms INTEGER NOT NULL,
+            node_id INTEGER NOT NULL,
+            lat_e6 INTEGER NOT NULL,
+            lon_e6 INTEGER NOT NULL,
+            status_id INTEGER NOT NULL REFERENCES node_status (id))""",
+        """INSERT INTO nodes_new (id, time_ms, node_id, lat_e6, lon_e6, status_id)
+           SELECT n.id,
+                  CAST(round((julianday(n.time) - 2440587.5) * 86400000) AS INTEGER),
+                  n.node_id,
+                  CAST(round(n.latitude * 1000000) AS INTEGER),
+                  CAST(round(n.longitude * 1000000) AS INTEGER),
+                  s.id
+           FROM nodes n JOIN node_status s ON s.name = n.status
+           WHERE julianday(n.time) IS NOT NULL
+           ORDER BY n.id""",
+        "DROP TABLE nodes",
+        "ALTER TABLE nodes_new RENAME TO nodes",
+        "CREATE INDEX idx_nodes_node_time ON nodes (node_id, time_ms)",
+        "CREATE INDEX idx_nodes_time ON nodes (time_ms)",
+        "DROP TABLE node_latest",
+        """CREATE TABLE node_latest
+           (node_id INTEGER PRIMARY KEY,
+            time_ms INTEGER NOT NULL,
+            lat_e6 INTEGER NOT NULL,
+            lon_e6 INTEGER NOT NULL,
+            status_id INTEGER NOT NULL)""",
+        """INSERT INTO node_latest (node_id, time_ms, lat_e6, lon_e6, status_id)
+           SELECT node_id, time_ms, lat_e6, lon_e6, status_id
+           FROM (SELECT *, MAX(time_ms) FROM nodes GROUP BY node_id)""",
+        "CREATE INDEX idx_node_latest_time ON node_latest (time_ms)",
+        LATEST_TRIGGER,
+    )),
+
+    (6, "hourly partitions for node history behind a nodes view", (
+        _partition_nodes,
+    )),
+
+    (7, "change feed: sequence numbers and persistent consumer cursors", (
+        _add_change_seq,
+        *_NOTIF_SEQ_TRIGGERS,
+        """CREATE TABLE feed_cursors
+           (consumer TEXT PRIMARY KEY, seq INTEGER NOT NULL)""",
+    )),
+
+    (8, "R*Tree spatial index over latest node positions", (
+        # integer microdegrees, same as node_latest, so boxes are exact
+        """CREATE VIRTUAL TABLE node_rtree USING rtree_i32
+           (node_id, min_lat, max_lat, min_lon, max_lon)""",
+        """INSERT INTO node_rtree SELECT node_id, lat_e6, lat_e6, lon_e6, lon_e6 FROM node_latest""",
+        *_RTREE_TRIGGERS,
+    )),
+
+    (9, "unread notification counters kept by triggers", (
+        """CREATE TABLE notif_unread
+           (category TEXT PRIMARY KEY, count INTEGER NOT NULL)""",
+        """INSERT INTO notif_unread (category, count)
+           SELECT IFNULL(status, ''), COUNT(*) FROM notifications WHERE is_read = 0
+           GROUP BY IFNULL(status, '')""",
+        *_UNREAD_TRIGGERS,
+    )),
+
+    (10, "index for category-filtered notification pages", (
+        "CREATE INDEX IF NOT EXISTS idx_notif_status_time ON notifications (status, time)",
+    )),
+
+    (11, "FTS5 full-text index over notification titles and messages", (
+        """CREATE VIRTUAL TABLE notif_fts USING fts5
+           (Title, Message, content='notifications', content_rowid='id')""",
+        "INSERT INTO notif_fts (notif_fts) VALUES ('rebuild')",
+        *_FTS_TRIGGERS,
+    )),
+
+    (12, "per-user read watermarks replace the global is_read flag", (
+        "DROP TRIGGER IF EXISTS notifications_unread_insert",
+        "DROP TRIGGER IF EXISTS notifications_unread_update",
+        "DROP TRIGGER IF EXISTS notifications_unread_delete",
+        "DROP TRIGGER IF EXISTS notifications_seq_read",
+        "DROP TABLE notif_unread",
+        "DROP INDEX IF EXISTS idx_notif_read_time",
+        "CREATE INDEX idx_notif_status_seq ON notifications (status, seq)",
+        """CREATE TABLE notif_stats
+           (id INTEGER PRIMARY KEY CHECK (id = 0), inserted INTEGER NOT NULL)""",
+        "INSERT INTO notif_stats (id, inserted) SELECT 0, COUNT(*) FROM notifications",
+        """CREATE TABLE notif_read_marks
+           (username TEXT PRIMARY KEY, seq INTEGER NOT NULL, marked INTEGER NOT NULL)""",
+        # everyone starts from the old global state: read up to the newest
+        # notification that had been marked read
+        """INSERT INTO notif_read_marks (username, seq, marked)
+           SELECT '*', w.seq, (SELECT COUNT(*) FROM notifications WHERE seq <= w.seq)
+           FROM (SELECT IFNULL(MAX(seq), 0) AS seq FROM notifications WHERE is_read != 0) w""",
+        *_READ_MARK_TRIGGERS,
+    )),
+
+    (13, "structured notifications: event type, position and statuses", (
+        """CREATE TABLE notif_event_types
+           (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)""",
+        "INSERT INTO notif_event_types (id, name) VALUES "
+        + ", ".join(f"({e.value}, '{e.name.lower()}')" for e in Event),
+        # existing rows stay CUSTOM (0) and keep their text; new rows leave
+        # Title / Message NULL and are rendered by notif_events on read
+        "ALTER TABLE notifications ADD COLUMN event INTEGER NOT NULL DEFAULT 0 REFERENCES notif_event_types (id)",
+        "ALTER TABLE notifications ADD COLUMN lat_e6 INTEGER",
+        "ALTER TABLE notifications ADD COLUMN lon_e6 INTEGER",
+        "ALTER TABLE notifications ADD COLUMN old_status_id INTEGER REFERENCES node_status (id)",
+        "ALTER TABLE notifications ADD COLUMN new_status_id INTEGER REFERENCES node_status (id)",
+        # the text index now holds the rendered text itself (written by
+        # db_sqlite.SQLiteBackend.add_notif); rows leave it by rowid
+        "DROP TRIGGER notifications_fts_insert",
+        "DROP TRIGGER notifications_fts_delete",
+        "DROP TRIGGER notifications_fts_update",
+        "DROP TABLE notif_fts",
+        "CREATE VIRTUAL TABLE notif_fts USING fts5 (Title, Message)",
+        "INSERT INTO notif_fts (rowid, Title, Message) SELECT id, Title, Message FROM notifications",
+        """CREATE TRIGGER notifications_fts_delete
+           AFTER DELETE ON notifications
+           BEGIN
+               DELETE FROM notif_fts WHERE rowid = OLD.id;
+           END""",
+    )),
+
+    (14, "notifications and auth move to their own database files", (
+        # copies them out (replacing any half-finished earlier copy), then
+        # drops them here; notifications are numbered by the writer from now on
+        db_files.move_out,
+    )),
+
+    (15, "last_seen_ms / heartbeats on node history (heartbeat mode)", (
+        db_partitions.add_heartbeat_columns,
+    )),
+
+    (16, "node_track: last TRACK_SLOTS positions per node", (
+        db_partitions.add_tracks,
+    )),
+
+    (17, "node_trail / node_hourly rollup tiers (db_rollup.py)", (
+        """CREATE TABLE node_trail
+           (node_id INTEGER NOT NULL,
+            time_ms INTEGER NOT NULL,
+            lat_e6 INTEGER NOT NULL,
+            lon_e6 INTEGER NOT NULL,
+            status_id INTEGER NOT NULL,
+            PRIMARY KEY (node_id, time_ms)) WITHOUT ROWID""",
+        # trail retention and per-hour replacement
+        "CREATE INDEX node_trail_time ON node_trail (time_ms)",
+        """CREATE TABLE node_hourly
+           (node_id INTEGER NOT NULL,
+            hour_ms INTEGER NOT NULL,
+            packets INTEGER NOT NULL,
+            first_ms INTEGER NOT NULL,
+            last_ms INTEGER NOT NULL,
+            min_lat_e6 INTEGER NOT NULL,
+            min_lon_e6 INTEGER NOT NULL,
+            max_lat_e6 INTEGER NOT NULL,
+            max_lon_e6 INTEGER NOT NULL,
+            lat_e6 INTEGER NOT NULL,
+            lon_e6 INTEGER NOT NULL,
+            status_id INTEGER NOT NULL,
+            distance_m REAL NOT NULL,
+            PRIMARY KEY (node_id, hour_ms)) WITHOUT ROWID""",
+        "CREATE INDEX node_hourly_hour ON node_hourly (hour_ms)",
+        # highest seq of the partition when it was last rolled up; NULL = never
+        "ALTER TABLE node_partitions ADD COLUMN rolled_seq INTEGER",
+    )),
+
+    (18, "node_retention: oldest hour of node history still kept", (
+        """CREATE TABLE node_retention
+           (id INTEGER PRIMARY KEY CHECK (id = 0), kept_from_ms INTEGER NOT NULL)""",
+        # nothing dropped yet as far as this version knows
+        "INSERT INTO node_retention (id, kept_from_ms) VALUES (0, 0)",
+    )),
+
+    (19, "per-category unread counters next to the read marks (notifications file)", (
+        _on_notifications(*_CATEGORY_COUNTERS),
+    )),
+
+    (20, "change_seq in the notifications file (notification seqs no longer lock telemetry)", (
+        _on_notifications(*_NOTIF_CHANGE_SEQ),
+    )),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(db: str = "nodes.db") -> int:
+    return get_connection(db).execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db: str = "nodes.db") -> int:
+    """Bring *db* up to LATEST_VERSION. Returns the resulting version."""
+    conn = get_connection(db)
+    if conn.in_transaction:
+        conn.commit()
+    for version, description, steps in MIGRATIONS:
+        if get_version(db) >= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # another process may have migrated while we waited for the lock
+            if get_version(db) >= version:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"[db_migrations] {db}: applied {version} ({description})")
+    return get_version(db)
+
+
+# ──────────────────────────────────────
+# QUERY PLAN CHECK
+# ──────────────────────────────────────
+
+# name -> (sql, sample params); keep in sync with db_sqlite.py.
+# Current-state reads (get_db, get_recent_info, get_fleet_snapshot) are
+# served from node_cache and never reach SQLite after warm-up.
+_NOTIF_SELECT = ("SELECT n.time, n.node_id, n.status, n.Title, n.Message, n.seq <= ?, n.id, "
+                 "n.event, n.lat_e6, n.lon_e6, so.name, sn.name "
+                 "FROM notifications n LEFT JOIN node_status so ON so.id = n.old_status_id "
+                 "LEFT JOIN node_status sn ON sn.id = n.new_status_id ")
+
+HOT_QUERIES = {
+    "get_node_info": (
+        "SELECT n.time_ms, s.name FROM nodes n JOIN node_status s ON s.id = n.status_id "
+        "WHERE n.node_id = ? ORDER BY n.time_ms DESC", (1,)),
+    "add_rows(heartbeat)": (
+        "SELECT id FROM nodes_template WHERE node_id = ? ORDER BY time_ms DESC, id DESC LIMIT 1", (1,)),
+    "get_track": (
+        "SELECT n.time_ms, n.n, s.name FROM node_track n JOIN node_status s ON s.id = n.status_id "
+        "WHERE n.node_id = ?", (1,)),
+    "get_trail": (
+        "SELECT n.time_ms, s.name FROM node_trail n JOIN node_status s ON s.id = n.status_id "
+        "WHERE n.node_id = ? AND n.time_ms >= ? AND n.time_ms < ? ORDER BY n.time_ms", (1, 0, 2 ** 62)),
+    "get_hourly": (
+        "SELECT n.hour_ms, s.name FROM node_hourly n JOIN node_status s ON s.id = n.status_id "
+        "WHERE n.node_id = ? AND n.hour_ms >= ? AND n.hour_ms < ? ORDER BY n.hour_ms", (1, 0, 2 ** 62)),
+    "rollup(replace hour)": (
+        "DELETE FROM node_trail WHERE time_ms >= ? AND time_ms < ?", (0, 3_600_000)),
+    "delete_before_time(trail)": (
+        "DELETE FROM node_trail WHERE time_ms < ?", (0,)),
+    "get_changes_since(nodes)": (
+        "SELECT n.seq, n.time_ms, s.name FROM nodes n JOIN node_status s ON s.id = n.status_id "
+        "WHERE n.seq > ? ORDER BY n.seq LIMIT ?", (0, 1000)),
+    "get_nodes_in_bbox": (
+        "SELECT l.node_id, l.lat_e6, l.lon_e6, s.name FROM node_rtree r "
+        "JOIN node_latest l ON l.node_id = r.node_id JOIN node_status s ON s.id = l.status_id "
+        "WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?",
+        (0, 1, 0, 1)),
+    "delete_before_time(partitions)": (
+        "SELECT name FROM node_partitions WHERE start_ms <= ? ORDER BY start_ms", (0,)),
+    "delete_before_time(node_latest)": (
+        "DELETE FROM node_latest WHERE time_ms < ?", (0,)),
+}
+
+# run on the notifications file, telemetry attached (db_files.py)
+NOTIF_HOT_QUERIES = {
+    "get_unread_notifs": (
+        _NOTIF_SELECT + "WHERE n.seq > ? ORDER BY n.seq DESC", (0, 0)),
+    "get_unread_count(category)": (
+        "SELECT notif_category_stats.category, inserted - IFNULL(m.marked, 0) FROM notif_category_stats "
+        "LEFT JOIN notif_category_marks m ON m.username = ? AND m.category = notif_category_stats.category "
+        "WHERE notif_category_stats.category = ?", ("*", "SOS")),
+    "get_unread_counts": (
+        "SELECT notif_category_stats.category, inserted - IFNULL(m.marked, 0) FROM notif_category_stats "
+        "LEFT JOIN notif_category_marks m ON m.username = ? AND m.category = notif_category_stats.category "
+        "WHERE inserted > IFNULL(m.marked, 0)", ("*",)),
+    "get_logs": (
+        "SELECT time, node_id, status, Title, Message FROM notifications "
+        "ORDER BY time DESC", ()),
+    "get_notifs_page": (
+        _NOTIF_SELECT + "WHERE n.time <= ? AND (n.time < ? OR n.id < ?) "
+        "ORDER BY n.time DESC, n.id DESC LIMIT ?",
+        (0, "2100-01-01 00:00:00", "2100-01-01 00:00:00", 0, 50)),
+    "get_notifs_page(category)": (
+        _NOTIF_SELECT + "WHERE n.time <= ? AND (n.time < ? OR n.id < ?) AND n.status = ? "
+        "ORDER BY n.time DESC, n.id DESC LIMIT ?",
+        (0, "2100-01-01 00:00:00", "2100-01-01 00:00:00", 0, "SOS", 50)),
+    "get_notifs_within": (
+        _NOTIF_SELECT + "WHERE n.lat_e6 BETWEEN ? AND ? AND n.lon_e6 BETWEEN ? AND ? "
+        "AND n.time >= ? ORDER BY n.time DESC",
+        (0, 0, 1_000_000, 0, 1_000_000, "2000-01-01 00:00:00")),
+    "search_notifs": (
+        _NOTIF_SELECT.replace("FROM ", "FROM notif_fts f JOIN ", 1)
+        + "WHERE notif_fts MATCH ? AND n.id = f.rowid ORDER BY f.rowid DESC LIMIT ?", (0, '"node"', 500)),
+    "mark_notifs_read": (
+        "SELECT COUNT(*) FROM notifications WHERE seq > ?", (0,)),
+    "mark_notifs_read(categories)": (
+        "SELECT category, inserted - (SELECT COUNT(*) FROM notifications n "
+        "WHERE n.status = category AND n.seq > ?) FROM notif_category_stats", (0,)),
+    "get_changes_since(notifications)": (
+        _NOTIF_SELECT.replace("SELECT ", "SELECT n.seq, ", 1) + "WHERE n.seq > ? ORDER BY n.seq LIMIT ?",
+        (0, 0, 1000)),
+    "delete_before_time(notifications)": (
+        "DELETE FROM notifications WHERE time < ?", ("1970-01-01 00:00:00",)),
+}
+
+
+# one row per notification status: a full scan is the plan
+_SMALL_TABLES = ("notif_category_stats",)
+
+
+def _plan_ok(details: list[str]) -> bool:
+    for d in details:
+        if "USE TEMP B-TREE" in d:
+            return False
+        if d.startswith("SCAN") and "INDEX" not in d and d.split()[1] not in _SMALL_TABLES:
+            return False
+    return True
+
+
+def check_query_plans(db: str = "nodes.db") -> list[tuple[str, bool, list[str]]]:
+    """Return (query name, uses an index, plan lines) for every hot query."""
+    results = []
+    for conn, queries in ((get_connection(db), HOT_QUERIES),
+                          (db_files.notif_connection(db), NOTIF_HOT_QUERIES)):
+        for name, (sql, params) in queries.items():
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            details = [r[3] for r in rows]
+            results.append((name, _plan_ok(details), details))
+    return results
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "nodes.db"
+    print(f"schema version: {migrate(path)}")
+    failed = False
+    for name, ok, details in check_query_plans(path):
+        print(f"{'OK  ' if ok else 'FAIL'} {name}: {' | '.join(details)}")
+        failed = failed or not ok
+    sys.exit(1 if failed else 0)
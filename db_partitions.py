@@ -0,0 +1,258 @@
+"""
+db_partitions.py
+────────────────
+Hour-partitioned storage for node history.
+
+Rows live in one table per wall-clock hour (`nodes_pYYYYMMDDHH`), listed
+in the `node_partitions` catalogue.  `nodes` is a UNION ALL view over
+every partition, so readers keep querying one name.  SQLite merges the
+per-partition (node_id, time_ms) and (seq) index scans for ordered reads.
+
+Retention no longer runs `DELETE ... WHERE time < ?`.  It drops every
+partition that lies entirely before the cutoff instead.  A partition
+is only dropped once its whole hour has expired, so history is kept for
+up to one extra hour.  The start of the oldest hour still kept is
+recorded in node_retention; writers skip rows older than that
+(kept_from()), so a late packet cannot bring a dropped hour back.
+
+Writers call ensure_partition() before inserting.  It creates the
+table, its index, its node_latest triggers and the catalogue row, and
+rebuilds the view, all in the caller's transaction.
+
+In heartbeat mode (db_sqlite.SQLiteBackend.heartbeats) a packet that
+repeats a node's position and status does not get a row of its own: the
+node's newest row in the same partition is extended instead, with
+last_seen_ms set to the packet time and heartbeats counting the packets
+it absorbed.  A row never spans two partitions, so retention stays exact.
+node_latest follows last_seen_ms (the {name}_heartbeat trigger).
+
+Track store: the {name}_track trigger also writes every inserted row into
+node_track, a ring of TRACK_SLOTS slots per node (slot = packet count %
+TRACK_SLOTS, overwritten in place).  It holds each node's last positions
+in a fixed budget of nodes x TRACK_SLOTS rows, however chatty the node,
+and is not touched by retention.
+"""
+
+import threading
+from datetime import datetime, timezone
+
+PARTITION_MS = 3_600_000          # one hour
+TEMPLATE_TABLE = "nodes_template" # always-empty first arm of the view
+TRACK_SLOTS = 64                  # positions kept per node in node_track;
+                                  # changing it needs the triggers recreated
+
+_COLUMN_DEFS = """
+     id INTEGER PRIMARY KEY,
+     time_ms INTEGER NOT NULL,
+     node_id INTEGER NOT NULL,
+     lat_e6 INTEGER NOT NULL,
+     lon_e6 INTEGER NOT NULL,
+     status_id INTEGER NOT NULL,
+     seq INTEGER,
+     last_seen_ms INTEGER,
+     heartbeats INTEGER NOT NULL DEFAULT 0"""
+
+_LATEST_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS {name}_latest
+AFTER INSERT ON {name}
+BEGIN
+    INSERT INTO node_latest (node_id, time_ms, lat_e6, lon_e6, status_id)
+    VALUES (NEW.node_id, COALESCE(NEW.last_seen_ms, NEW.time_ms), NEW.lat_e6, NEW.lon_e6, NEW.status_id)
+    ON CONFLICT(node_id) DO UPDATE SET
+        time_ms = excluded.time_ms,
+        lat_e6 = excluded.lat_e6,
+        lon_e6 = excluded.lon_e6,
+        status_id = excluded.status_id
+    WHERE excluded.time_ms >= node_latest.time_ms;
+END
+"""
+
+# an extended row (heartbeat mode) moves the node's snapshot time forward
+_HEARTBEAT_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS {name}_heartbeat
+AFTER UPDATE OF last_seen_ms ON {name}
+BEGIN
+    UPDATE node_latest SET time_ms = NEW.last_seen_ms
+    WHERE node_id = NEW.node_id AND time_ms < NEW.last_seen_ms;
+END
+"""
+
+# per-node ring: node_track_heads counts the node's rows, the row goes to
+# slot (count - 1) % TRACK_SLOTS
+_TRACK_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS {name}_track
+AFTER INSERT ON {name}
+BEGIN
+    INSERT INTO node_track_heads (node_id, n) VALUES (NEW.node_id, 1)
+    ON CONFLICT(node_id) DO UPDATE SET n = n + 1;
+    INSERT OR REPLACE INTO node_track (node_id, slot, n, time_ms, lat_e6, lon_e6, status_id)
+    SELECT NEW.node_id, (n - 1) % {slots}, n, NEW.time_ms, NEW.lat_e6, NEW.lon_e6, NEW.status_id
+    FROM node_track_heads WHERE node_id = NEW.node_id;
+END
+"""
+
+# db path -> {partition start_ms: table name}; a hint only, the
+# node_partitions table is the source of truth
+_known: dict[str, dict[int, str]] = {}
+_known_lock = threading.Lock()
+
+
+def partition_start(time_ms: int) -> int:
+    return time_ms - time_ms % PARTITION_MS
+
+
+def partition_name(start_ms: int) -> str:
+    stamp = datetime.fromtimestamp(start_ms / 1000, tz=timezone.utc)
+    return f"nodes_p{stamp.strftime('%Y%m%d%H')}"
+
+
+def create_catalogue(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS node_partitions
+                    (name TEXT PRIMARY KEY,
+                     start_ms INTEGER NOT NULL UNIQUE,
+                     end_ms INTEGER NOT NULL)""")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {TEMPLATE_TABLE} ({_COLUMN_DEFS})")
+    # indexed like a partition so ordered reads through the view stay a pure merge
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {TEMPLATE_TABLE}_node_time "
+                 f"ON {TEMPLATE_TABLE} (node_id, time_ms)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {TEMPLATE_TABLE}_seq ON {TEMPLATE_TABLE} (seq)")
+    # written by every partition's track trigger
+    conn.execute("""CREATE TABLE IF NOT EXISTS node_track
+                    (node_id INTEGER NOT NULL,
+                     slot INTEGER NOT NULL,
+                     n INTEGER NOT NULL,
+                     time_ms INTEGER NOT NULL,
+                     lat_e6 INTEGER NOT NULL,
+                     lon_e6 INTEGER NOT NULL,
+                     status_id INTEGER NOT NULL,
+                     PRIMARY KEY (node_id, slot)) WITHOUT ROWID""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS node_track_heads
+                    (node_id INTEGER PRIMARY KEY, n INTEGER NOT NULL)""")
+
+
+def create_partition(conn, start_ms: int) -> str:
+    """Create the partition holding *start_ms* (idempotent). No view rebuild."""
+    name = partition_name(start_ms)
+    end_ms = start_ms + PARTITION_MS
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS {name} ({_COLUMN_DEFS},
+                     CHECK (time_ms >= {start_ms} AND time_ms < {end_ms}))""")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_node_time ON {name} (node_id, time_ms)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_seq ON {name} (seq)")
+    create_triggers(conn, name)
+    conn.execute("INSERT OR IGNORE INTO node_partitions (name, start_ms, end_ms) VALUES (?, ?, ?)",
+                 (name, start_ms, end_ms))
+    return name
+
+
+def create_triggers(conn, name: str):
+    conn.execute(_LATEST_TRIGGER.format(name=name))
+    conn.execute(_HEARTBEAT_TRIGGER.format(name=name))
+    conn.execute(_TRACK_TRIGGER.format(name=name, slots=TRACK_SLOTS))
+
+
+def add_heartbeat_columns(conn):
+    """Give the template and every partition last_seen_ms / heartbeats and
+    the triggers that use them (migration 15).  Idempotent."""
+    names = [r[0] for r in conn.execute("SELECT name FROM node_partitions")]
+    for table in [TEMPLATE_TABLE] + names:
+        columns = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+        if "last_seen_ms" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN last_seen_ms INTEGER")
+        if "heartbeats" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN heartbeats INTEGER NOT NULL DEFAULT 0")
+    for name in names:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}_latest")
+        create_triggers(conn, name)
+    rebuild_view(conn)
+
+
+def add_tracks(conn):
+    """Create node_track, give every partition its track trigger and fill
+    the rings from the existing history (migration 16).  Idempotent."""
+    create_catalogue(conn)
+    for (name,) in conn.execute("SELECT name FROM node_partitions").fetchall():
+        create_triggers(conn, name)
+    conn.execute("DELETE FROM node_track")
+    conn.execute("DELETE FROM node_track_heads")
+    conn.execute("INSERT INTO node_track_heads (node_id, n) SELECT node_id, COUNT(*) FROM nodes GROUP BY node_id")
+    # the last TRACK_SLOTS rows of every node, numbered in insertion (seq) order
+    conn.execute(f"""INSERT INTO node_track (node_id, slot, n, time_ms, lat_e6, lon_e6, status_id)
+                     SELECT node_id, (rn - 1) % {TRACK_SLOTS}, rn, time_ms, lat_e6, lon_e6, status_id
+                     FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY node_id ORDER BY seq, id) AS rn,
+                                  COUNT(*) OVER (PARTITION BY node_id) AS total
+                           FROM nodes)
+                     WHERE rn > total - {TRACK_SLOTS}""")
+
+
+def rebuild_view(conn):
+    names = [r[0] for r in conn.execute("SELECT name FROM node_partitions ORDER BY start_ms")]
+    arms = " UNION ALL ".join(f"SELECT * FROM {n}" for n in [TEMPLATE_TABLE] + names)
+    conn.execute("DROP VIEW IF EXISTS nodes")
+    conn.execute(f"CREATE VIEW nodes AS {arms}")
+
+
+def _begin(conn):
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+
+
+def ensure_partition(conn, db: str, time_ms: int) -> str:
+    """Return the partition table for *time_ms*, creating it if needed.
+
+    Opens a write transaction when none is active; the caller commits.
+    """
+    start = partition_start(time_ms)
+    name = _known.get(db, {}).get(start)
+    if name is not None:
+        return name
+    row = conn.execute("SELECT name FROM node_partitions WHERE start_ms = ?", (start,)).fetchone()
+    if row is None:
+        _begin(conn)
+        name = create_partition(conn, start)
+        rebuild_view(conn)
+    else:
+        name = row[0]
+    with _known_lock:
+        _known.setdefault(db, {})[start] = name
+    return name
+
+
+def kept_from(conn) -> int:
+    """time_ms of the oldest hour retention still keeps; older rows belong
+    to partitions that were dropped."""
+    return conn.execute("SELECT kept_from_ms FROM node_retention").fetchone()[0]
+
+
+def forget(db: str):
+    """Drop the cached partition list for *db* (e.g. after a failed insert)."""
+    with _known_lock:
+        _known.pop(db, None)
+
+
+def drop_before(conn, db: str, cutoff_ms: int) -> list[str]:
+    """Drop every partition that ends at or before *cutoff_ms* and record
+    the start of the oldest hour kept.
+
+    Opens a write transaction; the caller commits.  Returns the dropped
+    table names.
+    """
+    # the write lock before the first read, so no writer commits in between
+    _begin(conn)
+    boundary = partition_start(cutoff_ms)
+    conn.execute("UPDATE node_retention SET kept_from_ms = ? WHERE kept_from_ms < ?", (boundary, boundary))
+    expired = [r[0] for r in conn.execute(
+        "SELECT name FROM node_partitions WHERE start_ms <= ? ORDER BY start_ms",
+        (cutoff_ms - PARTITION_MS,))]
+    if not expired:
+        return []
+    for name in expired:
+        conn.execute(f"DROP TABLE IF EXISTS {name}")
+        conn.execute("DELETE FROM node_partitions WHERE name = ?", (name,))
+    rebuild_view(conn)
+    forget(db)
+    return expired
+
+
+def drop_all(conn, db: str):
+    drop_before(conn, db, 2 ** 62)
+    conn.execute("UPDATE node_retention SET kept_from_ms = 0")
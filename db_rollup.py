@@ -0,0 +1,82 @@
+"""
+db_rollup.py
+────────────
+Tiered node history: what is kept, and for how long.
+
+  raw     every row, in hourly partitions (db_partitions.py); dropped by
+          retention after retention_hrs (48 h)
+  trail   node_trail: the raw rows thinned to one point per
+          TRAIL_INTERVAL_MS, plus every move of TRAIL_MIN_MOVE_M or more and
+          every status change; dropped after trail_days (30 days)
+  hourly  node_hourly: one row per node and hour (packets, first / last
+          packet, bounding box, last position and status, distance
+          travelled); kept indefinitely
+
+database.rollup_history() builds both from closed hours of raw rows, one
+partition at a time (maintenance job "rollup"; retention,
+delete_before_time "nodes", rolls up every hour it drops, including rows
+that arrived just before the drop).  An hour is rolled up once, and again
+if rows arrived for it afterwards (its max seq grew); the hour's trail
+points and aggregates are replaced, so running it twice is harmless.
+Every hour is thinned on its own, starting from its first row.
+
+Heartbeat-mode rows count as 1 + heartbeats packets and end at
+last_seen_ms.  A late packet that only extends a row of an hour already
+rolled up adds no seq and is not picked up.
+
+This module is the backend-independent part: roll_hour() over the rows
+of one partition.
+"""
+
+import itertools
+
+from db_backend import haversine_m
+from db_partitions import partition_start
+
+TRAIL_INTERVAL_MS = 60_000      # at most one trail point per minute ...
+TRAIL_MIN_MOVE_M = 25.0         # ... unless the node moved this far or changed status
+
+
+def _distance_m(a: tuple, b: tuple) -> float:
+    # rows are (node_id, time_ms, lat_e6, lon_e6, ...)
+    return haversine_m(a[2] / 1e6, a[3] / 1e6, b[2] / 1e6, b[3] / 1e6)
+
+
+def _downsample(rows: list) -> list:
+    kept = []
+    for r in rows:
+        if kept:
+            last = kept[-1]
+            if (r[1] - last[1] < TRAIL_INTERVAL_MS and r[4] == last[4]
+                    and _distance_m(last, r) < TRAIL_MIN_MOVE_M):
+                continue
+        kept.append(r)
+    # one point per millisecond; the later row wins
+    return list({r[1]: r[:5] for r in kept}.values())
+
+
+def _aggregate(rows: list) -> tuple:
+    lats, lons = [r[2] for r in rows], [r[3] for r in rows]
+    last = rows[-1]
+    return (last[0], partition_start(rows[0][1]), sum(1 + r[6] for r in rows),
+            rows[0][1], max(r[5] or r[1] for r in rows),
+            min(lats), min(lons), max(lats), max(lons), last[2], last[3], last[4],
+            round(sum(_distance_m(a, b) for a, b in zip(rows, rows[1:])), 1))
+
+
+def roll_hour(rows: list) -> tuple:
+    """Trail points and aggregates of one partition.
+
+    *rows* are (node_id, time_ms, lat_e6, lon_e6, status, last_seen_ms,
+    heartbeats), sorted by node_id, time_ms and arrival; status is whatever
+    the backend stores (id or name) and is passed through.  Returns
+    (trail rows (node_id, time_ms, lat_e6, lon_e6, status),
+     hourly rows (node_id, hour_ms, packets, first_ms, last_ms, min_lat_e6,
+                  min_lon_e6, max_lat_e6, max_lon_e6, lat_e6, lon_e6,
+                  status, distance_m))."""
+    trail, hourly = [], []
+    for _, node_rows in itertools.groupby(rows, key=lambda r: r[0]):
+        node_rows = list(node_rows)
+        trail += _downsample(node_rows)
+        hourly.append(_aggregate(node_rows))
+    return trail, hourly
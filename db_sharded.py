@@ -0,0 +1,226 @@
+"""
+db_sharded.py
+─────────────
+Node history sharded by node_id across several SQLite files (db_backend
+kind "sharded").
+
+One telemetry file has one write lock, so ingest tops out at one
+committing writer however many cores there are.  ShardedBackend spreads
+the nodes over N shard files (node_id % N) and gives every shard its own
+writer thread: add_rows() splits a batch by shard and the shards commit
+their parts in parallel (sqlite3 releases the GIL while SQLite works).
+
+  nodes.db                      – notifications (nodes-notifications.db),
+                                  auth (nodes-auth.db), consumer cursors,
+                                  the change feed counter; no node rows
+  nodes-shard0.db … shardN-1    – node history, node_latest, node_rtree
+                                  for the nodes of that shard
+
+Each shard is an ordinary SQLiteBackend (partitions, triggers, cache,
+heartbeat mode).  Queries about one node go to its shard; fleet-wide
+ones (get_db, get_nodes, bbox / radius, history, the change feed,
+rollups and retention) ask every shard and merge.  Notification queries, get_logs included, are
+not sharded and run on nodes.db as before.
+
+Change feed: seq numbers come from the one counter of the ShardedBackend
+(SQLiteBackend._next_seq), persisted in each file's change_seq; the
+shards take theirs from it and share its commit horizon, so a consumer
+never skips a row that one shard commits after another's.
+
+The shard count is fixed when the database is created: init_db() refuses
+to open existing shards with a different SAFETRACK_SHARDS.
+"""
+
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import db_files
+from db_connection import close_thread_connections
+from db_sqlite import SQLiteBackend
+
+DEFAULT_SHARDS = 4
+
+
+def shard_path(path: str, index: int) -> str:
+    return db_files.with_suffix(path, f"shard{index}")
+
+
+class _Shard(SQLiteBackend):
+    """One shard's telemetry file; takes its seq numbers from the owner."""
+
+    def __init__(self, path: str, owner: "ShardedBackend"):
+        super().__init__(path)
+        self.owner = owner
+
+    def _load_seq(self):
+        self.owner._load_seq()
+
+    def _next_seq(self, conn, n: int) -> int:
+        return self.owner._next_seq(conn, n)
+
+    def _release(self):
+        self.owner._release()
+
+    def get_latest_seq(self) -> int:
+        return self.owner.get_latest_seq()
+
+
+class ShardedBackend(SQLiteBackend):
+    kind = "sharded"
+
+    def __init__(self, path: str, shards: int | None = None):
+        super().__init__(path)
+        shards = shards or int(os.environ.get("SAFETRACK_SHARDS", DEFAULT_SHARDS))
+        self.shards = [_Shard(shard_path(path, i), self) for i in range(shards)]
+        self._writers = [ThreadPoolExecutor(1, thread_name_prefix=f"shard{i}-writer") for i in range(shards)]
+
+    def __repr__(self):
+        return f"ShardedBackend({self.path!r}, shards={len(self.shards)})"
+
+    @property
+    def heartbeats(self) -> bool:
+        return self.shards[0].heartbeats
+
+    @heartbeats.setter
+    def heartbeats(self, value: bool):
+        for shard in self.shards:
+            shard.heartbeats = value
+
+    def files(self) -> list:
+        return super().files() + [p for shard in self.shards for p in shard.files()]
+
+    def close(self):
+        for writer in self._writers:
+            writer.submit(close_thread_connections).result()
+            writer.shutdown()
+
+    def shard_of(self, node_id: int) -> _Shard:
+        return self.shards[node_id % len(self.shards)]
+
+    # ── change feed numbering ─────────────
+
+    def _seq_connections(self) -> list:
+        return super()._seq_connections() + [shard.connect() for shard in self.shards]
+
+    # ── nodes ─────────────────────────────
+
+    def init_db(self):
+        self._check_shard_count()
+        super().init_db()
+        for shard in self.shards:
+            shard.init_db()
+
+    def _check_shard_count(self):
+        if self.path.startswith("file:"):
+            return
+        exists = [os.path.exists(shard.path) for shard in self.shards]
+        if (any(exists) and not all(exists)) or os.path.exists(shard_path(self.path, len(self.shards))):
+            raise ValueError(f"{self.path} was sharded with a different shard count "
+                             f"than {len(self.shards)} (SAFETRACK_SHARDS)")
+
+    def add_rows(self, rows: list) -> int:
+        # every shard commits its part of the batch on its own writer thread
+        parts = {}
+        for r in rows:
+            parts.setdefault(r[1] % len(self.shards), []).append(r)
+        futures = [self._writers[i].submit(self.shards[i].add_rows, part) for i, part in parts.items()]
+        written, error = 0, None
+        for f in futures:
+            try:
+                written += f.result()
+            except Exception as exc:
+                error = error or exc
+        if error is not None:
+            raise error
+        return written
+
+    def delete_before_time(self, time, table: str):
+        if table in ("nodes", "trail"):
+            # each shard rolls up its expiring hours before dropping them
+            return sum(shard.delete_before_time(time, table) for shard in self.shards)
+        return super().delete_before_time(time, table)
+
+    def get_history(self) -> list:
+        return list(heapq.merge(*(shard.get_history() for shard in self.shards), key=lambda r: r[0]))
+
+    def get_latest(self) -> list:
+        return sorted((r for shard in self.shards for r in shard.get_latest()), key=lambda r: r[1])
+
+    def get_nodes(self) -> list:
+        return sorted(n for shard in self.shards for n in shard.get_nodes())
+
+    def get_node_info(self, node_id: int) -> list:
+        return self.shard_of(node_id).get_node_info(node_id)
+
+    def get_node_history(self, node_id: int) -> list:
+        return self.shard_of(node_id).get_node_history(node_id)
+
+    def get_track(self, node_id: int, limit: int) -> list:
+        return self.shard_of(node_id).get_track(node_id, limit)
+
+    def get_recent_info(self, node_id: int) -> list:
+        return self.shard_of(node_id).get_recent_info(node_id)
+
+    def get_fleet_snapshot(self, node_ids=None) -> dict:
+        if node_ids is None:
+            groups = {i: None for i in range(len(self.shards))}
+        else:
+            groups = {}
+            for n in node_ids:
+                groups.setdefault(n % len(self.shards), []).append(n)
+        snapshot = {}
+        for i, ids in groups.items():
+            snapshot.update(self.shards[i].get_fleet_snapshot(ids))
+        return snapshot
+
+    # ── tiered history ────────────────────
+
+    def rollup(self, until) -> dict:
+        done = {}
+        for shard in self.shards:
+            for key, n in shard.rollup(until).items():
+                done[key] = done.get(key, 0) + n
+        return done
+
+    def get_trail(self, node_id: int, since_ms: int, until_ms: int) -> list:
+        return self.shard_of(node_id).get_trail(node_id, since_ms, until_ms)
+
+    def get_hourly(self, node_id: int, since_ms: int, until_ms: int) -> list:
+        return self.shard_of(node_id).get_hourly(node_id, since_ms, until_ms)
+
+    # ── spatial ───────────────────────────
+
+    def get_nodes_in_bbox(self, min_lat, min_lon, max_lat, max_lon) -> dict:
+        found = {}
+        for shard in self.shards:
+            found.update(shard.get_nodes_in_bbox(min_lat, min_lon, max_lat, max_lon))
+        return found
+
+    def get_nodes_within(self, lat, lon, radius_m) -> list:
+        found = [f for shard in self.shards for f in shard.get_nodes_within(lat, lon, radius_m)]
+        found.sort(key=lambda f: f[1])
+        return found
+
+    # ── change feed ───────────────────────
+
+    def get_changes_since(self, seq: int, limit: int, kinds: tuple) -> list:
+        horizon = self.get_latest_seq()
+        events = []
+        if "node" in kinds:
+            for shard in self.shards:
+                events += shard.get_changes_since(seq, limit, ("node",))
+        if "notification" in kinds:
+            events += super().get_changes_since(seq, limit, ("notification",))
+        events = [e for e in events if e[0] <= horizon]
+        events.sort(key=lambda e: e[0])
+        return events[:limit]
+
+    def get_db_at(self, seq: int) -> list:
+        return sorted((r for shard in self.shards for r in shard.get_db_at(seq)), key=lambda r: r[1])
+
+    # ── testing only ──────────────────────
+
+    def clear_nodes(self):
+        for shard in self.shards:
+            shard.clear_nodes()
@@ -0,0 +1,737 @@
+"""
+db_sqlite.py
+────────────
+SQLite storage backends (see db_backend.py).
+
+SQLiteBackend holds the SQL behind database.py: compact node rows in
+hourly partitions (db_partitions.py), node_latest / node_rtree kept by
+triggers, the change feed, and structured notifications with per-user
+read marks and an FTS5 index.  Schema changes are versioned migrations
+(db_migrations.py).
+
+With `heartbeats` set, a packet that repeats its node's position and
+status extends the node's newest row (see db_partitions.py) instead of
+adding one.
+
+Telemetry, notifications and auth are separate files (db_files.py);
+notification queries run on the notifications file with the telemetry
+file attached.
+
+Change feed: node rows and notifications share one seq counter, handed
+out in this process under a lock and persisted in the change_seq of the
+file being written, so a notification insert never takes the telemetry
+write lock.  The two files commit independently, so a smaller seq may
+commit after a larger one; get_latest_seq() and get_changes_since() stop
+below the oldest seq whose transaction is still open, so a consumer
+never skips a row.
+
+Variants differ only in where the databases live:
+
+  SQLiteBackend        – a file on disk
+  TmpfsBackend         – files on a RAM-backed filesystem, deleted at close()
+  SharedMemoryBackend  – `file:<name>?mode=memory&cache=shared`; keeper
+                         connections hold the databases open until close()
+
+Connections come from db_connection.get_connection(path), one per thread.
+"""
+
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import uuid
+from datetime import datetime
+
+import db_files
+import db_partitions
+import db_rollup
+import node_cache
+import notif_events
+from db_backend import StorageBackend, circle_bbox, encode_coord, encode_time, haversine_m
+from db_connection import close_connections, get_connection
+from db_migrations import migrate
+from notif_events import Event, Notif
+
+# Rows are stored compactly (epoch ms, int32 microdegrees, status id from the
+# node_status table); _NODE_ROW decodes a `nodes n JOIN node_status s` row back
+# into the public (time, node_id, latitude, longitude, status) tuple.
+_NODE_ROW = ("strftime('%Y-%m-%d %H:%M:%S', n.time_ms / 1000, 'unixepoch'), n.node_id, "
+             "n.lat_e6 / 1000000.0, n.lon_e6 / 1000000.0, s.name")
+
+_INSERT_NODE = ("INSERT INTO {table} (time_ms, node_id, lat_e6, lon_e6, status_id, last_seen_ms, heartbeats, seq) "
+                "VALUES (?,?,?,?,?,?,?,?)")
+
+# Heartbeat mode: extend the node's newest row of the packet's partition
+# when position and status are unchanged and the packet is not older than
+# anything stored for the node.  Extended rows keep their seq; the change
+# feed only carries rows that were inserted.
+_EXTEND_NODE = """UPDATE {table} SET last_seen_ms = :t, heartbeats = heartbeats + 1
+    WHERE id = (SELECT id FROM {table} WHERE node_id = :node ORDER BY time_ms DESC, id DESC LIMIT 1)
+      AND lat_e6 = :lat AND lon_e6 = :lon AND status_id = :sid
+      AND COALESCE(last_seen_ms, time_ms) <= :t
+      AND (SELECT time_ms FROM node_latest WHERE node_id = :node) <= :t"""
+
+# get_node_history: _NODE_ROW plus last seen time and heartbeat count
+_HISTORY_ROW = (_NODE_ROW + ", strftime('%Y-%m-%d %H:%M:%S', COALESCE(n.last_seen_ms, n.time_ms) / 1000, "
+                "'unixepoch'), n.heartbeats")
+
+# node_rtree is an R*Tree over the latest position of every node, in the
+# same integer microdegrees as node_latest, kept in sync by triggers on
+# node_latest (db_migrations, migration 8).
+_BBOX_QUERY = ("SELECT l.node_id, l.lat_e6, l.lon_e6, s.name FROM node_rtree r "
+               "JOIN node_latest l ON l.node_id = r.node_id JOIN node_status s ON s.id = l.status_id "
+               "WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?")
+
+# Notifications are read back as notif_events.Notif rows; title and message
+# of structured events are rendered on read. Queries select _NOTIF_COLS from
+# _NOTIF_FROM; the first parameter is the reader's mark, for is_read.
+_NOTIF_COLS = ("n.time, n.node_id, n.status, n.Title, n.Message, n.seq <= ?, n.id, "
+               "n.event, n.lat_e6, n.lon_e6, so.name, sn.name")
+_NOTIF_FROM = ("notifications n LEFT JOIN node_status so ON so.id = n.old_status_id "
+               "LEFT JOIN node_status sn ON sn.id = n.new_status_id")
+
+# node_hourly rows (db_rollup.py), decoded like _NODE_ROW; node_trail rows use _NODE_ROW itself
+_HOURLY_ROW = ("strftime('%Y-%m-%d %H:%M:%S', n.hour_ms / 1000, 'unixepoch'), n.node_id, n.packets, "
+               "strftime('%Y-%m-%d %H:%M:%S', n.first_ms / 1000, 'unixepoch'), "
+               "strftime('%Y-%m-%d %H:%M:%S', n.last_ms / 1000, 'unixepoch'), "
+               "n.min_lat_e6 / 1000000.0, n.min_lon_e6 / 1000000.0, n.max_lat_e6 / 1000000.0, "
+               "n.max_lon_e6 / 1000000.0, n.lat_e6 / 1000000.0, n.lon_e6 / 1000000.0, s.name, n.distance_m")
+
+_INSERT_NOTIF = ("INSERT INTO notifications (time, node_id, status, Title, Message, event, "
+                 "lat_e6, lon_e6, old_status_id, new_status_id, seq) VALUES (?,?,?,?,?,?,?,?,?,?,?)")
+
+# Read state is a watermark per user (notif_read_marks): every notification
+# with seq <= the user's mark is read. Users who never marked anything share
+# the "*" row.
+_DEFAULT_READER = "*"
+
+# (category, unread) per category for one reader: counters kept by triggers
+# and mark_notifs_read, no scan of the notifications
+_CATEGORY_UNREAD = ("SELECT notif_category_stats.category, inserted - IFNULL(m.marked, 0) FROM notif_category_stats "
+                    "LEFT JOIN notif_category_marks m ON m.username = ? AND m.category = notif_category_stats.category")
+
+# search_notifs fetches the newest _FTS_CANDIDATES matches in rowid order
+# (fast even for words that occur in every row) and ranks them in Python;
+# FTS5's bm25() would need the full match list of every word and costs
+# tens of ms for common words at 1M rows.
+_FTS_CANDIDATES = 500
+
+
+def _notif(r) -> Notif:
+    time, node_id, status, title, message, is_read, notif_id, event, lat_e6, lon_e6, old, new = r
+    lat = lat_e6 / 1e6 if lat_e6 is not None else None
+    lon = lon_e6 / 1e6 if lon_e6 is not None else None
+    if event != Event.CUSTOM:
+        title, message = notif_events.render(event, node_id, lat, lon, new)
+    return Notif(time, node_id, status, title, message, is_read, notif_id, Event(event), lat, lon, old, new)
+
+
+def _read_mark(conn, username: str = None) -> tuple:
+    # (seq, marked, whose mark) for username, or the default mark if it has none
+    return conn.execute("SELECT seq, marked, username FROM notif_read_marks WHERE username IN (?, ?) "
+                        "ORDER BY username = ? LIMIT 1",
+                        (username or _DEFAULT_READER, _DEFAULT_READER, _DEFAULT_READER)).fetchone()
+
+
+def _node_filter(node_ids, where: list, params: list) -> bool:
+    # appends an IN (...) test; False when node_ids is an empty selection
+    if node_ids is None:
+        return True
+    node_ids = list(node_ids)
+    if not node_ids:
+        return False
+    where.append(f"n.node_id IN ({','.join('?' * len(node_ids))})")
+    params += node_ids
+    return True
+
+
+class SQLiteBackend(StorageBackend):
+    kind = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._status_ids: dict[str, int] = {}
+        self._seq_lock = threading.Lock()
+        self._seq: int | None = None
+        self._open: dict[int, list] = {}    # thread id -> first seqs of its uncommitted reservations
+        db_files.register(path)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.path!r})"
+
+    def connect(self) -> sqlite3.Connection:
+        return get_connection(self.path)
+
+    def notif_connect(self) -> sqlite3.Connection:
+        # notifications file; node_status resolves to the attached telemetry file,
+        # change_seq to the notifications file's own
+        return db_files.notif_connection(self.path)
+
+    def auth_connection(self) -> sqlite3.Connection:
+        return db_files.auth_connection(self.path)
+
+    def files(self) -> list:
+        return list(db_files.paths(self.path).values())
+
+    # ── encoding ──────────────────────────
+
+    def _status_id(self, conn, name: str) -> int:
+        sid = self._status_ids.get(name)
+        if sid is None:
+            row = conn.execute("SELECT id FROM node_status WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                # only a new name writes node_status (the telemetry file, also from add_notif)
+                conn.execute("INSERT OR IGNORE INTO node_status (name) VALUES (?)", (name,))
+                row = conn.execute("SELECT id FROM node_status WHERE name = ?", (name,)).fetchone()
+            sid = self._status_ids[name] = row[0]
+        return sid
+
+    def _encode_row(self, conn, vals: tuple) -> tuple:
+        t, node_id, lat, lon, status = vals
+        return (encode_time(t), node_id, encode_coord(lat), encode_coord(lon), self._status_id(conn, status))
+
+    # ── change feed numbering ─────────────
+
+    def _seq_connections(self) -> list:
+        # every connection whose main file persists part of the counter
+        return [self.connect(), self.notif_connect()]
+
+    def _load_seq(self):
+        # the counter starts after the highest seq of any file.  Writers call
+        # this before their transaction opens: a shared-cache memory database
+        # reports its schema locked to the other connections while one writes.
+        # Plain reads, no `with conn:`, which would commit a caller's transaction.
+        with self._seq_lock:
+            if self._seq is None:
+                self._seq = max(conn.execute("SELECT seq FROM change_seq").fetchone()[0]
+                                for conn in self._seq_connections())
+
+    def _next_seq(self, conn, n: int) -> int:
+        # reserve n numbers of the shared counter, persisted in the change_seq
+        # of conn's main file so the counter survives a restart
+        self._load_seq()
+        with self._seq_lock:
+            first = self._seq + 1
+            self._seq += n
+            self._open.setdefault(threading.get_ident(), []).append(first)
+        conn.execute("UPDATE change_seq SET seq = MAX(seq, ?)", (first + n - 1,))
+        return first
+
+    def _release(self):
+        # the calling thread's transaction has committed (or rolled back)
+        with self._seq_lock:
+            self._open.pop(threading.get_ident(), None)
+
+    def _insert_heartbeats(self, conn, routed: list):
+        # heartbeat mode: row by row, so a repeat later in the batch sees the
+        # row an earlier packet inserted
+        for table, r in routed:
+            t, node_id, lat, lon, sid = r
+            if conn.execute(_EXTEND_NODE.format(table=table),
+                            {"t": t, "node": node_id, "lat": lat, "lon": lon, "sid": sid}).rowcount:
+                continue
+            conn.execute(_INSERT_NODE.format(table=table), r + (None, 0, self._next_seq(conn, 1)))
+
+    def _insert_encoded(self, conn, rows: list):
+        # history is split into hourly partitions behind the `nodes` view (see
+        # db_partitions.py); route every row to the table for its hour.  A
+        # cached partition may have been dropped by retention since it was
+        # looked up: roll back to the savepoint, re-route and try once more.
+        if not rows:
+            return
+        for attempt in range(2):
+            conn.execute("SAVEPOINT insert_rows")
+            try:
+                self._insert_routed(conn, rows)
+            except sqlite3.OperationalError as exc:
+                conn.execute("ROLLBACK TO insert_rows")
+                conn.execute("RELEASE insert_rows")
+                db_partitions.forget(self.path)
+                if attempt or "no such table" not in str(exc):
+                    raise
+                continue
+            conn.execute("RELEASE insert_rows")
+            return
+
+    def _insert_routed(self, conn, rows: list):
+        routed = [(db_partitions.ensure_partition(conn, self.path, r[0]), r) for r in rows]
+        runs = []   # [table, rows]: consecutive rows of one partition, in arrival order (node_track)
+        if not self.heartbeats:
+            first = self._next_seq(conn, len(rows))
+            for seq, (table, r) in enumerate(routed, first):
+                if not runs or runs[-1][0] != table:
+                    runs.append([table, []])
+                runs[-1][1].append(r + (None, 0, seq))
+        if self.heartbeats:
+            self._insert_heartbeats(conn, routed)
+        for table, part in runs:
+            conn.executemany(_INSERT_NODE.format(table=table), part)
+
+    # ── nodes ─────────────────────────────
+
+    def init_db(self):
+        # tables, node_latest trigger and indexes are all versioned migrations
+        migrate(self.path)
+        node_cache.get_cache(self.path).invalidate()
+
+    def _cache(self) -> node_cache.NodeStateCache:
+        # Current fleet state is served from the in-memory NodeStateCache, which
+        # ingest updates write-through; only the first read warms it from node_latest.
+        cache = node_cache.get_cache(self.path)
+        if not cache.loaded:
+            with self.connect() as conn:
+                rows = conn.execute("SELECT n.time_ms, n.node_id, n.lat_e6, n.lon_e6, s.name "
+                                    "FROM node_latest n JOIN node_status s ON s.id = n.status_id").fetchall()
+            cache.load(rows)
+        return cache
+
+    def add_rows(self, rows: list) -> int:
+        # one transaction (one commit) for the whole batch
+        if not rows:
+            return 0
+        self._load_seq()
+        try:
+            with self.connect() as conn:
+                if not conn.in_transaction:
+                    # the write lock first: retention cannot drop partitions while
+                    # this batch is routed and inserted
+                    conn.execute("BEGIN IMMEDIATE")
+                kept_from = db_partitions.kept_from(conn)
+                encoded, cached, expired = [], [], 0
+                for r in rows:
+                    try:
+                        e = self._encode_row(conn, r)
+                    except ValueError:
+                        print(f"***ERROR: TIME FORMATTING FAILED (YYYY-MM-DD HH:MM:SS)*** {r}")
+                        continue
+                    if e[0] < kept_from:
+                        expired += 1
+                        continue
+                    encoded.append(e)
+                    cached.append(e[:4] + (r[4],))
+                if expired:
+                    print(f"***ERROR: {expired} ROWS OLDER THAN THE RETENTION CUTOFF SKIPPED***")
+                self._insert_encoded(conn, encoded)
+        finally:
+            # its seqs have committed (or rolled back): the feed may move past them
+            self._release()
+        if cached:
+            node_cache.get_cache(self.path).apply(cached)
+        return len(cached)
+
+    def delete_before_time(self, time: datetime, table: str):
+        time_ms = encode_time(time.isoformat())
+        if table == "nodes":
+            # expiring hours are rolled up before they go: in short transactions
+            # here, then again under the write lock for rows that came in between
+            self.rollup(time)
+        with self.connect() as conn:
+            cur = conn.cursor()
+            if table == "nodes":
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                for name, start, rolled in conn.execute(
+                        "SELECT name, start_ms, rolled_seq FROM node_partitions WHERE end_ms <= ?",
+                        (time_ms,)).fetchall():
+                    self._roll_partition(conn, name, start, rolled)
+                dropped = db_partitions.drop_before(conn, self.path, time_ms)
+                # nodes whose whole history expired drop out of the snapshot
+                boundary = db_partitions.partition_start(time_ms)
+                cur.execute("DELETE FROM node_latest WHERE time_ms < ?", (boundary,))
+                conn.commit()
+                node_cache.get_cache(self.path).remove_before(boundary)
+                return len(dropped)
+            if table == "trail":
+                return cur.execute("DELETE FROM node_trail WHERE time_ms < ?", (time_ms,)).rowcount
+        if table == "notifications":
+            with self.notif_connect() as conn:
+                cur = conn.execute("DELETE FROM notifications WHERE time < ?",
+                                   (time.strftime("%Y-%m-%d %H:%M:%S"),))
+                return cur.rowcount
+
+    def get_history(self) -> list:
+        with self.connect() as conn:
+            return conn.execute(f"SELECT {_NODE_ROW} FROM nodes n JOIN node_status s ON s.id = n.status_id "
+                                f"ORDER BY n.time_ms").fetchall()
+
+    def get_latest(self) -> list:
+        return self._cache().rows()
+
+    def get_nodes(self) -> list:
+        return self._cache().node_ids()
+
+    def get_node_info(self, node_id: int) -> list:
+        with self.connect() as conn:
+            return conn.execute(f"SELECT {_NODE_ROW} FROM nodes n JOIN node_status s ON s.id = n.status_id "
+                                f"WHERE n.node_id = ? ORDER BY n.time_ms DESC", (node_id,)).fetchall()
+
+    def get_node_history(self, node_id: int) -> list:
+        with self.connect() as conn:
+            return conn.execute(f"SELECT {_HISTORY_ROW} FROM nodes n JOIN node_status s ON s.id = n.status_id "
+                                f"WHERE n.node_id = ? ORDER BY n.time_ms DESC", (node_id,)).fetchall()
+
+    def get_track(self, node_id: int, limit: int) -> list:
+        # at most TRACK_SLOTS rows by primary key; ordered here
+        with self.connect() as conn:
+            rows = conn.execute(f"SELECT {_NODE_ROW}, n.time_ms, n.n FROM node_track n "
+                                f"JOIN node_status s ON s.id = n.status_id WHERE n.node_id = ?",
+                                (node_id,)).fetchall()
+        rows.sort(key=lambda r: r[5:], reverse=True)
+        return [r[:5] for r in rows[:limit]]
+
+    def get_recent_info(self, node_id: int) -> list:
+        row = self._cache().get(node_id)
+        return [row] if row is not None else []
+
+    def get_fleet_snapshot(self, node_ids=None) -> dict:
+        return self._cache().snapshot(node_ids)
+
+    # ── tiered history ────────────────────
+
+    def rollup(self, until: datetime) -> dict:
+        # one transaction per partition, so ingest never waits long
+        until_ms = encode_time(until.isoformat())
+        done = {"hours": 0, "trail_points": 0, "aggregates": 0}
+        with self.connect() as conn:
+            parts = conn.execute("SELECT name, start_ms, rolled_seq FROM node_partitions "
+                                 "WHERE end_ms <= ? ORDER BY start_ms", (until_ms,)).fetchall()
+        for name, start, rolled in parts:
+            with self.connect() as conn:
+                rolled_up = self._roll_partition(conn, name, start, rolled)
+            if rolled_up is not None:
+                done["hours"] += 1
+                done["trail_points"] += rolled_up[0]
+                done["aggregates"] += rolled_up[1]
+        return done
+
+    def _roll_partition(self, conn, name: str, start: int, rolled) -> tuple | None:
+        # (trail points, aggregates) written, or None when the hour is up to date
+        top = conn.execute(f"SELECT MAX(seq) FROM {name}").fetchone()[0]
+        if top is None or (rolled is not None and top <= rolled):
+            return None
+        if rolled is None and conn.execute("SELECT 1 FROM node_hourly WHERE hour_ms = ? LIMIT 1",
+                                           (start,)).fetchone():
+            # late packets for an hour retention had already dropped: keep its rollup
+            conn.execute("UPDATE node_partitions SET rolled_seq = ? WHERE name = ?", (top, name))
+            return None
+        rows = conn.execute(f"SELECT node_id, time_ms, lat_e6, lon_e6, status_id, last_seen_ms, heartbeats "
+                            f"FROM {name} ORDER BY node_id, time_ms, id").fetchall()
+        trail, hourly = db_rollup.roll_hour(rows)
+        conn.execute("DELETE FROM node_trail WHERE time_ms >= ? AND time_ms < ?",
+                     (start, start + db_partitions.PARTITION_MS))
+        conn.execute("DELETE FROM node_hourly WHERE hour_ms = ?", (start,))
+        conn.executemany("INSERT INTO node_trail (node_id, time_ms, lat_e6, lon_e6, status_id) "
+                         "VALUES (?,?,?,?,?)", trail)
+        conn.executemany("INSERT INTO node_hourly VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)", hourly)
+        # a row inserted after the SELECT has a larger seq and re-rolls the hour next time
+        conn.execute("UPDATE node_partitions SET rolled_seq = ? WHERE name = ?", (top, name))
+        return len(trail), len(hourly)
+
+    def get_trail(self, node_id: int, since_ms: int, until_ms: int) -> list:
+        with self.connect() as conn:
+            return conn.execute(f"SELECT {_NODE_ROW} FROM node_trail n JOIN node_status s ON s.id = n.status_id "
+                                f"WHERE n.node_id = ? AND n.time_ms >= ? AND n.time_ms < ? ORDER BY n.time_ms",
+                                (node_id, since_ms, until_ms)).fetchall()
+
+    def get_hourly(self, node_id: int, since_ms: int, until_ms: int) -> list:
+        with self.connect() as conn:
+            return conn.execute(f"SELECT {_HOURLY_ROW} FROM node_hourly n JOIN node_status s ON s.id = n.status_id "
+                                f"WHERE n.node_id = ? AND n.hour_ms >= ? AND n.hour_ms < ? ORDER BY n.hour_ms",
+                                (node_id, since_ms, until_ms)).fetchall()
+
+    # ── spatial ───────────────────────────
+
+    def _bbox_rows(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> list:
+        # rounded outwards so a point on the edge is never lost to rounding
+        lat_lo, lat_hi = math.floor(min_lat * 1_000_000), math.ceil(max_lat * 1_000_000)
+        if min_lon <= max_lon:
+            spans = [(min_lon, max_lon)]
+        else:
+            # the box wraps across the antimeridian
+            spans = [(min_lon, 180.0), (-180.0, max_lon)]
+        rows = []
+        with self.connect() as conn:
+            for lo, hi in spans:
+                rows += conn.execute(_BBOX_QUERY, (lat_lo, lat_hi, math.floor(lo * 1_000_000),
+                                                   math.ceil(hi * 1_000_000))).fetchall()
+        return rows
+
+    def get_nodes_in_bbox(self, min_lat, min_lon, max_lat, max_lon) -> dict:
+        rows = self._bbox_rows(min_lat, min_lon, max_lat, max_lon)
+        return {n: (lat / 1e6, lon / 1e6, status) for n, lat, lon, status in rows}
+
+    def get_nodes_within(self, lat, lon, radius_m) -> list:
+        # the R*Tree narrows the search to the circle's bounding box; the
+        # haversine distance makes the exact cut
+        found = []
+        for n, lat_e6, lon_e6, _ in self._bbox_rows(*circle_bbox(lat, lon, radius_m)):
+            d = haversine_m(lat, lon, lat_e6 / 1e6, lon_e6 / 1e6)
+            if d <= radius_m:
+                found.append((n, d))
+        found.sort(key=lambda f: f[1])
+        return found
+
+    # ── change feed ───────────────────────
+
+    def get_changes_since(self, seq: int, limit: int, kinds: tuple) -> list:
+        horizon = self.get_latest_seq()
+        events = []
+        with self.connect() as conn:
+            if "node" in kinds:
+                cur = conn.execute(f"SELECT n.seq, {_NODE_ROW} FROM nodes n JOIN node_status s ON s.id = n.status_id "
+                                   f"WHERE n.seq > ? ORDER BY n.seq LIMIT ?", (seq, limit))
+                events += [(r[0], "node", r[1:]) for r in cur]
+        if "notification" in kinds:
+            with self.notif_connect() as conn:
+                mark = _read_mark(conn)[0]
+                cur = conn.execute(f"SELECT n.seq, {_NOTIF_COLS} FROM {_NOTIF_FROM} "
+                                   f"WHERE n.seq > ? ORDER BY n.seq LIMIT ?", (mark, seq, limit))
+                events += [(r[0], "notification", _notif(r[1:])) for r in cur]
+        events = [e for e in events if e[0] <= horizon]
+        events.sort(key=lambda e: e[0])
+        return events[:limit]
+
+    def get_latest_seq(self) -> int:
+        # highest seq below which every transaction has committed
+        self._load_seq()
+        with self._seq_lock:
+            pending = [s for firsts in self._open.values() for s in firsts]
+            return min(pending) - 1 if pending else self._seq
+
+    def get_db_at(self, seq: int) -> list:
+        # scans the history once; meant for a consumer rebuilding its state at start-up
+        with self.connect() as conn:
+            cur = conn.execute(f"SELECT {_NODE_ROW}, MAX(n.seq) FROM nodes n JOIN node_status s ON s.id = n.status_id "
+                               f"WHERE n.seq <= ? GROUP BY n.node_id ORDER BY n.node_id", (seq,))
+            return [r[:5] for r in cur]
+
+    def get_cursor(self, consumer: str):
+        with self.connect() as conn:
+            row = conn.execute("SELECT seq FROM feed_cursors WHERE consumer = ?", (consumer,)).fetchone()
+        return row[0] if row else None
+
+    def save_cursor(self, consumer: str, seq: int):
+        with self.connect() as conn:
+            conn.execute("INSERT INTO feed_cursors (consumer, seq) VALUES (?, ?) "
+                         "ON CONFLICT(consumer) DO UPDATE SET seq = excluded.seq", (consumer, seq))
+
+    # ── notifications ─────────────────────
+
+    def init_notif_db(self):
+        migrate(self.path)
+
+    def add_notif(self, n: Notif) -> int:
+        self._load_seq()
+        try:
+            return self._insert_notif(n)
+        finally:
+            self._release()
+
+    def _insert_notif(self, n: Notif) -> int:
+        with self.notif_connect() as conn:
+            # persisted in the notifications file's change_seq: no telemetry write lock
+            seq = self._next_seq(conn, 1)
+            # the text index holds the rendered text, so it is written here rather than by a trigger
+            status_ids = [self._status_id(conn, s) if s is not None else None for s in (n.old_status, n.new_status)]
+            coords = [encode_coord(c) if c is not None else None for c in (n.lat, n.lon)]
+            stored_text = (n.title, n.message) if n.event == Event.CUSTOM else (None, None)
+            cur = conn.execute(_INSERT_NOTIF, (n.time, n.node_id, n.status, *stored_text, int(n.event),
+                                               *coords, *status_ids, seq))
+            conn.execute("INSERT INTO notif_fts (rowid, Title, Message) VALUES (?, ?, ?)",
+                         (cur.lastrowid, n.title, n.message))
+            return cur.lastrowid
+
+    def mark_notifs_read(self, username, up_to_seq):
+        # notif_stats counts inserts; `marked` records how many of those are
+        # read or gone for this user, so the unread total stays O(1).  The
+        # per-category share of `marked` is snapshotted alongside
+        # (notif_category_marks, db_migrations migration 19).
+        reader = username or _DEFAULT_READER
+        if up_to_seq is None:
+            up_to_seq = self.get_latest_seq()
+        with self.notif_connect() as conn:
+            moved = conn.execute("""INSERT INTO notif_read_marks (username, seq, marked)
+                                    SELECT ?, ?, (SELECT inserted FROM notif_stats)
+                                                 - (SELECT COUNT(*) FROM notifications WHERE seq > ?)
+                                    WHERE 1
+                                    ON CONFLICT(username) DO UPDATE SET seq = excluded.seq, marked = excluded.marked
+                                    WHERE excluded.seq > notif_read_marks.seq""",
+                                 (reader, up_to_seq, up_to_seq)).rowcount
+            if moved:
+                conn.execute("DELETE FROM notif_category_marks WHERE username = ?", (reader,))
+                conn.execute("""INSERT INTO notif_category_marks (username, category, marked)
+                                SELECT ?, category, inserted - (SELECT COUNT(*) FROM notifications n
+                                                                WHERE n.status = category AND n.seq > ?)
+                                FROM notif_category_stats""", (reader, up_to_seq))
+
+    def notif_seq(self, notif_id: int):
+        with self.notif_connect() as conn:
+            row = conn.execute("SELECT seq FROM notifications WHERE id = ?", (notif_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def get_notifs(self, username=None, unread_only=False, newest_first=False) -> list:
+        with self.notif_connect() as conn:
+            mark = _read_mark(conn, username)[0]
+            sql, params = f"SELECT {_NOTIF_COLS} FROM {_NOTIF_FROM}", [mark]
+            if unread_only:
+                sql += " WHERE n.seq > ?"
+                params.append(mark)
+            if newest_first:
+                sql += " ORDER BY n.seq DESC"
+            return [_notif(r) for r in conn.execute(sql, params)]
+
+    def get_unread_count(self, category, username) -> int:
+        with self.notif_connect() as conn:
+            _, marked, reader = _read_mark(conn, username)
+            if category is None:
+                inserted = conn.execute("SELECT inserted FROM notif_stats").fetchone()[0]
+                return inserted - marked
+            row = conn.execute(f"{_CATEGORY_UNREAD} WHERE notif_category_stats.category = ?", (reader, category)).fetchone()
+        return row[1] if row is not None else 0
+
+    def get_unread_counts(self, username) -> dict:
+        with self.notif_connect() as conn:
+            reader = _read_mark(conn, username)[2]
+            return dict(conn.execute(f"{_CATEGORY_UNREAD} WHERE inserted > IFNULL(m.marked, 0)", (reader,)))
+
+    def get_notifs_page(self, before_time, before_id, limit, category, node_ids, since, until,
+                        unread_only, username) -> list:
+        where, params = [], []
+        if before_time is not None:
+            if before_id is None:
+                where.append("n.time < ?")
+                params.append(before_time)
+            else:
+                # written out (not as a row value) so the time index bounds the scan
+                where.append("n.time <= ? AND (n.time < ? OR n.id < ?)")
+                params += [before_time, before_time, before_id]
+        if category is not None:
+            where.append("n.status = ?")
+            params.append(category)
+        if not _node_filter(node_ids, where, params):
+            return []
+        if since is not None:
+            where.append("n.time >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("n.time < ?")
+            params.append(until)
+        sql = f"SELECT {_NOTIF_COLS} FROM {_NOTIF_FROM}"
+        with self.notif_connect() as conn:
+            mark = _read_mark(conn, username)[0]
+            if unread_only:
+                where.append("n.seq > ?")
+                params.append(mark)
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            rows = conn.execute(sql + " ORDER BY n.time DESC, n.id DESC LIMIT ?", [mark] + params + [limit])
+            return [_notif(r) for r in rows]
+
+    def search_notifs(self, terms: list, limit, category, node_ids, since, username) -> list:
+        where, params = ["notif_fts MATCH ?", "n.id = f.rowid"], [" ".join(f'"{t}"' for t in terms)]
+        if category is not None:
+            where.append("n.status = ?")
+            params.append(category)
+        if not _node_filter(node_ids, where, params):
+            return []
+        if since is not None:
+            where.append("n.time >= ?")
+            params.append(since)
+        with self.notif_connect() as conn:
+            mark = _read_mark(conn, username)[0]
+            rows = conn.execute(f"SELECT {_NOTIF_COLS} FROM notif_fts f JOIN {_NOTIF_FROM} "
+                                f"WHERE {' AND '.join(where)} ORDER BY f.rowid DESC LIMIT ?",
+                                [mark] + params + [_FTS_CANDIDATES])
+            return [_notif(r) for r in rows]
+
+    def get_notifs_within(self, lat, lon, radius_m, since, limit, username) -> list:
+        # the time bound keeps the scan on the time index
+        min_lat, min_lon, max_lat, max_lon = circle_bbox(lat, lon, radius_m)
+        lon_test = "n.lon_e6 BETWEEN ? AND ?" if min_lon <= max_lon else "(n.lon_e6 >= ? OR n.lon_e6 <= ?)"
+        where = f"n.lat_e6 BETWEEN ? AND ? AND {lon_test}"
+        params = [math.floor(min_lat * 1_000_000), math.ceil(max_lat * 1_000_000),
+                  math.floor(min_lon * 1_000_000), math.ceil(max_lon * 1_000_000)]
+        if since is not None:
+            where += " AND n.time >= ?"
+            params.append(since)
+        found = []
+        with self.notif_connect() as conn:
+            mark = _read_mark(conn, username)[0]
+            cur = conn.execute(f"SELECT {_NOTIF_COLS} FROM {_NOTIF_FROM} WHERE {where} ORDER BY n.time DESC",
+                               [mark] + params)
+            for r in cur:
+                n = _notif(r)
+                if haversine_m(lat, lon, n.lat, n.lon) <= radius_m:
+                    found.append(n)
+                    if len(found) >= limit:
+                        break
+        return found
+
+    def get_logs(self) -> list:
+        with self.notif_connect() as conn:
+            cur = conn.execute(f"SELECT {_NOTIF_COLS} FROM {_NOTIF_FROM} ORDER BY n.time DESC",
+                               (_read_mark(conn)[0],))
+            return [_notif(r) for r in cur]
+
+    # ── testing only ──────────────────────
+
+    def clear_nodes(self):
+        with self.connect() as conn:
+            db_partitions.drop_all(conn, self.path)
+            conn.execute("DELETE FROM node_latest")
+            conn.execute("DELETE FROM node_track")
+            conn.execute("DELETE FROM node_track_heads")
+            conn.execute("DELETE FROM node_trail")
+            conn.execute("DELETE FROM node_hourly")
+            conn.commit()
+        node_cache.get_cache(self.path).invalidate()
+
+    def clear_notifs(self):
+        with self.notif_connect() as conn:
+            conn.execute("DELETE FROM notifications")
+            conn.commit()
+
+
+class TmpfsBackend(SQLiteBackend):
+    """Throw-away database files on a RAM-backed filesystem.  Same
+    behaviour as the on-disk file (WAL, several connections); nothing
+    survives close() or a reboot."""
+    kind = "tmpfs"
+
+    RAM_DIRS = ("/dev/shm", os.environ.get("XDG_RUNTIME_DIR") or "")
+
+    def __init__(self, name: str):
+        base = next((d for d in self.RAM_DIRS if d and os.path.isdir(d) and os.access(d, os.W_OK)),
+                    tempfile.gettempdir())
+        stem = os.path.splitext(os.path.basename(name))[0] or "nodes"
+        super().__init__(os.path.join(base, f"safetrack-{stem}-{uuid.uuid4().hex[:8]}.db"))
+
+    def close(self):
+        # pooled connections (reader, writer threads) would keep the deleted
+        # files, and their RAM, alive until their threads exit
+        close_connections(self.files())
+        for path in self.files():
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(path + suffix)
+                except OSError:
+                    pass
+
+
+class SharedMemoryBackend(SQLiteBackend):
+    """Named in-memory databases shared by every connection of this
+    process (shared cache).  SQLite frees one when its last connection
+    closes, so a keeper connection per file stays open until close()."""
+    kind = "memory"
+
+    def __init__(self, name: str):
+        stem = os.path.splitext(os.path.basename(name))[0] or "nodes"
+        super().__init__(f"file:safetrack-{stem}-{uuid.uuid4().hex[:8]}?mode=memory&cache=shared")
+        self._keepers = [sqlite3.connect(p, uri=True, check_same_thread=False) for p in self.files()]
+
+    def close(self):
+        close_connections(self.files())
+        for keeper in self._keepers:
+            keeper.close()
+        self._keepers = []
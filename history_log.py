@@ -1,17 +1,64 @@
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QScrollArea,
-    QFrame, QLabel, QComboBox, QSizePolicy, QCheckBox
+    QFrame, QLabel, QComboBox, QSizePolicy, QCheckBox, QLineEdit
 )
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer
 import database
+import db_async
 from login import User
 
 
+# Queries for HistoryLogPage; they run on db_async reader threads, so they
+# get the user's viewable nodes as an argument instead of reading the page.
+
+def _visible(rows, viewable, my_nodes: bool) -> list:
+    # other users' nodes are hidden, except SOS entries with the location redacted
+    out = []
+    for r in rows:
+        if r[1] not in viewable:
+            if r[2] == "SOS" and not my_nodes:
+                out.append((r[0], r[1], r[2], r[3], "(UNAUTHORIZED TO VIEW LOCATION)"))
+        else:
+            out.append(r[:5])
+    return out
+
+
+def _search(text: str, limit: int, category, viewable: tuple, my_nodes: bool) -> list:
+    rows = database.search_notifs(text, limit, category=category, node_ids=viewable if my_nodes else None)
+    # a hidden location must not be findable: other users' rows only match on the title
+    words = text.lower().split()
+    rows = [r for r in rows if r[1] in viewable or all(w in str(r[3]).lower() for w in words)]
+    return _visible(rows, viewable, my_nodes)
+
+
+def _next_page(before: tuple, page_size: int, category, viewable: tuple, my_nodes: bool) -> tuple:
+    """The next page_size visible entries after the keyset cursor `before`:
+    (rows, new cursor, exhausted)."""
+    page, exhausted = [], False
+    while len(page) < page_size and not exhausted:
+        rows = database.get_notifs_page(*before, limit=page_size, category=category,
+                                        node_ids=viewable if my_nodes else None)
+        if len(rows) < page_size:
+            exhausted = True
+        if rows:
+            before = (rows[-1][0], rows[-1][6])
+        page += _visible(rows, viewable, my_nodes)
+    return page, before, exhausted
+
+
 class HistoryLogPage(QWidget):
+    PAGE_SIZE = 50          # cards fetched per page
+    LOAD_MORE_PX = 200      # fetch the next page when scrolled this close to the bottom
+    SEARCH_LIMIT = 200      # best-ranked search results shown
+
     def __init__(self, parent=None, user:User=None):
         super().__init__(parent)
 
-        self.logs = []  # cached history log entries (only updated on refresh)
+        self.logs = []  # history log entries loaded so far (pages are appended as you scroll)
+        # keyset cursor: (time, id) of the last row fetched from the DB
+        self._before = (None, None)
+        self._exhausted = False
+        self._pending = None  # db_async.QueryFuture of the search / page in flight
         self.user = user if user else User("Guest")
 
         self.setMinimumSize(600, 400)
@@ -35,8 +82,18 @@ class HistoryLogPage(QWidget):
         )
         title_lbl = QLabel("History & Log")
         title_lbl.setStyleSheet("font-size:16px; font-weight:700; color: #cfd8ff;")
+        # full-text search over titles and messages (database.search_notifs)
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search history...")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.setStyleSheet("QLineEdit { padding:6px 10px; border:1px solid #2b3a4a; border-radius:6px; }")
+        # run the search once typing pauses
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(300)
         header_layout.addWidget(title_lbl)
         header_layout.addStretch()
+        header_layout.addWidget(self.search_box)
         # header_layout.addWidget(self.filter_combo)  # dropdown removed (use pills)
         header_layout.addWidget(self.my_nodes_checkbox)
         header_layout.addWidget(self.refresh_btn)
@@ -55,51 +112,84 @@ class HistoryLogPage(QWidget):
 
         # Connections
         self.refresh_btn.clicked.connect(self.load_history_logs)
+        self.scroll.verticalScrollBar().valueChanged.connect(self.on_scrolled)
+        self.search_box.textChanged.connect(lambda _: self._search_timer.start())
+        self.search_box.returnPressed.connect(self.load_history_logs)
+        self._search_timer.timeout.connect(self.load_history_logs)
         # The wrapper (FilteredlogsPage) will call `set_filter()` on this
         # page to apply filters via the pill buttons. Keep the slot for
         # compatibility but do not connect a dropdown signal here.
         self.my_nodes_checkbox.stateChanged.connect(self.on_my_nodes_toggled)
 
-        # Filter state: None or lowercase string
+        # Filter state: None or a category (status) name
         self.current_filter = None
         # default: show all nodes (unchecked). Keep state synced with checkbox
         self.my_nodes = False
         self.my_nodes_checkbox.setChecked(self.my_nodes)
 
     def load_history_logs(self):
-        """Fetch history log entries from the DB and populate the list of cards.
-        Intentionally only called when the Refresh button is pressed."""
-        self.logs = database.get_logs()
-        i = 0
-        while i < len(self.logs):
-            if self.logs[i][1] not in self.user.viewable_nodes:
-                if self.logs[i][2] == "SOS" and not self.my_nodes:
-                    self.logs[i] = (self.logs[i][0], self.logs[i][1], self.logs[i][2], self.logs[i][3], "(UNAUTHORIZED TO VIEW LOCATION)")
-                else:
-                    self.logs.pop(i)
-                    i -= 1
-            i += 1
-        # keep whatever current_filter is set by wrapper; default show all
-        if self.current_filter is None:
-            self._populate_list(self.logs)
+        """Reset the list and fetch the first page of history log entries.
+        Called on Refresh, when the page is shown and when a filter changes."""
+        self._search_timer.stop()
+        # results of the previous filter / search are no longer wanted
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        self.logs = []
+        self._before = (None, None)
+        self._exhausted = False
+        self._clear_list()
+        self.scroll_layout.addStretch()
+        text = self.search_box.text().strip()
+        if text:
+            # ranked results, best first; no further pages
+            self._exhausted = True
+            self._pending = db_async.submit(_search, text, self.SEARCH_LIMIT, self.current_filter,
+                                            tuple(self.user.viewable_nodes), self.my_nodes
+                                            ).then(self._search_loaded, self._load_failed)
         else:
-            wanted = self.current_filter.lower()
-            filtered = [r for r in self.logs if len(r) > 2 and str(r[2]).lower() == wanted]
-            self._populate_list(filtered)
+            self.load_more()
+
+    def _search_loaded(self, rows):
+        self._pending = None
+        self.logs = rows
+        self._append_cards(rows)
+
+    def load_more(self):
+        """Fetch the next PAGE_SIZE visible entries (newest first) on a reader
+        thread (db_async) and append their cards when they arrive."""
+        if self._pending is not None or self._exhausted:
+            return
+        self._pending = db_async.submit(_next_page, self._before, self.PAGE_SIZE, self.current_filter,
+                                        tuple(self.user.viewable_nodes), self.my_nodes
+                                        ).then(self._page_loaded, self._load_failed)
+
+    def _page_loaded(self, result):
+        self._pending = None
+        page, self._before, self._exhausted = result
+        self.logs += page
+        self._append_cards(page)
+
+    def _load_failed(self, exc):
+        self._pending = None
+        print(f"[history_log] load failed: {exc}")
+
+    def on_scrolled(self, value: int):
+        bar = self.scroll.verticalScrollBar()
+        if not self._exhausted and value >= bar.maximum() - self.LOAD_MORE_PX:
+            self.load_more()
 
     def set_filter(self, tab: str | None):
         """Apply a filter by tab name (e.g. 'All','SOS','Alert',...).
         Called by an external wrapper when pill buttons are used.
         Pass `None` or 'All' to clear the filter.
+        The category is applied in the query, so the list is reloaded.
         """
-        if tab is None or tab == "All":
-            self.current_filter = None
-            self._populate_list(self.logs)
+        category = None if tab is None or tab == "All" else tab
+        if category == self.current_filter and self.logs:
             return
-        wanted = tab.lower()
-        self.current_filter = wanted
-        filtered = [r for r in self.logs if len(r) > 2 and str(r[2]).lower() == wanted]
-        self._populate_list(filtered)
+        self.current_filter = category
+        self.load_history_logs()
 
     def _clear_list(self):
         while self.scroll_layout.count():
@@ -109,6 +199,14 @@ class HistoryLogPage(QWidget):
 
     def _populate_list(self, rows):
         self._clear_list()
+        self.scroll_layout.addStretch()
+        self._append_cards(rows)
+
+    def _append_cards(self, rows):
+        # keep the bottom stretch last
+        last = self.scroll_layout.count() - 1
+        if last >= 0 and self.scroll_layout.itemAt(last).spacerItem():
+            self.scroll_layout.takeAt(last)
         for r in rows:
             # expected row format: (time, node_id, status, Title, Message)
             time = str(r[0]) if len(r) > 0 else ""
@@ -0,0 +1,332 @@
+"""
+ingest.py
+─────────
+Group-commit writer for node packets.
+
+Packet readers (Monitor, Simulate) put rows on a queue instead of
+writing them one at a time.  A single writer thread drains the queue
+and hands batches to database.add_many_to_db(), committing when either
+`max_batch` rows are waiting or `max_delay_s` has passed since the
+first row of the batch arrived – whichever comes first.  One commit
+and one user_update signal per batch instead of per packet.
+
+The queue between readers and writer is a bounded ring buffer
+(RingQueue, `capacity` rows), so a slow commit or retention pass cannot
+grow it without limit.  When it is full, `policy` decides:
+
+  block        – the reader waits for room (nothing is lost)
+  drop_oldest  – the oldest queued non-SOS row is dropped; a non-SOS row
+                 arriving at a queue full of SOS rows is dropped itself,
+                 an SOS row waits
+  coalesce     – the new row replaces the row still queued for the same
+                 node (an SOS row is never replaced by a non-SOS one);
+                 otherwise as drop_oldest
+
+stats() reports queue depth, drops, coalesced rows, reader wait time,
+queue latency (enqueue to dequeue), commit time and failed commits.
+
+With a `journal` (db_journal.PacketJournal) every row is appended to the
+journal before it is queued, and records are resolved once committed or
+discarded by the overflow policy; the writer thread replays whatever a
+previous run left unresolved before it takes new rows.
+
+A batch whose commit fails is retried `write_retries` times with a
+growing delay; after that its rows are logged and discarded (and cleared
+from the journal) rather than left to stall it.
+
+Row format is the same as database.add_to_db():
+    (time, node_id, latitude, longitude, status)
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+
+import database
+from db_connection import close_thread_connections
+
+POLICIES = ("block", "drop_oldest", "coalesce")
+RETRY_DELAY_S = 0.25       # first delay before retrying a failed batch, doubled per retry
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class RingQueue:
+    """Bounded FIFO of node rows for GroupCommitWriter, with an overflow
+    policy (see the module docstring).  Same get / get_nowait / put / qsize
+    interface as queue.Queue, so the writer does not care which it has."""
+
+    def __init__(self, capacity: int = 4096, policy: str = "block"):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown overflow policy {policy!r} (expected one of {', '.join(POLICIES)})")
+        self.capacity = capacity
+        self.policy = policy
+        # slot i % capacity holds [enqueued_at, row]; head / tail only grow
+        self._slots: list = [None] * capacity
+        self._head = 0
+        self._tail = 0
+        self._newest: dict[int, int] = {}     # node_id -> index of its newest queued row
+        self._cond = threading.Condition()
+        # called with every queued row the policy throws away (GroupCommitWriter)
+        self.on_discard = None
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.blocked = 0
+        self.blocked_s = 0.0
+        self.high_water = 0
+        self._waits = deque(maxlen=1024)      # recent enqueue -> dequeue latencies, s
+
+    def qsize(self) -> int:
+        return self._tail - self._head
+
+    # ── producers ─────────────────────────
+
+    def put(self, row: tuple, timeout: float | None = None) -> bool:
+        """Queue *row*; False if it was dropped (policy, or `timeout` passed
+        while blocked)."""
+        with self._cond:
+            if self.qsize() >= self.capacity:
+                if self.policy == "coalesce" and self._coalesce(row):
+                    return True
+                if self.policy != "block" and not self._make_room(row):
+                    self.dropped += 1
+                    return False
+                if self.qsize() >= self.capacity and not self._wait_for_room(timeout):
+                    self.dropped += 1
+                    return False
+            i = self._tail
+            self._slots[i % self.capacity] = [time.monotonic(), row]
+            self._newest[row[1]] = i
+            self._tail += 1
+            self.enqueued += 1
+            self.high_water = max(self.high_water, self.qsize())
+            self._cond.notify_all()
+            return True
+
+    def _coalesce(self, row: tuple) -> bool:
+        i = self._newest.get(row[1])
+        if i is None:
+            return False
+        slot = self._slots[i % self.capacity]
+        if slot[1][4] == "SOS" and row[4] != "SOS":
+            return False
+        self._discard(slot[1])
+        slot[1] = row       # keeps its place in line and its enqueue time
+        self.coalesced += 1
+        return True
+
+    def _make_room(self, row: tuple) -> bool:
+        # drop the oldest non-SOS row; False when there is none and row must go instead
+        for i in range(self._head, self._tail):
+            if self._slots[i % self.capacity][1][4] != "SOS":
+                break
+        else:
+            # only SOS rows queued: an SOS row waits for room, anything else is dropped
+            return row[4] == "SOS"
+        self._discard(self._slots[i % self.capacity][1])
+        self._forget(i)
+        # close the gap: the (SOS) rows ahead of it move back one slot
+        for j in range(i, self._head, -1):
+            moved = self._slots[(j - 1) % self.capacity]
+            self._slots[j % self.capacity] = moved
+            if self._newest.get(moved[1][1]) == j - 1:
+                self._newest[moved[1][1]] = j
+        self._slots[self._head % self.capacity] = None
+        self._head += 1
+        self.dropped += 1
+        return True
+
+    def _discard(self, row: tuple):
+        if self.on_discard is not None:
+            self.on_discard([row])
+
+    def _forget(self, i: int):
+        node_id = self._slots[i % self.capacity][1][1]
+        if self._newest.get(node_id) == i:
+            del self._newest[node_id]
+
+    def _wait_for_room(self, timeout: float | None) -> bool:
+        self.blocked += 1
+        t0 = time.monotonic()
+        ok = self._cond.wait_for(lambda: self.qsize() < self.capacity, timeout)
+        self.blocked_s += time.monotonic() - t0
+        return ok
+
+    # ── consumer ──────────────────────────
+
+    def get(self, block: bool = True, timeout: float | None = None) -> tuple:
+        with self._cond:
+            if not self._cond.wait_for(self.qsize, timeout if block else 0):
+                raise queue.Empty
+            i = self._head
+            enqueued_at, row = self._slots[i % self.capacity]
+            self._forget(i)
+            self._slots[i % self.capacity] = None
+            self._head += 1
+            self._waits.append(time.monotonic() - enqueued_at)
+            self._cond.notify_all()
+            return row
+
+    def get_nowait(self) -> tuple:
+        return self.get(block=False)
+
+    def stats(self) -> dict:
+        with self._cond:
+            waits = list(self._waits)
+        return {
+            "depth": self.qsize(),
+            "capacity": self.capacity,
+            "policy": self.policy,
+            "high_water": self.high_water,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "blocked": self.blocked,
+            "blocked_ms": round(self.blocked_s * 1000, 3),
+            "latency_ms_p50": round(_percentile(waits, 0.5) * 1000, 3),
+            "latency_ms_p99": round(_percentile(waits, 0.99) * 1000, 3),
+            "latency_ms_max": round(max(waits, default=0.0) * 1000, 3),
+        }
+
+
+class GroupCommitWriter:
+    def __init__(self, db: str | None = None, max_batch: int = 256,
+                 max_delay_s: float = 0.5, row_queue: queue.Queue | RingQueue | None = None,
+                 capacity: int = 4096, policy: str = "block", journal=None,
+                 write_retries: int = 3):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay_s = max_delay_s
+        self.queue = row_queue if row_queue is not None else RingQueue(capacity, policy)
+        self.journal = journal
+        if journal is not None and isinstance(self.queue, RingQueue):
+            self.queue.on_discard = journal.discard
+        self.write_retries = write_retries
+        self.batches = 0
+        self.rows_written = 0
+        self.retries = 0
+        self.rows_failed = 0
+        self.commit_s_last = 0.0
+        self.commit_s_max = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def submit(self, row: tuple) -> bool:
+        """Queue one row for the next batch.  Never waits on the database;
+        with the "block" policy it waits for room in a full queue.  False
+        when the overflow policy dropped the row."""
+        if self.journal is not None:
+            row = self.journal.append(row)
+        if self.queue.put(row) is False:
+            if self.journal is not None:
+                self.journal.discard([row])
+            return False
+        return True
+
+    def stats(self) -> dict:
+        stats = self.queue.stats() if isinstance(self.queue, RingQueue) else {"depth": self.queue.qsize()}
+        stats.update(batches=self.batches, rows_written=self.rows_written,
+                     retries=self.retries, rows_failed=self.rows_failed,
+                     commit_ms_last=round(self.commit_s_last * 1000, 3),
+                     commit_ms_max=round(self.commit_s_max * 1000, 3))
+        if self.journal is not None:
+            stats["journal"] = self.journal.stats()
+        return stats
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="GroupCommitWriter", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float | None = 5.0):
+        """Flush whatever is queued and stop the writer thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _next_batch(self) -> list:
+        try:
+            batch = [self.queue.get(timeout=0.2)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_delay_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self) -> list:
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _write(self, batch: list):
+        for i in range(0, len(batch), self.max_batch):
+            chunk = batch[i:i + self.max_batch]
+            delay = RETRY_DELAY_S
+            for attempt in range(self.write_retries + 1):
+                try:
+                    self._commit(chunk)
+                    break
+                except Exception as exc:
+                    if attempt == self.write_retries:
+                        self._give_up(chunk, exc)
+                        break
+                    print(f"[ingest] batch of {len(chunk)} rows failed: {exc}; retrying in {delay}s")
+                    self.retries += 1
+                    time.sleep(delay)
+                    delay *= 2
+
+    def _commit(self, chunk: list):
+        t0 = time.perf_counter()
+        self.rows_written += database.add_many_to_db(chunk, self.db)
+        self.commit_s_last = time.perf_counter() - t0
+        self.commit_s_max = max(self.commit_s_max, self.commit_s_last)
+        self.batches += 1
+        if self.journal is not None:
+            self.journal.resolve(chunk)
+            self.journal.sync()
+
+    def _give_up(self, chunk: list, exc: Exception):
+        # retrying forever would stall the queue and the journal watermark
+        self.rows_failed += len(chunk)
+        print(f"***ERROR: BATCH OF {len(chunk)} ROWS DROPPED AFTER {self.write_retries + 1} FAILED COMMITS: {exc}***")
+        for row in chunk:
+            print(f"[ingest] dropped {tuple(row)}")
+        if self.journal is not None:
+            self.journal.discard(chunk)
+
+    def _run(self):
+        if self.journal is not None:
+            try:
+                self.journal.replay(self.db)
+            except Exception as exc:
+                print(f"[ingest] journal replay failed: {exc}")
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+        # final flush on shutdown
+        self._write(self._drain())
+        if self.journal is not None:
+            self.journal.sync(force=True)
+        close_thread_connections()
@@ -29,6 +29,7 @@ from PyQt6.QtGui import (
 )
 
 import auth_database as adb
+import db_async
 from auth_utils import (
     validate_username, validate_password,
     validate_email, validate_fullname,
@@ -372,7 +373,7 @@ class _LoginPage(QWidget):
 
         lay.addSpacing(8)
 
-        login_btn = _primary_btn("Log In")
+        self.login_btn = login_btn = _primary_btn("Log In")
         login_btn.setShortcut(QKeySequence("Return"))
         login_btn.clicked.connect(self._handle)
         lay.addWidget(login_btn)
@@ -424,26 +425,45 @@ class _LoginPage(QWidget):
         if has_error:
             return
 
-        result = adb.authenticate_user(username, password)
-        if result is None:
+        # bcrypt and the node list run on a reader thread (db_async) so the
+        # window keeps painting; never collapsed with another attempt (key=None)
+        self.login_btn.setEnabled(False)
+        db_async.submit(_authenticate, username, password, key=None).then(
+            self._on_authenticated, self._on_auth_error)
+
+    def _on_authenticated(self, user):
+        self.login_btn.setEnabled(True)
+        if user is None:
             _set_hint(self.h_user, "Invalid username or password.")
             _set_hint(self.h_pass, "Invalid username or password.")
             _set_field_state(self.f_user, "invalid")
             _set_field_state(self.f_pass, "invalid")
             return
-
-        import database
-        viewable = database.get_nodes() if result["is_admin"] else []
-
-        user = User(
-            username=result["username"],
-            is_admin=result["is_admin"],
-            email=result["email"],
-            fullname=result["fullname"],
-            viewable_nodes=viewable,
-        )
         self.login_success.emit(user)
 
+    def _on_auth_error(self, exc):
+        self.login_btn.setEnabled(True)
+        print(f"[login] authenticate failed: {exc}")
+        self.err.setText("Could not log in. Try again.")
+
+
+def _authenticate(username: str, password: str) -> User | None:
+    """The logged-in User, or None for bad credentials (db_async reader thread)."""
+    result = adb.authenticate_user(username, password)
+    if result is None:
+        return None
+
+    import database
+    viewable = database.get_nodes() if result["is_admin"] else []
+
+    return User(
+        username=result["username"],
+        is_admin=result["is_admin"],
+        email=result["email"],
+        fullname=result["fullname"],
+        viewable_nodes=viewable,
+    )
+
 
 # ════════════════════════════════════════════════════════════════
 # PAGE 1 – SIGN UP  (with real-time inline validation)
@@ -0,0 +1,263 @@
+"""
+maintenance.py
+──────────────
+Background maintenance for the node database.
+
+MaintenanceScheduler runs these jobs on their own thread, each on its
+own cadence (seconds, see DEFAULT_INTERVALS):
+
+  retention   – drop expired node partitions / notifications and trail
+                points older than trail_days (replaces the
+                delete_before_time calls that used to run after every
+                packet in Monitor and Simulate).  Rolls up first, so no
+                hour is dropped before it is in the trail and aggregates.
+  rollup      – database.rollup_history(): thin closed hours into the
+                downsampled trail and hourly aggregates (db_rollup.py)
+  vacuum      – PRAGMA incremental_vacuum, returning free pages to the OS.
+                New files are created auto_vacuum=INCREMENTAL (db_connection);
+                older ones are skipped until enable_incremental_vacuum()
+                converts them (one full VACUUM each, holding the file's
+                write lock: run it before the ingest writer starts, or by
+                hand with `python maintenance.py [nodes.db]`).
+  analyze     – bounded ANALYZE + PRAGMA optimize so plans track the data
+  checkpoint  – PRAGMA wal_checkpoint(TRUNCATE) so the -wal files stay small
+
+The SQL jobs run on each database file of the backend in turn
+(telemetry, notifications, auth; see db_files.py), always on `main` so
+the attached telemetry file is not processed twice.
+
+While ingest is busy (another connection had to wait for the write
+lock since the last tick, or the optional writer queue is backed up)
+due jobs are postponed with exponential backoff.  No job is deferred
+longer than `max_defer_s`, so retention cannot starve.
+
+Every run is recorded as a JobReport (duration and what was reclaimed);
+see `reports` / `history`.
+
+On a backend without SQL (db_backend "dict") only retention and rollup
+have work to do; vacuum / analyze / checkpoint report nothing.
+"""
+
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+import database
+import db_backend
+import db_connection
+
+DEFAULT_INTERVALS = {
+    "retention": 60,
+    "rollup": 5 * 60,
+    "checkpoint": 5 * 60,
+    "vacuum": 15 * 60,
+    "analyze": 60 * 60,
+}
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+@dataclass
+class JobReport:
+    job: str
+    started: str
+    duration_ms: float
+    reclaimed: dict = field(default_factory=dict)
+    error: str = ""
+
+
+def _pragma(conn, name: str) -> int:
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+class MaintenanceScheduler:
+    def __init__(self, db: str | None = None, retention_hrs: int = 48, trail_days: int = 30,
+                 intervals: dict | None = None, writer=None,
+                 busy_queue_depth: int = 64, max_defer_s: float = 300.0,
+                 vacuum_pages: int = 2000):
+        self.db = db_backend.get_backend(db)
+        self.retention_hrs = retention_hrs
+        self.trail_days = trail_days
+        self.intervals = dict(DEFAULT_INTERVALS, **(intervals or {}))
+        self.writer = writer                  # optional ingest.GroupCommitWriter
+        self.busy_queue_depth = busy_queue_depth
+        self.max_defer_s = max_defer_s
+        self.vacuum_pages = vacuum_pages
+
+        self.reports: dict[str, JobReport] = {}
+        self.history: deque[JobReport] = deque(maxlen=200)
+        self.deferrals = 0
+
+        now = time.monotonic()
+        # retention runs straight away, the rest after one interval
+        self._next_run = {job: now + (0 if job == "retention" else every)
+                          for job, every in self.intervals.items()}
+        self._due_since: dict[str, float] = {}
+        self._last_lock_waits = db_connection.get_stats()["lock_waits"]
+        self._backoff_s = 1.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ── lifecycle ─────────────────────────
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="MaintenanceScheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float | None = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_now(self, job: str) -> JobReport:
+        """Run one job immediately on the calling thread."""
+        return self._run_job(job)
+
+    # ── scheduling ────────────────────────
+
+    def ingest_busy(self) -> bool:
+        if self.writer is not None and self.writer.queue.qsize() >= self.busy_queue_depth:
+            return True
+        waits = db_connection.get_stats()["lock_waits"]
+        busy = waits > self._last_lock_waits
+        self._last_lock_waits = waits
+        return busy
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            due = [job for job, at in self._next_run.items() if at <= now]
+            for job in due:
+                self._due_since.setdefault(job, now)
+            if due and self.ingest_busy():
+                overdue = [j for j in due if now - self._due_since[j] >= self.max_defer_s]
+                if not overdue:
+                    self.deferrals += 1
+                    self._stop.wait(self._backoff_s)
+                    self._backoff_s = min(self._backoff_s * 2, 30.0)
+                    continue
+                due = overdue
+            self._backoff_s = 1.0
+            for job in due:
+                if self._stop.is_set():
+                    break
+                self._run_job(job)
+                self._due_since.pop(job, None)
+                self._next_run[job] = time.monotonic() + self.intervals[job]
+            self._stop.wait(1.0)
+        db_connection.close_thread_connections()
+
+    def _run_job(self, job: str) -> JobReport:
+        started = datetime.now().strftime(TIME_FORMAT)
+        t0 = time.perf_counter()
+        try:
+            reclaimed = getattr(self, f"_job_{job}")()
+            error = ""
+        except Exception as exc:
+            reclaimed, error = {}, str(exc)
+        report = JobReport(job, started, round((time.perf_counter() - t0) * 1000, 3), reclaimed, error)
+        self.reports[job] = report
+        self.history.append(report)
+        print(f"[maintenance] {job}: {report.duration_ms} ms {reclaimed or ''}{' ERROR ' + error if error else ''}")
+        return report
+
+    # ── jobs ──────────────────────────────
+
+    def _job_retention(self) -> dict:
+        now = datetime.now()
+        cutoff = (now - timedelta(hours=self.retention_hrs)).strftime(TIME_FORMAT)
+        trail_cutoff = (now - timedelta(days=self.trail_days)).strftime(TIME_FORMAT)
+        conns = self._connections()
+        free_before = sum(_pragma(c, "main.freelist_count") for c in conns)
+        # normally a no-op: the rollup job has already seen these hours
+        rolled = database.rollup_history(cutoff, self.db)
+        partitions = database.delete_before_time(cutoff, "nodes", self.db)
+        trail = database.delete_before_time(trail_cutoff, "trail", self.db)
+        notifications = database.delete_before_time(cutoff, "notifications", self.db)
+        return {
+            "hours_rolled_up": rolled.get("hours", 0),
+            "partitions_dropped": partitions or 0,
+            "trail_points_deleted": trail or 0,
+            "notifications_deleted": notifications or 0,
+            "pages_freed": sum(_pragma(c, "main.freelist_count") for c in conns) - free_before,
+        }
+
+    def _job_rollup(self) -> dict:
+        return database.rollup_history(datetime.now().strftime(TIME_FORMAT), self.db)
+
+    def _connections(self) -> list:
+        # one connection per database file; empty when the backend has no SQLite database
+        return [db_connection.get_connection(p) for p in self.db.files()]
+
+    def _job_vacuum(self) -> dict:
+        conns = self._connections()
+        if not conns:
+            return {}
+        pages_freed = bytes_freed = not_incremental = 0
+        for conn in conns:
+            if conn.in_transaction:
+                conn.commit()
+            if _pragma(conn, "main.auto_vacuum") != 2:
+                # converting needs a full VACUUM, never run under live ingest
+                not_incremental += 1
+                continue
+            page_size = _pragma(conn, "main.page_size")
+            pages_before = _pragma(conn, "main.page_count")
+            conn.execute(f"PRAGMA main.incremental_vacuum({self.vacuum_pages})").fetchall()
+            freed = pages_before - _pragma(conn, "main.page_count")
+            pages_freed += freed
+            bytes_freed += freed * page_size
+        return {"pages_freed": pages_freed, "bytes_freed": bytes_freed, "not_incremental": not_incremental}
+
+    def _job_analyze(self) -> dict:
+        for conn in self._connections():
+            conn.execute("PRAGMA analysis_limit = 400")
+            conn.execute("ANALYZE main")
+            conn.execute("PRAGMA main.optimize")
+            conn.commit()
+        return {}
+
+    def _job_checkpoint(self) -> dict:
+        conns = self._connections()
+        if not conns:
+            return {}
+        wal_pages = checkpointed = 0
+        busy = False
+        for conn in conns:
+            if conn.in_transaction:
+                conn.commit()
+            b, w, c = conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE)").fetchone()
+            # -1 for a file that is not in WAL mode (in-memory databases)
+            busy, wal_pages, checkpointed = busy or bool(b), wal_pages + max(w, 0), checkpointed + max(c, 0)
+        return {"wal_pages": wal_pages, "checkpointed": checkpointed, "busy": busy}
+
+
+def enable_incremental_vacuum(db: str | None = None) -> list:
+    """Switch every database file of *db* that is not auto_vacuum=INCREMENTAL
+    yet, with one full VACUUM each; returns the converted files.  The VACUUM
+    holds the file's write lock for the whole rewrite, so call this before
+    the ingest writer starts, never while it is running."""
+    converted = []
+    for path in db_backend.get_backend(db).files():
+        conn = db_connection.get_connection(path)
+        if conn.in_transaction:
+            conn.commit()
+        if _pragma(conn, "main.auto_vacuum") == 2:
+            continue
+        # auto_vacuum only takes effect after a full VACUUM
+        conn.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM main")
+        converted.append(path)
+        print(f"[maintenance] {path}: converted to auto_vacuum=INCREMENTAL")
+    return converted
+
+
+if __name__ == "__main__":
+    enable_incremental_vacuum(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -7,8 +7,29 @@ from PyQt6.QtWebEngineCore import QWebEngineSettings
 import folium
 from folium.plugins import MarkerCluster
 import database
+import db_async
 from login import User
 
+
+# Map queries; they run on db_async reader threads.
+
+def _fetch_markers(nodes: list) -> tuple:
+    # change-feed position taken before the snapshot so nothing committed in between is skipped
+    seq = database.get_latest_seq()
+    # one query for every marker instead of get_GPS + get_status per node
+    return seq, database.get_fleet_snapshot(nodes)
+
+
+def _changed_since(seq: int, nodes: set) -> tuple:
+    # (whether any of `nodes` has packets after seq, feed position read up to)
+    while True:
+        events = database.get_changes_since(seq, kinds=("node",))
+        if not events:
+            return False, seq
+        seq = events[-1][0]
+        if any(row[1] in nodes for _, _, row in events):
+            return True, seq
+
 class MapDisplay(QWidget):
 
     def __init__(self, center_coord: tuple, user: User):
@@ -21,6 +42,10 @@ class MapDisplay(QWidget):
         # It defaults to the initial coordinate but can be changed
         # by `center_on_node` or by passing a location to `update_map`.
         self.current_center = self.coordinate
+        # change-feed position of the last redraw (see refresh_if_changed)
+        self._seq = 0
+        # db_async.QueryFuture of the marker fetch in flight
+        self._pending = None
 
         self.setWindowTitle("SafeTrack Map")
         self.setMinimumSize(800, 600)
@@ -99,11 +124,19 @@ class MapDisplay(QWidget):
         # If a new location is provided, make it the current center.
         if location is not None:
             self.current_center = location
-        self.m = self.create_map(location, zoom_start)
-
-        
         self.nodes = self.user.viewable_nodes
         print(f"Updating map with nodes: {self.nodes}")
+        # markers are fetched on a reader thread (db_async); the map is redrawn
+        # when they arrive, and a newer update replaces one still in flight
+        if self._pending is not None:
+            self._pending.cancel()
+        self._pending = db_async.submit(_fetch_markers, list(self.nodes)).then(
+            lambda fetched: self._draw(location, zoom_start, fetched))
+
+    def _draw(self, location, zoom_start, fetched):
+        self._pending = None
+        self._seq, snapshot = fetched
+        self.m = self.create_map(location, zoom_start)
 
         #Cluster color function: if any child marker has SOS status, cluster is orange; otherwise blue
 
@@ -148,11 +181,14 @@ class MapDisplay(QWidget):
 
         for node in self.nodes:
             try:
-                cur_gps = database.get_GPS(node)
+                if node not in snapshot:
+                    raise ValueError(node)
+                lat, lon, status = snapshot[node]
+                cur_gps = (lat, lon)
                 icon_img = os.path.abspath("images/green_icon.png")
                 cluster_type = "Normal"
 
-                if database.get_status(node) == "SOS":
+                if status == "SOS":
                     icon_img = os.path.abspath("images/red_icon.png")
                     cluster_type = "SOS"
                     folium.Circle(
@@ -173,6 +209,21 @@ class MapDisplay(QWidget):
                 continue
         self.refresh_view()
 
+    def refresh_if_changed(self):
+        """Redraw only if a viewable node has new packets since the last redraw."""
+        nodes = set(self.user.viewable_nodes)
+        if nodes != set(self.nodes):
+            self.update_map()
+        elif self._pending is None:
+            db_async.submit(_changed_since, self._seq, nodes).then(self._on_changes)
+
+    def _on_changes(self, result):
+        changed, seq = result
+        if changed:
+            self.update_map()
+        elif self._pending is None:
+            self._seq = seq
+
     def refresh_view(self):
         data = io.BytesIO()
         self.m.save(data, close_file=False)
@@ -184,13 +235,12 @@ class MapDisplay(QWidget):
         self.webView.setHtml(html, base_url)
 
     def center_on_node(self, node_id):
-        try:
-            gps = database.get_GPS(node_id)
-            print(f"center_on_node: node_id={node_id}, gps={gps}")
-            if gps:
-                self.update_map(location = gps, zoom_start = 16)
-                self.refresh_view()
-            else:
-                print(f"***ERROR: No GPS data for node {node_id}***")
-        except ValueError:
-            print(f"***ERROR: Node {node_id} does not exist***")
\ No newline at end of file
+        db_async.submit(database.get_GPS, node_id).then(lambda gps: self._center_on(node_id, gps))
+
+    def _center_on(self, node_id, gps):
+        print(f"center_on_node: node_id={node_id}, gps={gps}")
+        if gps:
+            # update_map redraws (refresh_view) once the markers arrive
+            self.update_map(location = gps, zoom_start = 16)
+        else:
+            print(f"***ERROR: No GPS data for node {node_id}***")
\ No newline at end of file
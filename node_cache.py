@@ -0,0 +1,186 @@
+"""
+node_cache.py
+─────────────
+Process-wide, write-through cache of the latest state of every node.
+
+db_sqlite.py updates the cache right after each ingest commit and serves
+get_db / get_nodes / get_recent_info / get_GPS / get_status / in_db /
+get_fleet_snapshot from it.  Only the first read after start-up (or after
+invalidate()) touches SQLite, to warm the cache from node_latest.
+db_memory.DictBackend keeps its own NodeStateCache as its latest-state table.
+
+Each node is one _NodeState object with __slots__: integer time and
+microdegree coordinates plus an interned status string.  A fleet of
+10k nodes is about 1 MB.
+
+Versions
+--------
+  cache.version      – bumped once per apply() that changed something
+  state(id).version  – bumped every time that node changes
+
+Callbacks registered with subscribe() are called after every apply()
+that changed something, outside the lock, with a list of
+(node_id, old_row | None, new_row).  Rows use the public tuple format
+(time, node_id, latitude, longitude, status).
+"""
+
+import sys
+import threading
+from datetime import datetime, timezone
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _fmt_time(time_ms: int) -> str:
+    return datetime.fromtimestamp(time_ms // 1000, tz=timezone.utc).strftime(TIME_FORMAT)
+
+
+class _NodeState:
+    __slots__ = ("time_ms", "lat_e6", "lon_e6", "status", "version")
+
+    def __init__(self, time_ms: int, lat_e6: int, lon_e6: int, status: str):
+        self.time_ms = time_ms
+        self.lat_e6 = lat_e6
+        self.lon_e6 = lon_e6
+        self.status = status
+        self.version = 1
+
+    def row(self, node_id: int) -> tuple:
+        return (_fmt_time(self.time_ms), node_id, self.lat_e6 / 1e6, self.lon_e6 / 1e6, self.status)
+
+
+class NodeStateCache:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._nodes: dict[int, _NodeState] = {}
+        self._callbacks = []
+        self.loaded = False
+        self.version = 0
+
+    # ── writes ────────────────────────────
+
+    def _upsert(self, time_ms, node_id, lat_e6, lon_e6, status, changes: list):
+        cur = self._nodes.get(node_id)
+        if cur is None:
+            self._nodes[node_id] = _NodeState(time_ms, lat_e6, lon_e6, sys.intern(status))
+            changes.append((node_id, None, self._nodes[node_id].row(node_id)))
+            return
+        if time_ms < cur.time_ms:
+            return  # late packet; history only (same rule as the node_latest trigger)
+        if (time_ms, lat_e6, lon_e6, status) == (cur.time_ms, cur.lat_e6, cur.lon_e6, cur.status):
+            return
+        old = cur.row(node_id)
+        cur.time_ms, cur.lat_e6, cur.lon_e6, cur.status = time_ms, lat_e6, lon_e6, sys.intern(status)
+        cur.version += 1
+        changes.append((node_id, old, cur.row(node_id)))
+
+    def apply(self, rows) -> list:
+        """Write-through from ingest. *rows* are encoded
+        (time_ms, node_id, lat_e6, lon_e6, status) tuples. Returns the changes."""
+        changes = []
+        with self._lock:
+            for r in rows:
+                self._upsert(*r, changes)
+            if changes:
+                self.version += 1
+        self._notify(changes)
+        return changes
+
+    def load(self, rows):
+        """Warm from node_latest; rows newer in the cache (written while
+        the warm-up query ran) win."""
+        with self._lock:
+            for r in rows:
+                self._upsert(*r, [])
+            self.loaded = True
+            self.version += 1
+
+    def remove_before(self, time_ms: int) -> list:
+        """Drop nodes whose latest packet is older than *time_ms* (retention)."""
+        changes = []
+        with self._lock:
+            for node_id in [n for n, s in self._nodes.items() if s.time_ms < time_ms]:
+                changes.append((node_id, self._nodes.pop(node_id).row(node_id), None))
+            if changes:
+                self.version += 1
+        self._notify(changes)
+        return changes
+
+    def invalidate(self):
+        """Forget everything; the next read re-warms from disk."""
+        with self._lock:
+            self._nodes.clear()
+            self.loaded = False
+            self.version += 1
+
+    # ── reads ─────────────────────────────
+
+    def get(self, node_id: int) -> tuple | None:
+        with self._lock:
+            s = self._nodes.get(node_id)
+            return s.row(node_id) if s is not None else None
+
+    def time_ms(self, node_id: int) -> int | None:
+        with self._lock:
+            s = self._nodes.get(node_id)
+            return s.time_ms if s is not None else None
+
+    def state_version(self, node_id: int) -> int:
+        with self._lock:
+            s = self._nodes.get(node_id)
+            return s.version if s is not None else 0
+
+    def node_ids(self) -> list:
+        with self._lock:
+            return sorted(self._nodes)
+
+    def rows(self) -> list:
+        with self._lock:
+            return [self._nodes[n].row(n) for n in sorted(self._nodes)]
+
+    def snapshot(self, node_ids=None) -> dict:
+        """{node_id: (latitude, longitude, status)}; unknown ids are left out."""
+        with self._lock:
+            ids = self._nodes.keys() if node_ids is None else node_ids
+            out = {}
+            for n in ids:
+                s = self._nodes.get(n)
+                if s is not None:
+                    out[n] = (s.lat_e6 / 1e6, s.lon_e6 / 1e6, s.status)
+            return out
+
+    # ── callbacks ─────────────────────────
+
+    def subscribe(self, callback):
+        with self._lock:
+            if callback not in self._callbacks:
+                self._callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def _notify(self, changes: list):
+        if not changes:
+            return
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for cb in callbacks:
+            try:
+                cb(changes)
+            except Exception as exc:
+                print(f"[node_cache] callback {cb} failed: {exc}")
+
+
+_caches: dict[str, NodeStateCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(db: str = "nodes.db") -> NodeStateCache:
+    """The process-wide cache for database file *db*."""
+    with _caches_lock:
+        cache = _caches.get(db)
+        if cache is None:
+            cache = _caches[db] = NodeStateCache()
+        return cache
@@ -0,0 +1,96 @@
+"""
+notif_events.py
+───────────────
+Structured notifications.
+
+Notifications are stored as an event type plus its facts (node, position,
+old and new status); see the notifications table, migration 13.  Title
+and message are rendered from those facts only when a row is read for
+display, so filtering and redaction never parse text.
+
+Rows written before migration 13, and free-form notifications added with
+database.add_notif(), are Event.CUSTOM and keep their stored title and
+message; redact() blanks the position out of that text the way the old
+text-only redaction did.
+"""
+
+import re
+from enum import IntEnum
+from typing import NamedTuple
+
+
+class Event(IntEnum):
+    CUSTOM = 0      # free text in Title / Message
+    ADDED = 1       # node seen for the first time
+    REMOVED = 2     # node dropped out (retention)
+    STATUS = 3      # status changed (SOS / inactive / active / other)
+    LOCATION = 4    # moved, same status
+
+
+class Notif(NamedTuple):
+    """A notification as shown to the user.  Indexes 0-5 are the
+    (time, node_id, status, Title, Message, is_read) tuple the UI has
+    always used; the structured fields follow."""
+    time: str
+    node_id: int
+    status: str                     # display category: SOS / Alert / Info / System
+    title: str
+    message: str
+    is_read: int = 0
+    id: int | None = None
+    event: Event = Event.CUSTOM
+    lat: float | None = None
+    lon: float | None = None
+    old_status: str | None = None
+    new_status: str | None = None
+
+
+# (category, title, message prefix) per event; the position follows the prefix
+_STATUS_TEXT = {
+    "SOS": ("SOS", "Node {node} SOS Alert", "Location"),
+    "inactive": ("Alert", "Node {node} Disconnected", "Last known location"),
+    "active": ("Alert", "Node {node} Reconnected", "Present location"),
+}
+
+
+def _text(event: Event, node_id: int, new_status: str | None) -> tuple[str, str, str]:
+    if event == Event.ADDED:
+        if new_status == "SOS":
+            return "SOS", f"New Node {node_id} SOS Alert", "Current location"
+        return "System", f"Node {node_id} has been added", "Current location"
+    if event == Event.REMOVED:
+        return "System", f"Node {node_id} has been removed", "Last recorded location"
+    if event == Event.STATUS:
+        category, title, prefix = _STATUS_TEXT.get(
+            new_status, ("Info", "Node {node} Status: " + str(new_status), "Location"))
+        return category, title.format(node=node_id), prefix
+    if event == Event.LOCATION:
+        return "Info", f"Node {node_id} Location Update", "Location"
+    raise ValueError(f"no template for event {event!r}")
+
+
+def category(event: Event, new_status: str | None = None) -> str:
+    return _text(Event(event), 0, new_status)[0]
+
+
+def render(event: Event, node_id: int, lat: float | None, lon: float | None,
+           new_status: str | None = None, hide_location: bool = False) -> tuple[str, str]:
+    """(title, message) for a structured event."""
+    _, title, prefix = _text(Event(event), node_id, new_status)
+    if hide_location or lat is None or lon is None:
+        return title, f"{prefix}: (UNAUTHORIZED)"
+    return title, f"{prefix}: {lat:.6f}, {lon:.6f}"
+
+
+# free text of CUSTOM rows: whatever follows "...location: ", and any bare
+# "lat, lon" pair
+_CUSTOM_POSITION = re.compile(r"(?<=location: ).*|-?\d+\.\d+\s*,\s*-?\d+\.\d+", re.IGNORECASE)
+
+
+def redact(n: Notif) -> Notif:
+    """The same notification with its position removed."""
+    if n.event == Event.CUSTOM:
+        message = _CUSTOM_POSITION.sub("(UNAUTHORIZED)", n.message) if n.message else n.message
+        return n._replace(message=message, lat=None, lon=None)
+    _, message = render(n.event, n.node_id, None, None, n.new_status, hide_location=True)
+    return n._replace(message=message, lat=None, lon=None)
@@ -1,9 +1,11 @@
 # ----------------- Notifications Backend -----------------
 
-# Notif = (time, node_id, status, title, message, is_read)
+# Notif = (time, node_id, status, title, message, is_read, id, event, lat, lon, ...)
+# see notif_events.Notif
 
 import database
 from datetime import datetime
+from notif_events import Event, Notif
 
 def _parse_time(val: str) -> datetime:
     try:
@@ -15,14 +17,14 @@ def _parse_time(val: str) -> datetime:
             return datetime.min
 
 
-def create_notification(data: list[tuple], old_data: list[tuple]) -> list[tuple]:
+def create_notification(data: list[tuple], old_data: list[tuple]) -> list[Notif]:
     """Compare `data` and `old_data` per-node and return only new
     notifications for added/removed nodes and meaningful updates.
     - status changes (inactive/active/SOS) produce status notifications
     - location changes (lat/lon) produce location notifications
     - time-only changes produce no notification
     """
-    new_notifs: list[tuple] = []
+    new_notifs: list[Notif] = []
 
     # build latest-row lookup by node_id for both datasets
     def to_dict(rows: list[tuple]) -> dict:
@@ -59,30 +61,18 @@ def create_notification(data: list[tuple], old_data: list[tuple]) -> list[tuple]
 
     return new_notifs
 
-def new_row_notifications(data: tuple) -> tuple:
-    # Title should describe the event; status/type goes in the third field.
-    if data[4] == "SOS":
-        title = f"New Node {data[1]} SOS Alert"
-        # data[2] = latitude, data[3] = longitude
-        message = f"Current location: {data[2]:.6f}, {data[3]:.6f}"
-        n = (data[0], data[1], "SOS", title, message, 0)
-    else:
-        title = f"Node {data[1]} has been added"
-        message = f"Current location: {data[2]:.6f}, {data[3]:.6f}"
-        n = (data[0], data[1], "System", title, message, 0)
-    database.add_notif(n)
-    return n
-
-def removed_row_notifications(data: tuple) -> tuple:
-    title = f"Node {data[1]} has been removed"
-    message = f"Last recorded location: {data[2]:.6f}, {data[3]:.6f}"
-    n = (data[0], data[1], "System", title, message, 0)
-    database.add_notif(n)
-    return n
-
-def updated_row_notifications(old_row: tuple, new_row: tuple) -> tuple:
-    """Compare an old_row and new_row for a node and return a notification
-    tuple if a meaningful change occurred; otherwise return None.
+def new_row_notifications(data: tuple) -> Notif:
+    # data = (time, node_id, latitude, longitude, status)
+    return database.add_event_notif(data[0], data[1], Event.ADDED, data[2], data[3],
+                                    new_status=data[4])
+
+def removed_row_notifications(data: tuple) -> Notif:
+    return database.add_event_notif(data[0], data[1], Event.REMOVED, data[2], data[3],
+                                    old_status=data[4])
+
+def updated_row_notifications(old_row: tuple, new_row: tuple) -> Notif | None:
+    """Compare an old_row and new_row for a node and return the stored
+    notification if a meaningful change occurred; otherwise return None.
     """
     # expected row format: (time, node_id, latitude, longitude, status)
     try:
@@ -97,39 +87,31 @@ def updated_row_notifications(old_row: tuple, new_row: tuple) -> tuple:
     node = new_row[1]
     # Status change has priority
     if old_status != new_status:
-        if new_status == "SOS":
-            title = f"Node {node} SOS Alert"
-            # new_lat, new_lon computed from new_row (lat, long)
-            message = f"Location: {new_lat:.6f}, {new_lon:.6f}"
-            n = (new_row[0], node, "SOS", title, message, 0)
-        elif new_status == "inactive":
-            title = f"Node {node} Disconnected"
-            message = f"Last known location: {new_lat:.6f}, {new_lon:.6f}"
-            n = (new_row[0], node, "Alert", title, message, 0)
-        elif new_status == "active":
-            title = f"Node {node} Reconnected"
-            message = f"Present location: {new_lat:.6f}, {new_lon:.6f}"
-            n = (new_row[0], node, "Alert", title, message, 0)
-        else:
-            title = f"Node {node} Status: {new_status}"
-            message = f"Location: {new_lat:.6f}, {new_lon:.6f}"
-            n = (new_row[0], node, "Info", title, message, 0)
-        database.add_notif(n)
-        return n
+        return database.add_event_notif(new_row[0], node, Event.STATUS, new_lat, new_lon,
+                                        old_status=old_status, new_status=new_status)
 
     # No status change -> check location change (consider small epsilon)
     eps = 1e-6
     if abs(old_lat - new_lat) > eps or abs(old_lon - new_lon) > eps:
-        title = f"Node {node} Location Update"
-        message = f"Location: {new_lat:.6f}, {new_lon:.6f}"
-        n = (new_row[0], node, "Info", title, message, 0)
-        database.add_notif(n)
-        return n
+        return database.add_event_notif(new_row[0], node, Event.LOCATION, new_lat, new_lon,
+                                        old_status=old_status, new_status=new_status)
 
     # Only time changed or identical -> no notification
     return None
 
 
+def _fetch_unread(username: str) -> tuple:
+    """(read_upto, rows) for NotificationsPage; runs on a db_async reader thread."""
+    try:
+        # taken first, so marking read up to it cannot swallow later rows
+        read_upto = database.get_latest_seq()
+        rows = database.get_unread_notifs(username)
+    except Exception as e:
+        print(f"load_notifications(): get_unread_notifs failed: {e}")
+        read_upto, rows = None, []
+    return read_upto, rows
+
+
 # ----------------- PyQt6 Notifications Page (UI) -----------------
 
 from PyQt6.QtWidgets import (
@@ -137,6 +119,7 @@ from PyQt6.QtWidgets import (
     QFrame, QLabel, QComboBox, QSizePolicy, QCheckBox
 )
 from PyQt6.QtCore import Qt, QTimer
+import db_async
 from login import User
 
 
@@ -146,6 +129,8 @@ class NotificationsPage(QWidget):
 
         self.notifs = []  # cached notifications (only updated on refresh)
         self._raw_notifs = []  # original rows fetched from DB before view filtering
+        self._load = None  # db_async.QueryFuture of the load in flight
+        self._read_upto = None  # seq the shown rows were fetched up to; None = nothing fetched
         self.user = user if user else User("Guest")
 
         self.setMinimumSize(600, 400)
@@ -201,45 +186,24 @@ class NotificationsPage(QWidget):
         self.my_nodes_checkbox.setChecked(self.my_nodes)
 
     def load_notifications(self):
-        """Fetch unread notifications from the DB and populate the list of cards.
+        """Fetch unread notifications on a reader thread (db_async) and populate
+        the list of cards when they arrive.
         Marks all fetched notifications as read so they won't appear on next visit.
         Called on explicit Refresh and when the page is shown."""
         # ensure UI cleared immediately so message appears even on early calls
         self._clear_list()
         print("load_notifications(): called")
-        # get only unread notifications (includes is_read column now)
-        try:
-            rows = database.get_unread_notifs()
-        except Exception as e:
-            print(f"load_notifications(): get_unread_notifs failed: {e}")
-            rows = []
-
-        # normalize: some DBs may return rows with 6 columns (including is_read)
-        # while older schemas may return only 5; prefer the explicit unread query.
-        self._raw_notifs = rows if rows else []
-        print(f"load_notifications(): fetched {len(self.notifs)} unread rows")
-        if self.notifs:
-            try:
-                print(f"load_notifications(): first row sample: {self.notifs[0]}")
-            except Exception:
-                pass
-        # fallback: scan all notifications and pick those with is_read==0 when present
-        if not self._raw_notifs:
-            try:
-                alln = database.get_notifs()
-                fallback = []
-                for r in alln:
-                    if len(r) > 5:
-                        try:
-                            if int(r[5]) == 0:
-                                fallback.append(r)
-                        except Exception:
-                            continue
-                self._raw_notifs = fallback
-                if fallback:
-                    print(f"load_notifications(): fallback found {len(fallback)} unread rows")
-            except Exception as e:
-                print(f"load_notifications(): fallback get_notifs failed: {e}")
+        # a newer load replaces one still in flight
+        if self._load is not None:
+            self._load.cancel()
+        self._load = db_async.submit(_fetch_unread, self.user.username).then(self._show_notifications)
+
+    def _show_notifications(self, fetched):
+        self._load = None
+        # read state is per user; remember how far this load saw so that
+        # marking read below cannot swallow notifications that arrive meanwhile
+        self._read_upto, rows = fetched
+        self._raw_notifs = rows
         # apply view filtering to the raw rows without mutating the original list
         visible = []
         for idx, r in enumerate(self._raw_notifs):
@@ -268,6 +232,7 @@ class NotificationsPage(QWidget):
 
         # If there are no unread notifications to show, display a message
         if not rows_to_show:
+            self._clear_list()
             lbl = QLabel("No new notifications")
             lbl.setAlignment(Qt.AlignmentFlag.AlignCenter)
             lbl.setStyleSheet("font-size:14px; color: gray; padding:20px;")
@@ -282,14 +247,15 @@ class NotificationsPage(QWidget):
         try:
             QTimer.singleShot(200, self._mark_read_delayed)
         except Exception:
-            try:
-                database.mark_all_notifs_read()
-            except Exception:
-                pass
+            self._mark_read_delayed()
 
     def _mark_read_delayed(self):
+        # None (fetch failed, or none finished yet) would mark everything read,
+        # including notifications that were never shown
+        if self._read_upto is None:
+            return
         try:
-            database.mark_all_notifs_read()
+            db_async.submit(database.mark_notifs_read, self.user.username, self._read_upto, key=None)
         except Exception:
             pass
 
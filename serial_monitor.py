@@ -2,27 +2,36 @@ from PyQt6.QtCore import QThread
 
 
 class Monitor(QThread):
-    def __init__(self, connection_port:str, rmv_after_hrs:int = 48):
+    def __init__(self, connection_port:str, rmv_after_hrs:int = 48, writer=None):
         super(QThread, self).__init__()
+        # optional shared ingest.GroupCommitWriter; one is created in run() otherwise
+        self.writer = writer
         self.port = connection_port
+        # retention itself runs in maintenance.MaintenanceScheduler, not per packet
         self.hrs = rmv_after_hrs
         self.time_format = "%Y-%m-%d %H:%M:%S"
 
     def run(self):
-        import serial, database
-        from datetime import datetime, timedelta
+        import serial
+        from datetime import datetime
+        from db_connection import close_thread_connections
+        from ingest import GroupCommitWriter
+        owns_writer = self.writer is None
+        writer = GroupCommitWriter().start() if owns_writer else self.writer
         try:
             ser = serial.Serial(self.port, 9600)
             while not self.isInterruptionRequested():
                 try:
                     packets = (ser.readline().decode('utf-8').rstrip()).split(' ')
                     packet = [int(packets[0]),float(packets[2]),float(packets[1])]
-                    database.add_to_db((datetime.now().strftime(self.time_format), packet[0], packet[1], packet[2], "SOS"))
-                    database.delete_before_time((datetime.now() - timedelta(hours=self.hrs)).strftime(self.time_format))
-                    database.delete_before_time((datetime.now() - timedelta(hours=self.hrs)).strftime(self.time_format), "notifications")
-                    database.print_db()
+                    # only queued here: the serial loop never waits on a commit or a table scan
+                    writer.submit((datetime.now().strftime(self.time_format), packet[0], packet[1], packet[2], "SOS"))
                 except ValueError:
                     pass
         except serial.SerialException:
             print("***ERROR: PORT NOT FOUND***")
-            pass
\ No newline at end of file
+            pass
+        finally:
+            if owns_writer:
+                writer.stop()
+            close_thread_connections()
\ No newline at end of file
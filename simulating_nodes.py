@@ -1,15 +1,22 @@
 from PyQt6.QtCore import QThread
 
 class Simulate(QThread):
-    def __init__(self,connection_port:str,rmv_after_hrs:int = 48):
+    def __init__(self,connection_port:str,rmv_after_hrs:int = 48, writer=None):
         super(QThread, self).__init__()
+        # optional shared ingest.GroupCommitWriter; one is created in run() otherwise
+        self.writer = writer
         self.port = connection_port
+        # retention itself runs in maintenance.MaintenanceScheduler, not per packet
         self.hrs = rmv_after_hrs
         self.time_format = "%Y-%m-%d %H:%M:%S"
 
     def run(self):
-        import random, time, database
-        from datetime import datetime, timedelta
+        import random, time
+        from datetime import datetime
+        from db_connection import close_thread_connections
+        from ingest import GroupCommitWriter
+        owns_writer = self.writer is None
+        writer = GroupCommitWriter().start() if owns_writer else self.writer
         while not self.isInterruptionRequested():
             time.sleep(15)
             
@@ -22,7 +29,7 @@ class Simulate(QThread):
             packet = [int(node), float(lat), float(long)]  # [node_id, latitude, longitude]
 
             # DB expects (time, node_id, latitude, longitude, status)
-            database.add_to_db((datetime.now().strftime(self.time_format), packet[0], packet[1], packet[2], "SOS"))
-            database.delete_before_time((datetime.now() - timedelta(hours=self.hrs)).strftime(self.time_format),"notifications")
-            database.delete_before_time((datetime.now() - timedelta(hours=self.hrs)).strftime(self.time_format),)
-            
+            writer.submit((datetime.now().strftime(self.time_format), packet[0], packet[1], packet[2], "SOS"))
+        if owns_writer:
+            writer.stop()
+        close_thread_connections()
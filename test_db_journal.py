@@ -0,0 +1,60 @@
+"""
+test_db_journal.py
+──────────────────
+Reopening a PacketJournal must never hand out a seq at or below the saved
+watermark: such a record is never replayed.  `python -m unittest test_db_journal`
+"""
+
+import os
+import tempfile
+import unittest
+
+from db_journal import PacketJournal
+
+
+def _row(i: int) -> tuple:
+    return (f"2026-10-18 10:00:{i % 60:02d}", i, 1.0, 2.0, "active")
+
+
+class ReopenTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".journal")
+        os.close(fd)
+        os.remove(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _reopen_and_append(self, journal: PacketJournal, capacity: int = 8):
+        watermark = journal.watermark
+        journal.close()
+        journal = PacketJournal(self.path, capacity)
+        self.assertEqual(journal.watermark, watermark)
+        self.assertGreater(journal.next_seq, watermark)
+        row = journal.append(_row(99))
+        journal.close()
+        # the new packet is still pending after a crash
+        journal = PacketJournal(self.path, capacity)
+        self.assertEqual([r for _, r in journal.pending()], [_row(99)])
+        self.assertEqual(journal.pending()[0][0], row.jseq)
+        journal.close()
+
+    def test_reopen_after_discard(self):
+        journal = PacketJournal(self.path, 8)
+        rows = [journal.append(_row(i)) for i in range(3)]
+        journal.resolve(rows[:2])
+        journal.discard(rows[2:])
+        self.assertEqual(journal.watermark, 3)
+        self._reopen_and_append(journal)
+
+    def test_reopen_after_wrap(self):
+        journal = PacketJournal(self.path, 4)
+        for i in range(10):
+            journal.resolve([journal.append(_row(i))])
+        journal.discard([journal.append(_row(10))])
+        self.assertEqual(journal.watermark, 11)
+        self._reopen_and_append(journal, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()